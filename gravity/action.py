@@ -3,32 +3,24 @@ import logging
 import os.path
 from datetime import datetime
 from typing import Any, Dict, Sequence, Tuple, Union
-from uuid import uuid4
 
+from gravity.catalog import Catalog, get_catalog
 from gravity.config import BaseConfig
-from gravity.database import get_engine
+from gravity.database import database_backends, get_engine, next_sequence
 from gravity.model import action
 
+_action_keys = ['action_id', 'action_name']
+
 
 def insert_actions(actions: Sequence[Dict[str, str]], config: BaseConfig) -> None:
     try:
         engine = get_engine(config)
 
         with engine.begin() as connection:
-            connection.execute(action.insert(), actions)
-
-    except Exception as e:
-        logging.error(str(e))
-        raise e
+            sequence = next_sequence(connection)
+            connection.execute(action.insert(), [{**x, 'change_sequence': sequence} for x in actions])
 
-
-def add_actions(actions: Sequence[str]) -> Sequence[Dict[str, str]]:
-    try:
-        # Explicitly cast uuid4 objects to str, since sqlite doesn't take kindly to any other form
-        # NB: postgresql has a native UUID datatype, but for portability's sake, we use TEXT instead
-        _actions = [dict(action_id=str(uuid4()), action_name=action) for action in actions]
-
-        return _actions
+        get_catalog().put_actions([{k: x.get(k) for k in _action_keys} for x in actions])
 
     except Exception as e:
         logging.error(str(e))
@@ -42,7 +34,9 @@ def remove_actions(actions: Sequence[str], config: BaseConfig) -> None:
         with engine.begin() as connection:
             connection.execute(action.update()
                                .where(action.c.action_id.in_(actions))
-                               .values(deleted=datetime.now()))
+                               .values(deleted=datetime.now(), change_sequence=next_sequence(connection)))
+
+        get_catalog().remove_actions(actions)
 
     except Exception as e:
         logging.error(str(e))
@@ -53,7 +47,8 @@ def _get_actions(config: BaseConfig) -> Sequence[Union[Tuple[str, Any], None]]:
     try:
         engine = get_engine(config)
 
-        with engine.begin() as connection:
+        # Read outside of an explicit transaction, so as not to take SQLite's write lock
+        with engine.connect() as connection:
             result = connection.execute(action.select().where(action.c.deleted == None))
 
             return result.fetchall()
@@ -63,29 +58,34 @@ def _get_actions(config: BaseConfig) -> Sequence[Union[Tuple[str, Any], None]]:
         raise e
 
 
-def list_actions(actions: Sequence[Dict[str, str]]) -> None:
-    for _action in actions:
-        print(f'{_action["action_id"]}\t{_action["action_name"]}')
+def load_actions(config: BaseConfig) -> Sequence[Dict[str, Any]]:
+    """Read all active actions from the storage backend, bypassing the catalog cache"""
+    if config.backend.driver in database_backends:
+        actions = _get_actions(config)
+        actions = [{k: v for k, v in x.items() if k in _action_keys} for x in actions]
+    else:
+        assert os.path.isfile(config.main.actions), f'Actions file "{config.main.actions}" does not exist'
+
+        with open(config.main.actions, mode='r', encoding='utf-8') as infile:
+            actions = json.load(infile)
 
+    return actions
 
-def export_actions(actions: Sequence[Dict[str, str]]) -> None:
-    keys = ['action_id', 'action_name']
 
-    _actions = [{k: v for k, v in p.items() if k in keys} for p in actions]
+def _get_catalog(config: BaseConfig) -> Catalog:
+    _catalog = get_catalog()
 
-    print(json.dumps(_actions, indent=4))
+    # Rows loaded while a write was committed may miss it, so load them again should the catalog change meanwhile
+    while not _catalog.has_actions():
+        version = _catalog.version
+        _catalog.set_actions(load_actions(config), version)
+
+    return _catalog
 
 
 def get_actions(config: BaseConfig) -> Sequence[Dict[str, Any]]:
     try:
-        if config.backend.driver in ['sqlite', 'postgresql']:
-            actions = _get_actions(config)
-            actions = [{k: v for k, v in x.items() if k in ['action_id', 'action_name']} for x in actions]
-        else:
-            assert os.path.isfile(config.gravity.actions), f'Actions file "{config.gravity.actions}" does not exist'
-
-            with open(config.main.actions, mode='r', encoding='utf-8') as infile:
-                actions = json.load(infile)
+        actions = _get_catalog(config).get_actions()
 
         assert len(actions) > 0, 'No actions could be found'
         return actions
@@ -93,17 +93,3 @@ def get_actions(config: BaseConfig) -> Sequence[Dict[str, Any]]:
     except Exception as e:
         logging.error(str(e))
         raise e
-
-
-def import_actions(filename: str) -> Sequence[Dict[str, str]]:
-    try:
-        assert os.path.isfile(filename), f'Actions file "{filename}" does not exist'
-
-        with open(filename, mode='r', encoding='utf-8') as infile:
-            _actions = json.load(infile)
-
-        return _actions
-
-    except Exception as e:
-        logging.error(str(e))
-        raise e
@@ -1,14 +1,15 @@
 from os.path import dirname, join
+from typing import TYPE_CHECKING, Union
 
-import gravity.action
-import gravity.database
-import gravity.project
-import gravity.worklog
-from gravity.backend.client import send_message
 from gravity.config import BaseConfig
-from gravity.frontend.curses import run_curses
 from gravity.logger import initialise_logging
-from gravity.backend.server import start_server
+
+# Subcommands import their dependencies on demand: client commands only need the socket client and gravity.cli, so
+# that they start without loading SQLAlchemy, websockets, python-daemon or curses
+if TYPE_CHECKING:
+    from gravity.backend.client import Session
+
+_client_commands = ['project', 'action', 'worklog', 'annotate', 'report']
 
 
 def main():
@@ -19,60 +20,100 @@ def main():
 
     argument = config.argument.name
 
+    # Client-side commands share a single server connection
+    if argument in _client_commands:
+        from gravity.backend.client import Session
+
+        session = Session(config)
+    else:
+        session = None
+
+    try:
+        _run_command(argument, config, session)
+    finally:
+        session.close() if session is not None else None
+
+
+def _run_command(argument: str, config: BaseConfig, session: Union['Session', None]) -> None:
+    if argument in _client_commands:
+        import gravity.cli
+        from gravity.backend.cache import ClientCatalog
+        from gravity.backend.client import send_message
+
     if argument == 'server':
-        start_server(config)
+        from gravity.backend.server import start_server
+
+        start_server(config, config.argument.workers)
 
     elif argument == 'client':
         if config.frontend.interface == 'curses':
+            from gravity.frontend.curses import run_curses
+
             run_curses(config)
 
     elif argument == 'project':
         if config.argument.add:
-            _projects = gravity.project.add_projects(config.argument.add)
-            send_message({'request': 'insert_projects', 'payload': {'projects': _projects}}, config)
+            _projects = gravity.cli.add_projects(config.argument.add)
+            send_message({'request': 'insert_projects', 'payload': {'projects': _projects}}, config, session)
 
         elif config.argument.export:
-            _projects = send_message({'request': 'get_projects'}, config).get('response', {}).get('projects', [])
-            gravity.project.export_projects(_projects)
+            _projects = ClientCatalog(config).sync(session).get_projects()
+            gravity.cli.export_projects(_projects)
 
         elif config.argument.ingest:
-            _projects = gravity.project.import_projects(config.argument.ingest)
-            send_message({'request': 'insert_projects', 'payload': {'projects': _projects}}, config)
+            _projects = gravity.cli.import_projects(config.argument.ingest)
+            send_message({'request': 'insert_projects', 'payload': {'projects': _projects}}, config, session)
 
         elif config.argument.list:
-            _projects = send_message({'request': 'get_projects'}, config).get('response', {}).get('projects', [])
-            gravity.project.list_projects(_projects)
+            _projects = ClientCatalog(config).sync(session).get_projects()
+            gravity.cli.list_projects(_projects)
 
         elif config.argument.remove:
-            send_message({'request': 'remove_projects', 'payload': {'projects': config.argument.remove}}, config)
+            _payload = {'projects': config.argument.remove}
+            send_message({'request': 'remove_projects', 'payload': _payload}, config, session)
 
     elif argument == 'action':
         if config.argument.add:
-            _actions = gravity.action.add_actions(config.argument.add)
-            send_message({'request': 'insert_actions', 'payload': {'actions': _actions}}, config)
+            _actions = gravity.cli.add_actions(config.argument.add)
+            send_message({'request': 'insert_actions', 'payload': {'actions': _actions}}, config, session)
 
         elif config.argument.export:
-            _actions = send_message({'request': 'get_actions'}, config).get('response', {}).get('actions', [])
-            gravity.action.export_actions(_actions)
+            _actions = ClientCatalog(config).sync(session).get_actions()
+            gravity.cli.export_actions(_actions)
 
         elif config.argument.ingest:
-            _actions = gravity.action.import_actions(config.argument.ingest)
-            send_message({'request': 'insert_actions', 'payload': {'actions': _actions}}, config)
+            _actions = gravity.cli.import_actions(config.argument.ingest)
+            send_message({'request': 'insert_actions', 'payload': {'actions': _actions}}, config, session)
 
         elif config.argument.list:
-            _actions = send_message({'request': 'get_actions'}, config).get('response', {}).get('actions', [])
-            gravity.action.list_actions(_actions)
+            _actions = ClientCatalog(config).sync(session).get_actions()
+            gravity.cli.list_actions(_actions)
 
         elif config.argument.remove:
-            send_message({'request': 'remove_actions', 'payload': {'actions': config.argument.remove}}, config)
+            _payload = {'actions': config.argument.remove}
+            send_message({'request': 'remove_actions', 'payload': _payload}, config, session)
 
     elif argument == 'database':
-        if config.argument.drop:
+        import gravity.database
+
+        if config.argument.analyze:
+            gravity.database.analyze(config)
+
+        elif config.argument.drop:
             gravity.database.drop(config)
 
         elif config.argument.initialise:
             gravity.database.initialise(config)
 
+        elif config.argument.migrate:
+            import gravity.migrate
+
+            _arguments = config.argument
+            assert _arguments.source and _arguments.target, 'Migrations require both --from and --to'
+
+            result = gravity.migrate.migrate(config, _arguments.source, _arguments.target, _arguments.batch_size)
+            gravity.migrate.print_migration(result)
+
         elif config.argument.prune:
             gravity.database.prune(config)
 
@@ -82,13 +123,42 @@ def main():
     elif argument == 'worklog':
         if config.argument.amend:
             message = send_message({'request': 'modify_worklog', 'payload': {'modifier': config.argument.amend[0]}},
-                                   config)
+                                   config, session)
             print(message.get('response'))
 
+        elif config.argument.export:
+            import gravity.export
+
+            _arguments = config.argument
+            _payload = {'start': _arguments.start, 'end': _arguments.end, 'projects': _arguments.project,
+                        'chunk_size': _arguments.chunk_size}
+            _responses = session.stream({'request': 'export_worklogs', 'payload': _payload})
+            gravity.export.export_worklogs(_responses, _arguments.format, _arguments.output)
+
+        elif config.argument.ingest:
+            import gravity.worklog
+
+            result = gravity.worklog.ingest_worklogs(config.argument.ingest, config, config.argument.chunk_size)
+            gravity.worklog.print_ingest(result)
+
         elif config.argument.remove:
-            message = send_message({'request': 'remove_worklog'}, config)
+            message = send_message({'request': 'remove_worklog'}, config, session)
             print(message.get('response'))
 
+    elif argument == 'report':
+        _payload = {'group_by': config.argument.group_by, 'start': config.argument.start, 'end': config.argument.end}
+        message = send_message({'request': 'get_report', 'payload': _payload}, config, session)
+        gravity.cli.print_report(message.get('response', {}).get('report', []))
+
+    elif argument == 'bench':
+        import gravity.bench
+
+        _arguments = config.argument
+        results = gravity.bench.run_benchmark(config, _arguments.transports, _arguments.backends,
+                                              _arguments.clients, _arguments.requests, _arguments.writes,
+                                              _arguments.database)
+        gravity.bench.print_benchmark(results)
+
     elif argument == 'annotate':
         if config.argument.project and (config.argument.description or config.argument.key):
             _project = config.argument.project
@@ -96,7 +166,8 @@ def main():
             _key = config.argument.key
 
             _annotation = {'project': _project, 'description': _description, 'key': _key}
-            message = send_message({'request': 'annotate_project', 'payload': {'annotation': _annotation}}, config)
+            message = send_message({'request': 'annotate_project', 'payload': {'annotation': _annotation}}, config,
+                                   session)
             print(message.get('response')) if message.get('response') is not None else None
 
         else:
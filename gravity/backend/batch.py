@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple, Union
+
+from gravity.backend.executor import RequestExecutor
+from gravity.config import BaseConfig
+from gravity.worklog import add_worklogs, prepare_worklogs
+
+
+class WorklogBatcher(object):
+    """Collect worklogs from concurrent requests and write them to the storage backend in group commits"""
+
+    def __init__(self, config: BaseConfig, executor: RequestExecutor,
+                 writer: Union[Callable[[List[Dict[str, Any]]], Awaitable[None]], None] = None) -> None:
+        self.config = config
+        self.executor = executor
+        self.writer = writer
+        self.batch_size = config.server.batch_size
+        self.linger = config.server.batch_linger / 1000
+
+        self._queue = None
+        self._task = None
+        self._stopping = False
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._flush_forever())
+        self._stopping = False
+
+    async def stop(self) -> None:
+        """Write all worklogs submitted so far, then stop"""
+        if self._task is None:
+            return
+
+        # Wake up the flushing task, which returns once it has written every submission queued ahead of this marker
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+        # Submissions which arrived too late for the last batch must not leave their requests waiting forever
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+
+            if item is not None:
+                self._resolve(item[1], RuntimeError('Worklog batcher has been stopped'))
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Queue worklogs for the next batch, returning once the batch containing them has been committed"""
+        assert self._task is not None, 'Worklog batcher has not been started'
+
+        # Timestamp worklogs upon receipt, rather than when their batch gets written
+        _rows = prepare_worklogs(rows)
+        future = asyncio.get_running_loop().create_future()
+
+        await self._queue.put((_rows, future))
+        await future
+
+    async def _collect(self) -> List[Tuple[List[Dict[str, Any]], asyncio.Future]]:
+        """Wait for the first submission, then gather more until the batch is full or the linger time has passed"""
+        loop = asyncio.get_running_loop()
+
+        first = await self._queue.get()
+
+        if first is None:
+            self._stopping = True
+            return []
+
+        batch = [first]
+        size = len(first[0])
+        deadline = loop.time() + self.linger
+
+        while size < self.batch_size:
+            try:
+                if self._queue.empty():
+                    item = await asyncio.wait_for(self._queue.get(), timeout=max(deadline - loop.time(), 0))
+                else:
+                    item = self._queue.get_nowait()
+
+            except asyncio.TimeoutError:
+                break
+
+            if item is None:
+                self._stopping = True
+                break
+
+            batch.append(item)
+            size += len(item[0])
+
+        return batch
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        # Asynchronous backends write from the event loop, all others from the request executor's writer thread
+        if self.writer is not None:
+            await self.writer(rows)
+        else:
+            await self.executor.run(partial(add_worklogs, rows, self.config), write=True)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, exception: Exception = None) -> None:
+        # Submitting clients may have gone away in the meantime, which cancels their futures
+        if future.done():
+            return
+
+        future.set_exception(exception) if exception is not None else future.set_result(None)
+
+    async def _flush(self, batch: List[Tuple[List[Dict[str, Any]], asyncio.Future]]) -> None:
+        try:
+            await self._write([row for rows, _ in batch for row in rows])
+
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], e)
+                return
+
+            # Make sure that a single invalid submission does not fail every other request in its batch
+            logging.warning('Failed to write batch of %d submissions, retrying individually: %s', len(batch), e)
+
+            for rows, future in batch:
+                try:
+                    await self._write(rows)
+                except Exception as _e:
+                    self._resolve(future, _e)
+                else:
+                    self._resolve(future)
+
+        else:
+            for _, future in batch:
+                self._resolve(future)
+
+    async def _flush_forever(self) -> None:
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._collect()
+
+            if batch:
+                await self._flush(batch)
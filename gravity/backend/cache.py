@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import os.path
+from typing import Any, Dict, List, Union
+
+from gravity.backend.client import Session, send_message
+from gravity.config import BaseConfig
+
+_catalog_ids = {'projects': 'project_id', 'actions': 'action_id'}
+
+
+def cache_directory(config: BaseConfig) -> str:
+    """Return the configured cache directory, defaulting to the user's cache directory as per the XDG spec"""
+    if config.frontend.cache_dir:
+        return os.path.expanduser(config.frontend.cache_dir)
+
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'gravity')
+
+
+class ClientCatalog(object):
+    """Client-side copy of the server's projects and actions, stored on disk and kept up to date via deltas
+
+    Every sync sends the change sequence number of the last sync, and only receives projects and actions which have
+    been changed since. Catalogs of different servers are cached in separate files.
+    """
+
+    def __init__(self, config: BaseConfig) -> None:
+        self.config = config
+        self.sequence: Union[int, None] = None
+        self.catalogs: Dict[str, Dict[str, Dict[str, Any]]] = {x: {} for x in _catalog_ids}
+        self.modified = False
+
+        address = config.unix.socket if config.socket.type == 'unix' else f'{config.tcp.host}:{config.tcp.port}'
+        key = hashlib.sha1(f'{config.socket.type}:{address}'.encode(encoding='utf-8')).hexdigest()[:16]
+
+        self.path = os.path.join(cache_directory(config), f'catalog-{key}.json') if config.frontend.cache else None
+
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as infile:
+                cache = json.load(infile)
+
+            self.sequence = cache['sequence']
+            self.catalogs = {x: {y[_catalog_ids[x]]: y for y in cache[x]} for x in _catalog_ids}
+
+        except Exception as e:
+            logging.warning('Ignoring unreadable catalog cache %s: %s', self.path, e)
+            self._reset()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            # Replace the cache atomically, so that concurrent clients never read a partially written file
+            with open(f'{self.path}.{os.getpid()}', mode='w', encoding='utf-8') as outfile:
+                json.dump({'sequence': self.sequence, **{x: list(y.values()) for x, y in self.catalogs.items()}},
+                          outfile)
+
+            os.replace(f'{self.path}.{os.getpid()}', self.path)
+
+        except OSError as e:
+            logging.warning('Could not write catalog cache %s: %s', self.path, e)
+
+    def _reset(self) -> None:
+        self.sequence = None
+        self.catalogs = {x: {} for x in _catalog_ids}
+
+    def _apply(self, changes: Dict[str, Any]) -> None:
+        if changes.get('full'):
+            self.catalogs = {x: {} for x in _catalog_ids}
+
+        for name, key in _catalog_ids.items():
+            for row in changes.get(name, []):
+                if row.get('deleted'):
+                    self.catalogs[name].pop(row[key], None)
+                else:
+                    self.catalogs[name][row[key]] = {k: v for k, v in row.items() if k != 'deleted'}
+
+        self.sequence = changes.get('sequence')
+
+    def _request(self, session: Union[Session, None]) -> Dict[str, Any]:
+        message = {'request': 'get_changes_since', 'payload': {'sequence': self.sequence}}
+
+        return send_message(message, self.config, session).get('response', {})
+
+    def sync(self, session: Union[Session, None] = None) -> 'ClientCatalog':
+        """Fetch changes since the last sync, falling back to a full fetch if the cache has drifted from the server"""
+        previous = self.sequence
+        changes = self._request(session)
+        self._apply(changes)
+
+        # Rows pruned from the server leave no trace in the deltas, so make sure that nothing is left over
+        count = changes.get('count')
+        drifted = count is not None and any(len(self.catalogs[x]) != count.get(x) for x in _catalog_ids)
+
+        if drifted:
+            logging.info('Catalog cache is out of sync with the server, fetching all projects and actions')
+
+            self._reset()
+            self._apply(self._request(session))
+
+        # Whether the last sync has changed anything, e.g. so that frontends only rebuild their views if needed
+        self.modified = drifted or self.sequence != previous or any(changes.get(x) for x in _catalog_ids)
+
+        if self.modified:
+            self._save()
+
+        return self
+
+    def get_projects(self) -> List[Dict[str, Any]]:
+        return list(self.catalogs['projects'].values())
+
+    def get_actions(self) -> List[Dict[str, Any]]:
+        return list(self.catalogs['actions'].values())
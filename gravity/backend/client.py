@@ -1,20 +1,30 @@
 import asyncio
+import itertools
 import json
 import sys
-from typing import Any, Dict, Union
+from typing import Any, AsyncIterator, Dict, Iterator, List, Sequence, Tuple, Union
 
+from gravity.backend.protocol import StreamProtocol
 from gravity.config import BaseConfig
 
+# Number of streamed responses to buffer per stream, before the session stops reading from the server
+_stream_buffer = 2
 
-async def message_writer(message: Dict[str, Any], config: BaseConfig) -> Union[Dict[str, Any], None]:
-    """Pass a byte-encoded JSON message to a server via TCP or UNIX socket"""
+
+async def open_connection(config: BaseConfig) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
     if config.socket.type == 'tcp':
-        reader, writer = await asyncio.open_connection(host=config.tcp.host, port=config.tcp.port)
+        return await asyncio.open_connection(host=config.tcp.host, port=config.tcp.port,
+                                             limit=config.socket.max_frame_size)
     elif config.socket.type == 'unix':
-        reader, writer = await asyncio.open_unix_connection(path=config.unix.socket)
+        return await asyncio.open_unix_connection(path=config.unix.socket, limit=config.socket.max_frame_size)
     else:
         raise AssertionError(f"Requested socket type is not one of: 'tcp', 'unix'")
 
+
+async def message_writer(message: Dict[str, Any], config: BaseConfig) -> Union[Dict[str, Any], None]:
+    """Pass a byte-encoded JSON message to a server via TCP or UNIX socket, using a one-shot connection"""
+    reader, writer = await open_connection(config)
+
     writer.write(json.dumps(message).encode(encoding='utf-8'))
     writer.write_eof()
     await writer.drain()
@@ -28,9 +38,180 @@ async def message_writer(message: Dict[str, Any], config: BaseConfig) -> Union[D
     return response
 
 
-def send_message(message: Dict[str, Any], config: BaseConfig) -> Union[Dict[str, Any], None]:
+class ClientSession(object):
+    """Long-lived connection to a server, pipelining requests and matching responses to them by request id"""
+
+    def __init__(self, config: BaseConfig) -> None:
+        self.config = config
+
+        self._writer = None
+        self._protocol = None
+        self._receiver = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._streams: Dict[int, asyncio.Queue] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self._receiver is not None and not self._receiver.done()
+
+    async def connect(self) -> None:
+        reader, self._writer = await open_connection(self.config)
+
+        self._protocol = await StreamProtocol.connect(
+            reader, self._writer, self.config.socket.framing, self.config.socket.encoding,
+            self.config.socket.max_frame_size)
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def _receive(self) -> None:
+        error = ConnectionError('Connection has been closed by the server')
+
+        try:
+            while True:
+                response = await self._protocol.read()
+
+                if response is None:
+                    break
+
+                # Errors which are not tied to a single request, e.g. invalid frames, cause the server to hang up
+                if 'id' not in response:
+                    error = ConnectionError(response.get('response', {}).get('error'))
+                    break
+
+                request_id = response.pop('id')
+                queue = self._streams.get(request_id)
+
+                # Streams are bounded: once a stream's consumer falls behind, stop reading until it catches up, so
+                # that the server's writes block, rather than responses piling up in memory
+                if queue is not None:
+                    if queue.qsize() >= _stream_buffer:
+                        await queue.join()
+
+                    queue.put_nowait(response)
+                    self._streams.pop(request_id) if not response.get('more') else None
+                    continue
+
+                future = self._pending.pop(request_id, None)
+
+                if future is not None and not future.done():
+                    future.set_result(response)
+
+        except Exception as e:
+            error = e
+
+        finally:
+            for future in self._pending.values():
+                future.set_exception(error) if not future.done() else None
+
+            self._pending.clear()
+
+            for queue in self._streams.values():
+                queue.put_nowait(error)
+
+            self._streams.clear()
+
+    async def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a request, and wait for the server's response to it"""
+        if not self.connected:
+            await self.connect()
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        await self._protocol.write({**message, 'id': request_id})
+
+        return await future
+
+    async def stream(self, message: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Send a streaming request, yielding the server's responses to it until one is no longer flagged `more`"""
+        if not self.connected:
+            await self.connect()
+
+        request_id = next(self._ids)
+        queue = asyncio.Queue()
+        self._streams[request_id] = queue
+
+        try:
+            await self._protocol.write({**message, 'id': request_id})
+
+            while True:
+                response = await queue.get()
+                queue.task_done()
+
+                if isinstance(response, Exception):
+                    raise response
+
+                yield response
+
+                if not response.get('more'):
+                    break
+
+        finally:
+            # Drop responses to streams abandoned by their consumer, without holding up the connection
+            self._streams.pop(request_id, None)
+
+            while not queue.empty():
+                queue.get_nowait()
+                queue.task_done()
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+        if self._receiver is not None:
+            await asyncio.gather(self._receiver, return_exceptions=True)
+
+        self._writer, self._protocol, self._receiver = None, None, None
+
+
+class Session(object):
+    """Blocking wrapper around a ClientSession, for frontends and command-line tools without an event loop"""
+
+    def __init__(self, config: BaseConfig) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._session = ClientSession(config)
+
+    def __enter__(self) -> 'Session':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        return self._loop.run_until_complete(self._session.request(message))
+
+    def request_many(self, messages: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Pipeline several requests on the session's connection, returning responses in order of the requests"""
+        return self._loop.run_until_complete(asyncio.gather(*[self._session.request(x) for x in messages]))
+
+    def stream(self, message: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Send a streaming request, yielding the server's responses to it as they are consumed"""
+        responses = self._session.stream(message)
+
+        try:
+            while True:
+                try:
+                    yield self._loop.run_until_complete(responses.__anext__())
+                except StopAsyncIteration:
+                    break
+
+        finally:
+            self._loop.run_until_complete(responses.aclose())
+
+    def close(self) -> None:
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self._session.close())
+            self._loop.close()
+
+
+def send_message(message: Dict[str, Any], config: BaseConfig,
+                 session: Union[Session, None] = None) -> Union[Dict[str, Any], None]:
     try:
-        message = asyncio.run(message_writer(message, config))
+        if session is not None:
+            message = session.request(message)
+        else:
+            message = asyncio.run(message_writer(message, config))
 
         if isinstance(message.get('response'), dict):
             error = message.get('response', {}).get('error')
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from gravity.config import BaseConfig
+
+# Requests which modify the storage backend
+write_requests = {
+    'insert_actions',
+    'remove_actions',
+    'insert_projects',
+    'remove_projects',
+    'add_worklog',
+    'modify_worklog',
+    'remove_worklog',
+    'annotate_project'
+}
+
+
+class RequestExecutor(object):
+    """Run blocking request handlers outside of the server's event loop"""
+
+    def __init__(self, config: BaseConfig) -> None:
+        self.mode = config.server.executor
+        self.timeout = config.server.request_timeout or None
+        self.capacity = config.server.threads + config.server.queue_size
+        self.pending = 0
+
+        self._readers = None
+        self._writers = None
+
+        if self.mode == 'thread':
+            self._readers = ThreadPoolExecutor(max_workers=config.server.threads, thread_name_prefix='gravity')
+
+            # File-based backends only support a single writer at a time, so serialise writes in a dedicated thread
+            if config.backend.driver in ['postgresql', 'postgresql-async']:
+                self._writers = self._readers
+            else:
+                self._writers = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gravity-writer')
+
+    async def run(self, handler: Callable[[], Any], write: bool = False) -> Any:
+        """Run a request handler, rejecting it if too many requests are already pending
+
+        Only reads time out: a write which timed out would still be applied, and a client retrying it would apply it
+        twice.
+        """
+        if self.mode == 'inline':
+            return handler()
+
+        assert self.pending < self.capacity, 'Request queue is full, try again later'
+
+        self.pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._writers if write else self._readers, handler)
+
+            return await asyncio.wait_for(future, timeout=self.timeout if not write else None)
+
+        except asyncio.TimeoutError:
+            # NB: the handler's thread cannot be interrupted, only the client stops waiting for its result
+            raise TimeoutError(f'Request did not complete within {self.timeout} seconds') from None
+
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        logging.debug('Shutting down request executor (%d pending request(s))', self.pending)
+
+        for executor in {self._readers, self._writers} - {None}:
+            executor.shutdown(wait=True)
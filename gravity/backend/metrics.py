@@ -0,0 +1,223 @@
+import asyncio
+import logging
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from gravity.config import BaseConfig
+
+# Upper bounds of latency histogram buckets, in seconds
+_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_descriptions = {
+    'gravity_requests_total': ('counter', 'Requests handled, by request type'),
+    'gravity_request_errors_total': ('counter', 'Requests which returned an error, by request type'),
+    'gravity_request_phase_seconds': ('histogram', 'Time spent per request phase, by request type'),
+    'gravity_db_statement_seconds': ('histogram', 'Time spent executing database statements, by statement type'),
+    'gravity_connections_in_flight': ('gauge', 'Currently open client connections'),
+    'gravity_write_queue_depth': ('gauge', 'Worklog submissions waiting to be written'),
+    'gravity_requests_pending': ('gauge', 'Requests waiting for or running in the request executor'),
+    'gravity_spool_depth': ('gauge', 'Worklog submissions spooled, but not yet written to the storage backend'),
+    'gravity_spool_lag_seconds': ('gauge', 'Age of the oldest spooled worklog submission'),
+    'gravity_subscribers': ('gauge', 'Currently subscribed WebSocket clients'),
+    'gravity_subscribers_dropped_total': ('counter', 'Subscribers disconnected for falling behind'),
+}
+
+# Request types are chosen by clients, so cap the number of distinct label values to bound memory use
+_max_label_values = 64
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed bucket bounds, in the style of Prometheus"""
+
+    def __init__(self, buckets: Sequence[float] = _buckets) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, result = 0, []
+
+        for bound, count in zip([*[repr(x) for x in self.buckets], '+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class Metrics(object):
+    """Request counters, latency histograms and gauges of a server, rendered in the Prometheus text format
+
+    Recording is skipped entirely while metrics are disabled, so callers only pay for checking the enabled flag.
+    Gauges are callbacks, which are only evaluated when metrics are rendered.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+
+        self._lock = Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._label_values = set()
+
+    def _label(self, value: Union[str, None]) -> str:
+        if not isinstance(value, str):
+            return 'invalid'
+
+        if value not in self._label_values and len(self._label_values) >= _max_label_values:
+            return 'other'
+
+        self._label_values.add(value)
+
+        return value
+
+    def increment(self, name: str, request: Union[str, None]) -> None:
+        with self._lock:
+            key = (name, (('request', self._label(request)),))
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def observe(self, name: str, seconds: float, **labels: Union[str, None]) -> None:
+        with self._lock:
+            key = (name, tuple((k, self._label(v)) for k, v in labels.items()))
+            self._histograms.setdefault(key, Histogram()).observe(seconds)
+
+    def request(self, request: Union[str, None], error: bool = False) -> None:
+        self.increment('gravity_requests_total', request)
+        self.increment('gravity_request_errors_total', request) if error else None
+
+    def phase(self, phase: str, seconds: float, request: Union[str, None]) -> None:
+        self.observe('gravity_request_phase_seconds', seconds, phase=phase, request=request)
+
+    def register_gauge(self, name: str, callback: Callable[[], float]) -> None:
+        self._gauges[name] = callback
+
+    def unregister_gauges(self) -> None:
+        self._gauges.clear()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._label_values.clear()
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        samples: Dict[str, List[str]] = {name: [] for name in _descriptions}
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                samples[name].append(f'{name}{_format_labels(labels)} {value}')
+
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                for bound, count in histogram.cumulative():
+                    samples[name].append(f'{name}_bucket{_format_labels((*labels, ("le", bound)))} {count}')
+
+                samples[name].append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+                samples[name].append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+        for name, callback in sorted(self._gauges.items()):
+            samples[name].append(f'{name} {callback()}')
+
+        lines = []
+
+        for name, (metric_type, description) in _descriptions.items():
+            if samples[name]:
+                lines.extend([f'# HELP {name} {description}', f'# TYPE {name} {metric_type}', *samples[name]])
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+
+    escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide server metrics"""
+    return _metrics
+
+
+def configure_metrics(config: BaseConfig) -> Metrics:
+    _metrics.enabled = config.metrics.enabled
+
+    return _metrics
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time statements executed by an engine, labelled by statement type, while metrics are enabled"""
+    if event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    if _metrics.enabled:
+        connection.info.setdefault('gravity_statement_start', []).append(perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    if _metrics.enabled and connection.info.get('gravity_statement_start'):
+        start = connection.info['gravity_statement_start'].pop()
+        _metrics.observe('gravity_db_statement_seconds', perf_counter() - start,
+                         statement=statement.lstrip().split(None, 1)[0].lower() if statement.strip() else 'other')
+
+
+async def _http_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer a single HTTP request, serving metrics on /metrics"""
+    try:
+        request_line = await reader.readline()
+
+        # Skip request headers, metrics requests carry no body
+        while (await reader.readline()).strip():
+            pass
+
+        method, path, *_ = request_line.decode(encoding='latin-1').split() + ['', '']
+
+        if method == 'GET' and path.split('?', 1)[0] == '/metrics':
+            status, body = '200 OK', _metrics.render().encode(encoding='utf-8')
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+
+        writer.write(f'HTTP/1.0 {status}\r\n'
+                     f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode(encoding='latin-1') + body)
+        await writer.drain()
+
+    except Exception as e:
+        logging.error(repr(e))
+
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(config: BaseConfig) -> Union[asyncio.AbstractServer, None]:
+    """Serve metrics over HTTP, if metrics and their HTTP endpoint are enabled"""
+    if not config.metrics.enabled or config.metrics.port is None:
+        return None
+
+    server = await asyncio.start_server(_http_handler, host=config.metrics.host, port=config.metrics.port)
+
+    logging.info('Metrics endpoint started. Listening on %s', server.sockets[0].getsockname())
+
+    return server
@@ -0,0 +1,246 @@
+import logging
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Union
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    # Python < 3.9
+    ZoneInfo = None
+
+from gravity.action import _action_keys
+from gravity.catalog import get_catalog
+from gravity.config import BaseConfig
+from gravity.project import _project_keys
+from gravity.worklog import _parse_modifier, prepare_worklogs
+
+# The fixed set of queries issued by the server. asyncpg prepares every statement upon its first use on a connection,
+# and keeps it in the connection's statement cache, so each of them is only parsed and planned once per connection.
+_queries = {
+    'next_sequence': 'UPDATE catalog_sequence SET sequence = sequence + 1 RETURNING sequence',
+    'insert_sequence': 'INSERT INTO catalog_sequence (sequence_id, sequence) VALUES (1, 1) RETURNING sequence',
+    'insert_project': 'INSERT INTO project (project_id, project_name, description, project_key, created, updated, '
+                      'change_sequence) VALUES ($1, $2, $3, $4, $5, $5, $6)',
+    'remove_projects': 'UPDATE project SET deleted = $2, updated = $2, change_sequence = $3 '
+                       'WHERE project_id = ANY($1::varchar[])',
+    'select_projects': 'SELECT project_id, project_name, project_key FROM project WHERE deleted IS NULL',
+    'annotate_project': 'UPDATE project SET description = $2, project_key = $3, updated = $4, change_sequence = $5 '
+                        'WHERE project_id = $1',
+    'insert_action': 'INSERT INTO action (action_id, action_name, description, created, updated, change_sequence) '
+                     'VALUES ($1, $2, $3, $4, $4, $5)',
+    'remove_actions': 'UPDATE action SET deleted = $2, updated = $2, change_sequence = $3 '
+                      'WHERE action_id = ANY($1::varchar[])',
+    'select_actions': 'SELECT action_id, action_name FROM action WHERE deleted IS NULL',
+    'insert_worklog': 'INSERT INTO worklog (project_id, action_id, ticket_key, timestamp) VALUES ($1, $2, $3, $4)',
+    'select_last_worklog': 'SELECT worklog_id, timestamp FROM worklog ORDER BY worklog_id DESC LIMIT 1 FOR UPDATE',
+    'update_worklog': 'UPDATE worklog SET timestamp = $2 WHERE worklog_id = $1',
+    'delete_worklog': 'DELETE FROM worklog WHERE worklog_id = $1'
+}
+
+_worklog_columns = ['project_id', 'action_id', 'ticket_key', 'timestamp']
+
+
+class AsyncPostgresqlBackend(object):
+    """Serve requests against PostgreSQL from the event loop, using an asyncpg connection pool
+
+    Requests without a native implementation here fall back to the synchronous handlers, which run in the request
+    executor using psycopg2. Administrative commands, e.g. `gravity database`, always use psycopg2.
+    """
+
+    def __init__(self, config: BaseConfig) -> None:
+        assert asyncpg is not None, 'The postgresql-async backend requires asyncpg to be installed'
+
+        self.config = config
+        self.pool = None
+        self.timezone: tzinfo = timezone.utc
+
+        self.requests: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+            'insert_actions': lambda payload: self.insert_actions(payload.get('actions')),
+            'remove_actions': lambda payload: self.remove_actions(payload.get('actions')),
+            'insert_projects': lambda payload: self.insert_projects(payload.get('projects', [])),
+            'remove_projects': lambda payload: self.remove_projects(payload.get('projects')),
+            'modify_worklog': lambda payload: self.modify_worklog(payload.get('modifier')),
+            'remove_worklog': lambda payload: self.remove_worklog(),
+            'annotate_project': lambda payload: self.annotate_project(payload.get('annotation'))
+        }
+
+    async def start(self) -> None:
+        options = self.config.postgresql
+
+        self.pool = await asyncpg.create_pool(
+            host=options.hostname,
+            port=options.port,
+            user=options.username,
+            password=options.password or None,
+            database=options.database,
+            min_size=options.pool_size,
+            max_size=options.pool_size + max(options.max_overflow, 0),
+            max_inactive_connection_lifetime=options.pool_recycle if options.pool_recycle > 0 else 0,
+            command_timeout=self.config.server.request_timeout or None)
+
+        # psycopg2 sends naive timestamps as text, which the server interprets in its session timezone
+        async with self._acquire() as connection:
+            _timezone = await connection.fetchval('SHOW timezone')
+            _offset = await connection.fetchval('SELECT EXTRACT(timezone FROM now())')
+
+        # Without zoneinfo, or for zones unknown to it, fall back to the session's current UTC offset
+        self.timezone = timezone(timedelta(seconds=int(_offset)))
+
+        if ZoneInfo is not None:
+            try:
+                self.timezone = ZoneInfo(_timezone)
+            except Exception:
+                logging.warning('Unknown session timezone %s, using its current UTC offset', _timezone)
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def _acquire(self):
+        return self.pool.acquire(timeout=self.config.postgresql.pool_timeout or None)
+
+    def _aware(self, timestamp: datetime) -> datetime:
+        return timestamp.replace(tzinfo=self.timezone) if timestamp.tzinfo is None else timestamp
+
+    @staticmethod
+    async def _next_sequence(connection) -> int:
+        """Take the next change sequence number within a transaction, cf. gravity.database.next_sequence()"""
+        return await connection.fetchval(_queries['next_sequence']) or \
+            await connection.fetchval(_queries['insert_sequence'])
+
+    async def handle(self, request: str, payload: Dict[str, Any]) -> Any:
+        try:
+            return await self.requests[request](payload)
+
+        except Exception as e:
+            logging.error(str(e))
+            raise e
+
+    # projects
+    async def insert_projects(self, projects: Sequence[Dict[str, str]]) -> None:
+        now = self._aware(datetime.now())
+
+        async with self._acquire() as connection, connection.transaction():
+            sequence = await self._next_sequence(connection)
+            await connection.executemany(_queries['insert_project'], [
+                (x['project_id'], x['project_name'], x.get('description'), x.get('project_key'), now, sequence)
+                for x in projects])
+
+        get_catalog().put_projects([{k: x.get(k) for k in _project_keys} for x in projects])
+
+    async def remove_projects(self, projects: Sequence[str]) -> None:
+        async with self._acquire() as connection, connection.transaction():
+            await connection.execute(_queries['remove_projects'], list(projects), self._aware(datetime.now()),
+                                     await self._next_sequence(connection))
+
+        get_catalog().remove_projects(projects)
+
+    async def load_projects(self) -> List[Dict[str, Any]]:
+        async with self._acquire() as connection:
+            return [dict(x) for x in await connection.fetch(_queries['select_projects'])]
+
+    async def annotate_project(self, annotation: Dict[str, str]) -> str:
+        _project = annotation.get('project')
+        _description = annotation.get('description')
+        _key = annotation.get('key')
+
+        while not get_catalog().has_projects():
+            version = get_catalog().version
+            get_catalog().set_projects(await self.load_projects(), version)
+
+        assert get_catalog().get_project(_project) is not None, f'Project {_project} does not exist'
+
+        async with self._acquire() as connection, connection.transaction():
+            await connection.execute(_queries['annotate_project'], _project, _description, _key,
+                                     self._aware(datetime.now()), await self._next_sequence(connection))
+
+        get_catalog().update_project(_project, {'project_key': _key})
+
+        message = f'Annotated project {_project}'
+        logging.info(message)
+
+        return message
+
+    # actions
+    async def insert_actions(self, actions: Sequence[Dict[str, str]]) -> None:
+        now = self._aware(datetime.now())
+
+        async with self._acquire() as connection, connection.transaction():
+            sequence = await self._next_sequence(connection)
+            await connection.executemany(_queries['insert_action'], [
+                (x['action_id'], x['action_name'], x.get('description'), now, sequence) for x in actions])
+
+        get_catalog().put_actions([{k: x.get(k) for k in _action_keys} for x in actions])
+
+    async def remove_actions(self, actions: Sequence[str]) -> None:
+        async with self._acquire() as connection, connection.transaction():
+            await connection.execute(_queries['remove_actions'], list(actions), self._aware(datetime.now()),
+                                     await self._next_sequence(connection))
+
+        get_catalog().remove_actions(actions)
+
+    async def load_actions(self) -> List[Dict[str, Any]]:
+        async with self._acquire() as connection:
+            return [dict(x) for x in await connection.fetch(_queries['select_actions'])]
+
+    # worklogs
+    async def add_worklogs(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Insert worklogs, using COPY for anything but single rows"""
+        try:
+            records = [tuple(self._aware(x[k]) if k == 'timestamp' else x[k] for k in _worklog_columns)
+                       for x in prepare_worklogs(rows)]
+
+            if len(records) == 0:
+                return
+
+            async with self._acquire() as connection:
+                if len(records) == 1:
+                    await connection.execute(_queries['insert_worklog'], *records[0])
+                else:
+                    await connection.copy_records_to_table('worklog', records=records, columns=_worklog_columns)
+
+        except Exception as e:
+            logging.error(str(e))
+            raise e
+
+    async def _last_worklog(self, connection) -> Union[Dict[str, Any], None]:
+        row = await connection.fetchrow(_queries['select_last_worklog'])
+
+        assert row is not None, 'No worklogs could be found'
+
+        return dict(row)
+
+    async def modify_worklog(self, modifier: str) -> str:
+        delta = _parse_modifier(modifier)
+
+        async with self._acquire() as connection:
+            async with connection.transaction():
+                select_row = await self._last_worklog(connection)
+                _timestamp = select_row['timestamp'] + delta
+
+                await connection.execute(_queries['update_worklog'], select_row['worklog_id'], _timestamp)
+
+        _previous = select_row['timestamp'].astimezone(self.timezone)
+
+        message = f'Modified last worklog: {_previous} → {_timestamp.astimezone(self.timezone)}'
+        logging.info(message)
+
+        return message
+
+    async def remove_worklog(self) -> str:
+        async with self._acquire() as connection:
+            async with connection.transaction():
+                select_row = await self._last_worklog(connection)
+
+                await connection.execute(_queries['delete_worklog'], select_row['worklog_id'])
+
+        message = 'Removed last worklog'
+        logging.info(message)
+
+        return message
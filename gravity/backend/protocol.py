@@ -0,0 +1,144 @@
+import asyncio
+import json
+import struct
+from typing import Any, Dict, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Framed connections start with a handshake of MAGIC + protocol version + encoding, which the server echoes back
+# with the encoding it has chosen. Every message is then sent as a 4-byte big-endian length, followed by the payload.
+MAGIC = b'GRV'
+VERSION = 1
+
+_handshake = struct.Struct('!3sBB')
+_header = struct.Struct('!I')
+
+_encodings = {
+    'json': 0,
+    'msgpack': 1,
+}
+
+
+def available_encodings() -> Dict[str, int]:
+    return {k: v for k, v in _encodings.items() if k != 'msgpack' or msgpack is not None}
+
+
+def encode(message: Dict[str, Any], encoding: str = 'json') -> bytes:
+    if encoding == 'msgpack':
+        return msgpack.packb(message, use_bin_type=True)
+
+    return json.dumps(message).encode(encoding='utf-8')
+
+
+def decode(data: Union[bytes, str], encoding: str = 'json') -> Dict[str, Any]:
+    if encoding == 'msgpack':
+        return msgpack.unpackb(data, raw=False)
+
+    return json.loads(data)
+
+
+class StreamProtocol(object):
+    """Read and write messages on a stream, either as newline-delimited JSON or as length-prefixed frames"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, framing: str = 'line',
+                 encoding: str = 'json', max_frame_size: int = 2 ** 24) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.encoding = encoding
+        self.max_frame_size = max_frame_size
+
+        self._buffer = b''
+
+    @classmethod
+    async def connect(cls, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, framing: str = 'length',
+                      encoding: str = 'json', max_frame_size: int = 2 ** 24) -> 'StreamProtocol':
+        """Negotiate framing and encoding with the server, as a client"""
+        if framing == 'line':
+            return cls(reader, writer, 'line', 'json', max_frame_size)
+
+        assert encoding in available_encodings(), f'Encoding {encoding} is not available'
+
+        writer.write(_handshake.pack(MAGIC, VERSION, _encodings[encoding]))
+        await writer.drain()
+
+        magic, version, _encoding = _handshake.unpack(await reader.readexactly(_handshake.size))
+
+        assert magic == MAGIC, 'Server does not support length-prefixed framing'
+        assert version == VERSION, f'Server does not support protocol version {VERSION}'
+
+        encoding = {v: k for k, v in _encodings.items()}[_encoding]
+
+        return cls(reader, writer, 'length', encoding, max_frame_size)
+
+    @classmethod
+    async def accept(cls, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     max_frame_size: int = 2 ** 24) -> 'StreamProtocol':
+        """Detect the framing used by a client, and negotiate the encoding of framed connections, as a server"""
+        prefix = await reader.read(1)
+
+        if prefix != MAGIC[:1]:
+            # Newline-delimited and legacy one-shot JSON requests start with an opening brace
+            protocol = cls(reader, writer, 'line', 'json', max_frame_size)
+            protocol._buffer = prefix
+
+            return protocol
+
+        magic, version, _encoding = _handshake.unpack(prefix + await reader.readexactly(_handshake.size - 1))
+
+        assert magic == MAGIC, 'Received an invalid protocol handshake'
+        assert version == VERSION, f'Unsupported protocol version {version}'
+
+        # Fall back to JSON if the client asked for an encoding the server does not support
+        encodings = {v: k for k, v in available_encodings().items()}
+        encoding = encodings.get(_encoding, 'json')
+
+        writer.write(_handshake.pack(MAGIC, VERSION, _encodings[encoding]))
+        await writer.drain()
+
+        return cls(reader, writer, 'length', encoding, max_frame_size)
+
+    async def read_frame(self) -> Union[bytes, None]:
+        """Read a single encoded message, returning None once the stream has been closed"""
+        if self.framing == 'line':
+            data, self._buffer = self._buffer + await self.reader.readline(), b''
+
+            return data if data else None
+
+        try:
+            header = await self.reader.readexactly(_header.size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+
+            return None
+
+        length, = _header.unpack(header)
+
+        assert length <= self.max_frame_size, f'Frame of {length} bytes exceeds maximum frame size'
+
+        return await self.reader.readexactly(length)
+
+    def write_frame(self, data: bytes) -> None:
+        if self.framing == 'line':
+            self.writer.write(data + b'\n')
+        else:
+            self.writer.write(_header.pack(len(data)) + data)
+
+    async def read(self) -> Union[Dict[str, Any], None]:
+        data = await self.read_frame()
+
+        return self.decode(data) if data is not None else None
+
+    async def write(self, message: Dict[str, Any]) -> None:
+        self.write_frame(self.encode(message))
+        await self.writer.drain()
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return encode(message, self.encoding)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return decode(data, self.encoding)
@@ -1,18 +1,84 @@
 import asyncio
 import json
 import logging
+import multiprocessing
+import os
 import signal
+import socket
+import stat
 import sys
 from functools import partial
-from typing import Any, Dict
+from multiprocessing.connection import wait
+from time import monotonic, perf_counter, sleep
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Sequence, Tuple, Union
+from uuid import uuid4
 
 import daemon
 import websockets
 
-from gravity.action import get_actions, insert_actions, remove_actions
+import gravity.logger
+
+from gravity.action import get_actions, insert_actions, load_actions, remove_actions
+from gravity.backend.batch import WorklogBatcher
+from gravity.backend.executor import RequestExecutor, write_requests
+from gravity.backend.metrics import configure_metrics, get_metrics, instrument_engine, start_metrics_server
+from gravity.backend.protocol import StreamProtocol, encode
+from gravity.backend.spool import WorklogSpool
+from gravity.backend.subscription import Subscriptions
+from gravity.backend.writer import close_writers
 from gravity.config import BaseConfig
-from gravity.project import annotate_project, get_projects, insert_projects, remove_projects
-from gravity.worklog import add_worklog, modify_worklog, remove_worklog
+from gravity.database import database_backends, dispose_engines, get_engine, get_pool_statistics
+from gravity.catalog import get_catalog
+from gravity.changes import get_changes_since
+from gravity.project import annotate_project, get_projects, insert_projects, load_projects, remove_projects
+from gravity.report import get_report
+from gravity.usage import get_project_usage, search_projects
+from gravity.worklog import add_worklog, add_worklogs, modify_worklog, prepare_worklogs, read_worklogs, remove_worklog
+
+if TYPE_CHECKING:
+    from gravity.backend.postgresql import AsyncPostgresqlBackend
+
+# Requests answered with a sequence of responses, each of which carries the request id
+stream_requests = {'export_worklogs', 'subscribe'}
+
+# Seconds between checks whether another server worker has changed the catalog, to tell subscribers
+_catalog_poll_interval = 0.5
+
+
+def _catalog_response(payload: Union[Dict[str, Any], None], **catalogs: Callable[[], Any]) -> Dict[str, Any]:
+    """Return requested catalogs along with the catalog version, or only the version if the client is up to date
+
+    Versions from another epoch, i.e. handed out before the server restarted, always get the full catalogs.
+    """
+    version = get_catalog().version
+
+    if (payload or {}).get('version') == version:
+        return {'version': version}
+
+    return {**{name: catalog() for name, catalog in catalogs.items()}, 'version': version}
+
+
+async def _populate_catalog(config: BaseConfig, backend: Union['AsyncPostgresqlBackend', None] = None) -> None:
+    try:
+        version = get_catalog().version
+
+        if backend is not None:
+            projects, actions = await backend.load_projects(), await backend.load_actions()
+        else:
+            projects, actions = load_projects(config), load_actions(config)
+
+        # Should the catalog have changed meanwhile, the first request loads it again instead
+        get_catalog().set_projects(projects, version)
+        get_catalog().set_actions(actions, version)
+
+    except Exception as e:
+        logging.warning('Could not populate catalog cache, deferring to first request: %s', e)
+
+
+def _metrics_response() -> Dict[str, str]:
+    assert get_metrics().enabled, 'Metrics are disabled'
+
+    return {'metrics': get_metrics().render()}
 
 
 def request_handler(message: Dict[str, Any], config: BaseConfig) -> callable:
@@ -26,120 +92,512 @@ def request_handler(message: Dict[str, Any], config: BaseConfig) -> callable:
     request_types = {
         # actions
         'insert_actions': lambda: insert_actions(payload.get('actions'), config),
-        'get_actions': lambda: {'actions': get_actions(config)},
+        'get_actions': lambda: _catalog_response(payload, actions=lambda: get_actions(config)),
         'remove_actions': lambda: remove_actions(payload.get('actions'), config),
         # projects
         'insert_projects': lambda: insert_projects(payload.get('projects', []), config),
-        'get_projects': lambda: {'projects': get_projects(config)},
+        'get_projects': lambda: _catalog_response(payload, projects=lambda: get_projects(config)),
         'remove_projects': lambda: remove_projects(payload.get('projects'), config),
         # worklogs
         'add_worklog': lambda: add_worklog(payload.get('worklog'), config),
+        'add_worklogs': lambda: add_worklogs(payload.get('worklogs', []), config),
         'modify_worklog': lambda: modify_worklog(payload.get('modifier'), config),
         'remove_worklog': lambda: remove_worklog(config),
+        # catalog sync
+        'get_changes_since': lambda: get_changes_since((payload or {}).get('sequence'), config),
         # annotate
-        'annotate_project': lambda: annotate_project(payload.get('annotation'), config)
+        'annotate_project': lambda: annotate_project(payload.get('annotation'), config),
+        # search
+        'search_projects': lambda: {
+            'projects': search_projects(payload.get('query'), config, payload.get('limit', 20))},
+        'get_project_usage': lambda: get_project_usage(config),
+        # reports
+        'get_report': lambda: {'report': get_report(
+            payload.get('group_by', ['day', 'project']), config, payload.get('start'), payload.get('end'))},
+        # statistics
+        'get_pool_statistics': lambda: {'pool': get_pool_statistics(config)},
+        'get_metrics': _metrics_response
     }
-    request_types['get_data'] = lambda: {**request_types['get_projects'](), **request_types['get_actions']()}
+    request_types['get_data'] = lambda: _catalog_response(
+        payload, projects=lambda: get_projects(config), actions=lambda: get_actions(config))
 
     assert request in request_types, 'No valid request has been received'
 
     return request_types.get(request, None)
 
 
-async def websocket_handler(websocket: websockets.WebSocketServerProtocol, path: str, config: BaseConfig) -> None:
-    """Receive, decode, and handle data received by the server via Websocket"""
-    try:
+def stream_handler(message: Dict[str, Any], config: BaseConfig) -> Callable[[], Tuple[str, Iterator[Any]]]:
+    """Dispatch streaming request handlers, which return the response key and an iterator over its chunks"""
+    request = message.get('request')
+    payload = message.get('payload') or {}
+
+    stream_types = {
+        'export_worklogs': lambda: ('worklogs', read_worklogs(
+            config, payload.get('start'), payload.get('end'), payload.get('projects'), payload.get('chunk_size', 1000)
+        ))
+    }
+
+    assert request in stream_types, 'No valid streaming request has been received'
+
+    return stream_types.get(request)
+
+
+class RequestDispatcher(object):
+    """Dispatch decoded requests, batching worklogs and running blocking handlers outside of the event loop"""
+
+    def __init__(self, config: BaseConfig) -> None:
+        self.config = config
+        self.executor = RequestExecutor(config)
+        self.backend = None
+
+        # Only the postgresql-async backend requires asyncpg
+        if config.backend.driver == 'postgresql-async':
+            from gravity.backend.postgresql import AsyncPostgresqlBackend
+            self.backend = AsyncPostgresqlBackend(config)
+
+        self.batcher = WorklogBatcher(config, self.executor, self.backend.add_worklogs if self.backend else None)
+        self.spool = WorklogSpool(config, self._record) if config.spool.enabled else None
+        self.subscriptions = Subscriptions(config.server.subscriber_queue_size)
+        self.connections = 0
+        self._watcher = None
+
+    async def start(self) -> None:
+        if self.backend is not None:
+            await self.backend.start()
+
+        await _populate_catalog(self.config, self.backend)
+        self.batcher.start()
+
+        if self.spool is not None:
+            await self.spool.start()
+
+        # Workers sharing the catalog version tell their subscribers about changes made by other workers, even while
+        # they are not handling any requests themselves
+        if get_catalog().shared:
+            self._watcher = asyncio.ensure_future(self._watch_catalog())
+
+        metrics = get_metrics()
+        metrics.register_gauge('gravity_connections_in_flight', lambda: self.connections)
+        metrics.register_gauge('gravity_write_queue_depth', lambda: self.batcher.depth)
+        metrics.register_gauge('gravity_requests_pending', lambda: self.executor.pending)
+        metrics.register_gauge('gravity_subscribers', lambda: len(self.subscriptions.subscribers))
+
+        if self.spool is not None:
+            metrics.register_gauge('gravity_spool_depth', lambda: self.spool.depth)
+            metrics.register_gauge('gravity_spool_lag_seconds', lambda: self.spool.lag)
+
+    async def stop(self) -> None:
+        get_metrics().unregister_gauges()
+
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+
+        # The spool drains into the batcher, so stop it first
+        if self.spool is not None:
+            await self.spool.stop()
+
+        await self.batcher.stop()
+        self.executor.shutdown()
+
+        if self.backend is not None:
+            await self.backend.close()
+
+    async def _watch_catalog(self) -> None:
         while True:
-            data = await websocket.recv()
-            assert data, 'No data has been received'
-            request = json.loads(data)
+            await asyncio.sleep(_catalog_poll_interval)
 
-            logging.debug(request)
+            if get_catalog().sync():
+                self.subscriptions.publish_catalog_changed()
 
-            handler = request_handler(request, config)()  # call handler, since it returns a function
-            response = json.dumps({'response': handler if handler is not None else {}})
+    async def _record(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Write worklogs in the next batch, and push them to subscribers once they have been committed"""
+        _rows = prepare_worklogs(rows)
 
-            logging.debug(response)
+        await self.batcher.submit(_rows)
+        self.subscriptions.publish_worklogs(_rows)
 
-            await websocket.send(response)
+    async def dispatch(self, message: Dict[str, Any]) -> Any:
+        request = message.get('request')
+        payload = message.get('payload') or {}
 
-    except Exception as e:
-        response = json.dumps({'response': {'error': str(e)}})
+        # Pick up catalog changes made by other worker processes
+        if get_catalog().sync():
+            self.subscriptions.publish_catalog_changed()
 
-        logging.error(repr(e))
+        # Worklogs are acknowledged once the batch they have been written with is committed, or once they have been
+        # committed to the spool, if enabled
+        _submit = self.spool.submit if self.spool is not None else self._record
+
+        if request == 'add_worklog':
+            return await _submit([payload.get('worklog')])
+        elif request == 'add_worklogs':
+            return await _submit(payload.get('worklogs', []))
+
+        # Requests which the asynchronous backend does not implement fall back to the synchronous handlers
+        if self.backend is not None and request in self.backend.requests:
+            response = await self.backend.handle(request, payload)
+        else:
+            response = await self.executor.run(request_handler(message, self.config), request in write_requests)
+
+        self.subscriptions.publish_catalog(request, payload)
+
+        return response
+
+    async def stream(self, message: Dict[str, Any], connection: Any = None) -> AsyncIterator[Dict[str, Any]]:
+        """Run a streaming request handler, only reading each chunk once the previous one has been consumed"""
+        if message.get('request') == 'subscribe':
+            assert connection is not None, 'Subscriptions are only supported via websockets'
+
+            async for event in self.subscriptions.listen(connection, (message.get('payload') or {}).get('topics')):
+                yield event
+
+            return
 
-        await websocket.send(response)
+        key, iterator = stream_handler(message, self.config)()
 
+        try:
+            while True:
+                chunk = await self.executor.run(partial(next, iterator, None))
+
+                if chunk is None:
+                    break
+
+                yield {key: chunk}
+
+        finally:
+            # Close cursors on the thread that used them last, even if the client has gone away
+            await self.executor.run(iterator.close)
+
+
+async def handle_message(data: Union[bytes, str], dispatcher: RequestDispatcher,
+                         decode: Callable[[Union[bytes, str]], Dict[str, Any]] = json.loads,
+                         encode: Callable[[Dict[str, Any]], Union[bytes, str]] = json.dumps,
+                         send: Union[Callable[[Union[bytes, str]], Awaitable[None]], None] = None,
+                         connection: Any = None) -> Union[bytes, str]:
+    """Decode, handle and encode a single request, tagging the response with the request's id, if any
+
+    Streaming requests send every chunk but the last response via `send`, flagging them with `more`. Sending waits for
+    the connection to drain, so that slow clients only ever hold up their own stream. Subscriptions are streams which
+    last until the WebSocket `connection` is closed.
+    """
+    metrics = get_metrics()
+    request_id, request_type, error = None, None, False
+    start = decoded = perf_counter()
 
-async def socket_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, config: BaseConfig) -> None:
-    """Receive, decode, and handle data received by the server via TCP/UNIX socket before handling them"""
     try:
-        data = await reader.readline()
         assert data, 'No data has been received'
-        request = json.loads(data.decode(encoding='utf-8'))
+        request = decode(data)
+        request_id = request.get('id')
+        request_type = request.get('request')
+        decoded = perf_counter()
 
         logging.debug(request)
 
-        handler = request_handler(request, config)()  # call handler, since it returns a function
-        response = json.dumps({'response': handler if handler is not None else {}}).encode(encoding='utf-8')
+        if request_type in stream_requests:
+            assert send is not None and request_id is not None, 'Streaming requests require a request id'
 
-        logging.debug(response)
+            async for chunk in dispatcher.stream(request, connection):
+                await send(encode({'response': chunk, 'id': request_id, 'more': True}))
 
-        writer.write(response)
+            handler = None
+        else:
+            handler = await dispatcher.dispatch(request)
+
+        response = {'response': handler if handler is not None else {}}
 
     except Exception as e:
-        response = json.dumps({'response': {'error': str(e)}}).encode(encoding='utf-8')
+        response = {'response': {'error': str(e)}}
+        error = True
 
         logging.error(repr(e))
 
-        writer.write(response)
+    handled = perf_counter()
+    encoded = encode({**response, 'id': request_id} if request_id is not None else response)
+
+    if metrics.enabled:
+        metrics.request(request_type, error)
+        metrics.phase('decode', decoded - start, request_type)
+        metrics.phase('handler', handled - decoded, request_type)
+        metrics.phase('encode', perf_counter() - handled, request_type)
+
+    return encoded
+
+
+async def websocket_handler(websocket: websockets.WebSocketServerProtocol, path: str,
+                            dispatcher: RequestDispatcher) -> None:
+    """Receive, decode, and handle data received by the server via Websocket
+
+    Like requests sent via TCP/UNIX socket, requests on the same connection are handled concurrently, so that a
+    subscription does not hold up other requests.
+    """
+    async def respond(data: Union[bytes, str]) -> None:
+        response = await handle_message(data, dispatcher, send=websocket.send, connection=websocket)
+
+        logging.debug(response)
+
+        try:
+            await websocket.send(response)
+        except websockets.ConnectionClosed:
+            pass
+
+    pending = set()
+    dispatcher.connections += 1
+
+    try:
+        async for data in websocket:
+            task = asyncio.ensure_future(respond(data))
+            task.add_done_callback(pending.discard)
+            pending.add(task)
+
+    except websockets.ConnectionClosed:
+        pass
 
     finally:
+        dispatcher.subscriptions.disconnect(websocket)
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        dispatcher.connections -= 1
+
+
+async def socket_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         dispatcher: RequestDispatcher) -> None:
+    """Receive, decode, and handle requests received by the server via TCP/UNIX socket
+
+    Clients either send length-prefixed frames after a protocol handshake, or newline-delimited JSON. Requests on
+    the same connection are handled concurrently, so clients tag them with an id to match responses. Legacy clients
+    send a single JSON request terminated by EOF, and read the response until the connection is closed.
+    """
+    async def send(data: bytes) -> None:
+        protocol.write_frame(data)
         await writer.drain()
+
+    async def respond(data: bytes) -> None:
+        response = await handle_message(data, dispatcher, protocol.decode, protocol.encode, send)
+
+        logging.debug(response)
+
+        await send(response)
+
+    protocol = None
+    pending = set()
+    dispatcher.connections += 1
+
+    try:
+        protocol = await StreamProtocol.accept(reader, writer, dispatcher.config.socket.max_frame_size)
+
+        while True:
+            data = await protocol.read_frame()
+
+            if data is None:
+                break
+
+            task = asyncio.ensure_future(respond(data))
+            task.add_done_callback(pending.discard)
+            pending.add(task)
+
+    except Exception as e:
+        logging.error(repr(e))
+
+        response = {'response': {'error': str(e)}}
+        protocol.write_frame(protocol.encode(response)) if protocol else writer.write(encode(response) + b'\n')
+
+    finally:
+        await asyncio.gather(*pending, return_exceptions=True)
         writer.close()
 
+        dispatcher.connections -= 1
 
-async def start_listener(config: BaseConfig) -> None:
-    """Receive data sent by clients via TCP or UNIX socket, or via Websocket"""
-    _websocket_handler = partial(websocket_handler, config=config)
-    _socket_handler = partial(socket_handler, config=config)
-
-    if config.socket.type == 'tcp':
-        server = await asyncio.start_server(_socket_handler, host=config.tcp.host, port=config.tcp.port)
-    elif config.socket.type == 'unix':
-        server = await asyncio.start_unix_server(_socket_handler, path=config.unix.socket)
-    elif config.socket.type == 'websockets':
-        server = await websockets.serve(_websocket_handler, host=config.tcp.host, port=config.tcp.port)
-    else:
-        raise AssertionError(f"Requested socket type is not one of: 'tcp', 'unix', 'websockets'")
-
-    server_options = {
-        'type': config.socket.type,
-        'socket': server.sockets[0].getsockname(),
-        'backend': config.backend.driver,
-        'daemon': config.main.daemon
-    }
 
-    logging.info(f'Server started. Listening on {server_options["socket"]}')
-    logging.debug(f'{server_options}')
+async def start_listener(config: BaseConfig, sock: Union[socket.socket, None] = None) -> None:
+    """Receive data sent by clients via TCP or UNIX socket, or via Websocket
+
+    Worker processes either bind the same TCP port with SO_REUSEPORT, or accept connections on a UNIX socket which has
+    been bound by the supervisor, and which is passed as `sock`.
+    """
+    dispatcher = RequestDispatcher(config)
 
-    if config.socket.type == 'websockets':
-        await server.wait_closed()
-    else:
-        async with server:
-            await server.serve_forever()
+    _websocket_handler = partial(websocket_handler, dispatcher=dispatcher)
+    _socket_handler = partial(socket_handler, dispatcher=dispatcher)
 
+    # Create the backend engine (and its connection pool) once, to be shared by all request handlers
+    engine = get_engine(config)
 
-def start_server(config: BaseConfig) -> None:
-    def daemon_shutdown(signum, frame):
-        sys.exit(0)
+    if configure_metrics(config).enabled and engine is not None:
+        instrument_engine(engine)
+
+    await dispatcher.start()
+    metrics_server = None
+    reuse_port = config.server.workers > 1 or None
 
     try:
-        if not config.main.daemon:
+        if config.socket.type == 'tcp':
+            server = await asyncio.start_server(_socket_handler, host=config.tcp.host, port=config.tcp.port,
+                                                limit=config.socket.max_frame_size, reuse_port=reuse_port)
+        elif config.socket.type == 'unix' and sock is not None:
+            server = await asyncio.start_unix_server(_socket_handler, sock=sock, limit=config.socket.max_frame_size)
+        elif config.socket.type == 'unix':
+            server = await asyncio.start_unix_server(_socket_handler, path=config.unix.socket,
+                                                     limit=config.socket.max_frame_size)
+        elif config.socket.type == 'websockets':
+            server = await websockets.serve(_websocket_handler, host=config.tcp.host, port=config.tcp.port,
+                                            reuse_port=reuse_port)
+        else:
+            raise AssertionError(f"Requested socket type is not one of: 'tcp', 'unix', 'websockets'")
+
+        server_options = {
+            'type': config.socket.type,
+            'socket': server.sockets[0].getsockname(),
+            'backend': config.backend.driver,
+            'executor': config.server.executor,
+            'daemon': config.main.daemon
+        }
+
+        logging.info('Server started. Listening on %s', server_options['socket'])
+        logging.debug('%s', server_options)
+
+        metrics_server = await start_metrics_server(config)
+
+        if config.socket.type == 'websockets':
+            await server.wait_closed()
+        else:
+            async with server:
+                await server.serve_forever()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+
+        await dispatcher.stop()
+        close_writers()
+        dispose_engines()
+
+
+def _shutdown(signum, frame):
+    sys.exit(0)
+
+
+def _bind_unix_socket(path: str) -> socket.socket:
+    """Bind a UNIX socket to be shared by all workers, replacing a stale socket file, as asyncio would"""
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(100)
+
+    return sock
+
+
+async def _serve_worker(config: BaseConfig, index: int, sock: Union[socket.socket, None], parent: int) -> None:
+    """Serve requests until the listener stops, or the supervisor has exited without stopping the worker"""
+    listener = asyncio.ensure_future(start_listener(config, sock))
+
+    try:
+        while os.getppid() == parent:
+            done, _ = await asyncio.wait([listener], timeout=1)
+
+            if done:
+                return listener.result()
+
+        logging.error('Server supervisor has exited, stopping worker %d', index)
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+def _run_worker(config: BaseConfig, index: int, generation, epoch: str, sock: Union[socket.socket, None],
+                parent: int) -> None:
+    """Run a server worker in a forked process"""
+    signal.signal(signal.SIGTERM, _shutdown)
+    gravity.logger.restart_listener()
+
+    # Workers keep separate spools, and serve metrics on consecutive ports
+    config.set_override(name='path', override=f'{config.spool.path}.{index}', group='spool')
+
+    if config.metrics.port is not None:
+        config.set_override(name='port', override=config.metrics.port + index, group='metrics')
+
+    get_catalog().share(generation, epoch)
+
+    try:
+        asyncio.run(_serve_worker(config, index, sock, parent))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_workers(config: BaseConfig, workers: int) -> None:
+    """Fork server workers, restarting any worker which exits until the supervisor itself is stopped"""
+    assert config.backend.driver in [*database_backends, 'stdout'], \
+        f'Multiple workers require a database backend, not {config.backend.driver}'
+    assert config.socket.type == 'unix' or hasattr(socket, 'SO_REUSEPORT'), \
+        'Multiple TCP workers require SO_REUSEPORT, which is not supported on this platform'
+
+    context = multiprocessing.get_context('fork')
+    # Workers restarted by this supervisor keep its epoch, so that clients keep their catalog versions across them
+    generation, epoch = context.Value('Q', 0), uuid4().hex
+    sock = _bind_unix_socket(config.unix.socket) if config.socket.type == 'unix' else None
+    processes: Dict[int, multiprocessing.Process] = {}
+    started: Dict[int, float] = {}
+
+    def spawn(index: int) -> None:
+        # Throttle restarts of workers which keep exiting right after being started
+        if monotonic() - started.get(index, float('-inf')) < 1:
+            sleep(1)
+
+        processes[index] = context.Process(target=_run_worker,
+                                           args=(config, index, generation, epoch, sock, os.getpid()),
+                                           name=f'gravity-worker-{index}')
+        processes[index].start()
+        started[index] = monotonic()
+
+    try:
+        for index in range(workers):
+            spawn(index)
+
+        logging.info('Supervising %d server workers', workers)
+
+        while True:
+            wait([x.sentinel for x in processes.values()])
+
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    logging.error('Server worker %d exited with code %s, restarting it', index, process.exitcode)
+                    spawn(index)
+
+    finally:
+        for process in processes.values():
+            process.terminate() if process.is_alive() else None
+
+        for process in processes.values():
+            process.join(timeout=config.server.request_timeout or None)
+            process.kill() if process.is_alive() else None
+
+        if sock is not None:
+            sock.close()
+            os.unlink(config.unix.socket) if os.path.exists(config.unix.socket) else None
+
+
+def start_server(config: BaseConfig, workers: Union[int, None] = None) -> None:
+    if workers is not None:
+        config.set_override(name='workers', override=workers, group='server')
+
+    def _start() -> None:
+        if config.server.workers > 1:
+            start_workers(config, config.server.workers)
+        else:
             asyncio.run(start_listener(config))
+
+    try:
+        if not config.main.daemon:
+            signal.signal(signal.SIGTERM, _shutdown) if config.server.workers > 1 else None
+            _start()
         elif config.main.daemon:
-            with daemon.DaemonContext(signal_map={signal.SIGTERM: daemon_shutdown, signal.SIGTSTP: daemon_shutdown}):
-                asyncio.run(start_listener(config))
+            signal_map = {signal.SIGTERM: _shutdown, signal.SIGTSTP: _shutdown}
+
+            with daemon.DaemonContext(signal_map=signal_map, files_preserve=gravity.logger.log_streams()):
+                gravity.logger.restart_listener()
+                _start()
 
     except KeyboardInterrupt:
         exit(0)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple, Union
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+from gravity.config import BaseConfig
+from gravity.worklog import prepare_worklogs
+
+# Errors caused by the submitted worklogs themselves, e.g. unknown projects, which retrying cannot resolve. Any other
+# error, e.g. a lost connection, or an AssertionError from a full request queue or a missing database, is considered
+# transient.
+_invalid_errors: Tuple[type, ...] = (KeyError, TypeError, ValueError, DataError, IntegrityError)
+_invalid_errors += (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError) if asyncpg is not None else ()
+
+_schema = [
+    'CREATE TABLE IF NOT EXISTS spool (spool_id INTEGER PRIMARY KEY AUTOINCREMENT, worklogs TEXT NOT NULL, '
+    'received REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS rejected (spool_id INTEGER PRIMARY KEY, worklogs TEXT NOT NULL, '
+    'received REAL NOT NULL, error TEXT)'
+]
+
+
+class WorklogSpool(object):
+    """Accept worklogs into a local SQLite spool, and drain them into the storage backend in the background
+
+    Submissions are acknowledged as soon as they have been committed to the spool, so that clients neither wait for
+    nor fail with a slow or unreachable backend. The drainer retries failed writes with exponential backoff. Worklogs
+    are delivered at least once: a server stopped between writing a batch and removing it from the spool writes the
+    batch again after restarting.
+
+    Submissions failing with an error caused by the worklogs themselves, e.g. an integrity or validation error, are
+    moved to the spool's `rejected` table, as are submissions exceeding `[spool] max_attempts`. Submissions failing
+    with any other error, e.g. because the backend went away while writing the batch, are retried.
+    """
+
+    def __init__(self, config: BaseConfig, writer: Callable[[Sequence[Dict[str, Any]]], Awaitable[None]]) -> None:
+        self.path = config.spool.path
+        self.writer = writer
+        self.batch_size = config.server.batch_size
+        self.retry_interval = config.spool.retry_interval
+        self.retry_max = config.spool.retry_max
+        self.max_attempts = config.spool.max_attempts
+
+        self.depth = 0
+        self.oldest: Union[float, None] = None
+
+        # Spool I/O gets a thread of its own, so that it never queues behind requests waiting for the backend
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gravity-spool')
+        self._connection = None
+        self._event = None
+        self._task = None
+        self._inflight = None
+
+    @property
+    def lag(self) -> float:
+        """Seconds since the oldest spooled submission has been received"""
+        return max(time() - self.oldest, 0) if self.oldest is not None else 0.0
+
+    async def _run(self, function: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self) -> Tuple[int, Union[float, None]]:
+        self._connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.execute('PRAGMA synchronous = FULL')
+
+        for statement in _schema:
+            self._connection.execute(statement)
+
+        return self._connection.execute('SELECT count(*), min(received) FROM spool').fetchone()
+
+    async def start(self) -> None:
+        self.depth, self.oldest = await self._run(self._open)
+        self._event = asyncio.Event()
+        self._task = asyncio.ensure_future(self._drain_forever())
+
+        if self.depth:
+            logging.info('Resuming to drain %d spooled submission(s)', self.depth)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        # Let a batch which is being written finish, so that it is removed from the spool
+        if self._inflight is not None:
+            await asyncio.gather(self._inflight, return_exceptions=True)
+
+        if self._connection is not None:
+            await self._run(self._connection.close)
+
+        self._executor.shutdown(wait=True)
+
+    def _insert(self, worklogs: str, received: float) -> None:
+        self._connection.execute('INSERT INTO spool (worklogs, received) VALUES (?, ?)', (worklogs, received))
+
+    async def submit(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Commit worklogs to the spool, returning before they have been written to the storage backend"""
+        assert self._task is not None, 'Worklog spool has not been started'
+
+        # Validate and timestamp worklogs upon receipt, rather than when they get drained
+        _rows = [{**x, 'timestamp': x['timestamp'].isoformat()} for x in prepare_worklogs(rows)]
+        received = time()
+
+        await self._run(self._insert, json.dumps(_rows), received)
+
+        self.depth += 1
+        self.oldest = received if self.oldest is None else self.oldest
+        self._event.set()
+
+    def _fetch(self) -> List[Tuple[int, str, float, int]]:
+        return self._connection.execute('SELECT spool_id, worklogs, received, attempts FROM spool '
+                                        'ORDER BY spool_id LIMIT ?', (self.batch_size,)).fetchall()
+
+    def _settle(self, written: Sequence[int], failed: Sequence[int],
+                rejected: Sequence[Tuple[int, str]]) -> Union[float, None]:
+        """Remove written submissions, count failed attempts, and move rejected ones out of the spool
+
+        Returns when the oldest submission remaining in the spool has been received, if any.
+        """
+        with self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            self._connection.executemany('DELETE FROM spool WHERE spool_id = ?', [(x,) for x in written])
+            self._connection.executemany('UPDATE spool SET attempts = attempts + 1 WHERE spool_id = ?',
+                                         [(x,) for x in failed])
+
+            for spool_id, error in rejected:
+                self._connection.execute('INSERT INTO rejected (spool_id, worklogs, received, error) '
+                                         'SELECT spool_id, worklogs, received, ? FROM spool WHERE spool_id = ?',
+                                         (error, spool_id))
+                self._connection.execute('DELETE FROM spool WHERE spool_id = ?', (spool_id,))
+
+        return self._connection.execute('SELECT min(received) FROM spool').fetchone()[0]
+
+    async def _drain(self, entries: Sequence[Tuple[int, str, float, int]]) -> bool:
+        """Write a batch of spooled submissions, returning whether the backend accepted any of them"""
+        results = await asyncio.gather(*[self.writer(json.loads(x[1])) for x in entries], return_exceptions=True)
+        errors = {x[0]: e for x, e in zip(entries, results) if isinstance(e, Exception)}
+        accepted = len(errors) < len(entries)
+
+        written = [x[0] for x in entries if x[0] not in errors]
+        rejected = [(x[0], str(errors[x[0]])) for x in entries if x[0] in errors and
+                    (isinstance(errors[x[0]], _invalid_errors) or
+                     (self.max_attempts and x[3] + 1 >= self.max_attempts))]
+        failed = [x for x in errors if x not in {y for y, _ in rejected}]
+
+        for spool_id, error in rejected:
+            logging.error('Rejected spooled submission %d: %s', spool_id, error)
+
+        self.oldest = await self._run(self._settle, written, failed, rejected)
+        self.depth -= len(written) + len(rejected)
+
+        if not accepted:
+            logging.warning('Failed to drain %d spooled submission(s): %s', len(entries), next(iter(errors.values())))
+
+        return accepted or bool(rejected)
+
+    async def _drain_forever(self) -> None:
+        delay = self.retry_interval
+
+        while True:
+            self._event.clear()
+            entries = await self._run(self._fetch)
+
+            if not entries:
+                await self._event.wait()
+                continue
+
+            # Shield the batch, so that stopping the spool does not interrupt it between writing and settling
+            self._inflight = asyncio.ensure_future(self._drain(entries))
+
+            try:
+                success = await asyncio.shield(self._inflight)
+            except Exception as e:
+                logging.error('Failed to settle spooled submissions: %s', e)
+                success = False
+
+            if success:
+                delay = self.retry_interval
+                continue
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.retry_max)
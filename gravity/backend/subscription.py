@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Sequence, Set, Union
+
+from gravity.action import _action_keys
+from gravity.backend.metrics import get_metrics
+from gravity.catalog import get_catalog
+from gravity.project import _project_keys
+
+subscription_topics = ['catalog', 'worklogs']
+
+# Events published after successful catalog writes, derived from the requests' payloads
+_catalog_events: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    'insert_projects': lambda payload: {'event': 'projects_added', 'projects': [
+        {k: x.get(k) for k in _project_keys} for x in payload.get('projects', [])]},
+    'remove_projects': lambda payload: {'event': 'projects_removed', 'projects': list(payload.get('projects', []))},
+    'annotate_project': lambda payload: {'event': 'project_annotated', 'project': {
+        'project_id': payload['annotation'].get('project'), 'project_key': payload['annotation'].get('key')}},
+    'insert_actions': lambda payload: {'event': 'actions_added', 'actions': [
+        {k: x.get(k) for k in _action_keys} for x in payload.get('actions', [])]},
+    'remove_actions': lambda payload: {'event': 'actions_removed', 'actions': list(payload.get('actions', []))}
+}
+
+
+class Subscriber(object):
+    """Events queued for a single subscription, which ends once `None` has been queued"""
+
+    def __init__(self, connection: Any, topics: Sequence[str], queue_size: int) -> None:
+        self.connection = connection
+        self.topics = set(topics)
+        self.queue_size = queue_size
+
+        # The queue is bounded by `put`, so that ending a subscription never blocks on a full queue
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def put(self, event: Union[Dict[str, Any], None]) -> bool:
+        if event is not None and self.queue.qsize() >= self.queue_size:
+            return False
+
+        self.queue.put_nowait(event)
+
+        return True
+
+
+class Subscriptions(object):
+    """Push catalog changes and newly recorded worklogs to subscribed WebSocket clients
+
+    Publishing never waits for subscribers: every subscriber has a bounded queue, and a subscriber whose queue is full
+    has fallen too far behind. Its connection is then closed, since it has missed events, and has to resubscribe and
+    fetch the catalogs again.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscriber] = set()
+
+    async def listen(self, connection: Any,
+                     topics: Union[Sequence[str], None] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Subscribe a WebSocket connection to topics, yielding events until the connection is closed"""
+        topics = topics or subscription_topics
+
+        assert set(topics) <= set(subscription_topics), \
+            f'Subscription topics are not one of: {", ".join(subscription_topics)}'
+
+        subscriber = Subscriber(connection, topics, self.queue_size)
+        self.subscribers.add(subscriber)
+
+        try:
+            # Acknowledge the subscription, and tell clients which catalog version the events apply to
+            yield {'event': 'subscribed', 'topics': sorted(subscriber.topics), 'version': get_catalog().version}
+
+            while True:
+                event = await subscriber.queue.get()
+
+                if event is None:
+                    break
+
+                yield event
+
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, topic: str, event: Dict[str, Any]) -> None:
+        for subscriber in [x for x in self.subscribers if topic in x.topics]:
+            if not subscriber.put(event):
+                self.drop(subscriber)
+
+    def drop(self, subscriber: Subscriber) -> None:
+        logging.warning('Dropping subscriber which has fallen %d events behind', subscriber.queue_size)
+        get_metrics().increment('gravity_subscribers_dropped_total', 'subscribe') if get_metrics().enabled else None
+
+        self.subscribers.discard(subscriber)
+        subscriber.put(None)
+        asyncio.ensure_future(subscriber.connection.close(code=1013, reason='Subscriber has fallen behind'))
+
+    def disconnect(self, connection: Any) -> None:
+        """End all subscriptions of a connection which has been closed"""
+        for subscriber in [x for x in self.subscribers if x.connection is connection]:
+            self.subscribers.discard(subscriber)
+            subscriber.put(None)
+
+    def publish_catalog(self, request: str, payload: Dict[str, Any]) -> None:
+        if request in _catalog_events and self.subscribers:
+            self.publish('catalog', {**_catalog_events[request](payload), 'version': get_catalog().version})
+
+    def publish_catalog_changed(self) -> None:
+        """Tell subscribers that the catalog has been changed by another server worker, and needs to be fetched"""
+        self.publish('catalog', {'event': 'catalog_changed', 'version': get_catalog().version})
+
+    def publish_worklogs(self, rows: List[Dict[str, Any]]) -> None:
+        if self.subscribers:
+            self.publish('worklogs', {'event': 'worklogs_added', 'worklogs': [
+                {**x, 'timestamp': x['timestamp'].isoformat()} if isinstance(x['timestamp'], datetime) else x
+                for x in rows]})
@@ -1,95 +1,304 @@
 import csv
+import glob
+import json
 import logging
 import os
-from datetime import datetime
-from typing import Dict, Any
-
-from sqlalchemy import event
+from threading import Lock, Timer
+from typing import Any, Dict, List, Sequence, Tuple, Union
 
 from gravity.config import BaseConfig
 from gravity.database import get_engine
 from gravity.model import worklog
 
 
-def csv_writer(row: Dict[str, Any], config: BaseConfig) -> None:
+# Persistent CSV writers, keyed on output file and format
+_csv_writers: Dict[Tuple[str, str, str], 'CsvWriter'] = {}
+_writers_lock = Lock()
+
+# Persistent journal writers, keyed on output file
+_journal_writers: Dict[str, 'JournalWriter'] = {}
+
+
+def csv_quoting(quoting: str) -> int:
+    if quoting == 'all':
+        return csv.QUOTE_ALL
+    elif quoting == 'minimal':
+        return csv.QUOTE_MINIMAL
+    elif quoting == 'nonnumeric':
+        return csv.QUOTE_NONNUMERIC
+    elif quoting == 'none':
+        return csv.QUOTE_NONE
+
+
+class CsvWriter(object):
+    """Append worklogs to a CSV file that is kept open, allocating sequential worklog_ids from an in-memory counter
+
+    NB: The counter is recovered from the file's last row once, so the file must not be appended to by anyone else
+    """
+
+    def __init__(self, output: str, delimiter: str, quoting: str) -> None:
+        self.output = output
+        self.delimiter = delimiter
+        self.quoting = csv_quoting(quoting)
+
+        self._lock = Lock()
+        self._file = open(output, mode='a+', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(
+            self._file,
+            fieldnames=[x.name for x in worklog.columns],
+            delimiter=self.delimiter,
+            quoting=self.quoting)
+
+        if self._file.tell() == 0:
+            self._writer.writeheader()
+            self._file.flush()
+
+        self.worklog_id = self._recover_worklog_id()
+
+    def _read_last_line(self, block_size: int = 4096) -> str:
+        """Read the last non-empty line of the output file by seeking backwards from its end"""
+        with open(self.output, mode='rb') as infile:
+            position = infile.seek(0, os.SEEK_END)
+            data = b''
+
+            while position > 0 and data.strip().count(b'\n') < 1:
+                step = min(block_size, position)
+                position -= step
+                infile.seek(position)
+                data = infile.read(step) + data
+
+        return data.strip().rsplit(b'\n', 1)[-1].decode('utf-8')
+
+    def _recover_worklog_id(self) -> int:
+        line = self._read_last_line()
+        row = next(csv.reader([line], delimiter=self.delimiter, quoting=self.quoting), [])
+
+        try:
+            return int(float(row[0]))
+        except (IndexError, ValueError):
+            # Only the header (or nothing at all) has been written so far
+            return 0
+
+    def write(self, rows: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                self.worklog_id += 1
+                _row = {**row, 'worklog_id': self.worklog_id, 'timestamp': row['timestamp'].isoformat()}
+                self._writer.writerow(_row)
+
+            self._file.flush()
+
+    def append(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Write worklogs which already carry their worklog_id, e.g. when migrating from another backend"""
+        with self._lock:
+            for row in rows:
+                assert row['worklog_id'] > self.worklog_id, f'Worklog {row["worklog_id"]} has already been written'
+
+                self.worklog_id = row['worklog_id']
+                self._writer.writerow({**row, 'timestamp': row['timestamp'].isoformat()})
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def journal_files(output: str) -> List[str]:
+    """List a journal's files in the order in which they were written: rotated files first, then the current one"""
+    rotated = sorted(x for x in glob.glob(f'{glob.escape(output)}.*') if x.rsplit('.', 1)[-1].isdigit())
+
+    return [*rotated, output] if os.path.isfile(output) else rotated
+
+
+class JournalWriter(object):
+    """Append worklogs to a journal of JSON records, one per line, rotating the file once it exceeds a given size
+
+    Records are handed to the operating system upon every write, so that they survive the server process crashing.
+    Whether they also survive the machine crashing depends on the fsync policy: records are synced upon every write,
+    at most `fsync_interval` milliseconds after being written, or only once the journal is closed.
+    """
+
+    def __init__(self, output: str, fsync: str, fsync_interval: float, max_size: int) -> None:
+        self.output = output
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval / 1000
+        self.max_size = max_size
+
+        self._lock = Lock()
+        self._timer: Union[Timer, None] = None
+        self._file = open(output, mode='a', encoding='utf-8')
+
+        # Terminate a record cut short by a crash, so that it does not swallow the next one
+        if self._file.tell() > 0 and _read_last_byte(output) != b'\n':
+            self._file.write('\n')
+
+        self.worklog_id = self._recover_worklog_id()
+
+    def _recover_worklog_id(self) -> int:
+        for filename in reversed(journal_files(self.output)):
+            lines = _read_last_lines(filename)
+
+            for line in reversed(lines):
+                try:
+                    return int(json.loads(line)['worklog_id'])
+                except (ValueError, KeyError):
+                    # A partially written record, e.g. after a crash
+                    continue
+
+        return 0
+
+    def _sync(self) -> None:
+        with self._lock:
+            self._timer = None
+
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def _rotate(self) -> None:
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        rotated = journal_files(self.output)[:-1]
+        sequence = int(rotated[-1].rsplit('.', 1)[-1]) + 1 if rotated else 1
+
+        os.rename(self.output, f'{self.output}.{sequence:06d}')
+        self._file = open(self.output, mode='a', encoding='utf-8')
+
+    def _write(self, records: Sequence[Dict[str, Any]]) -> None:
+        self._file.write(''.join(json.dumps({**x, 'timestamp': x['timestamp'].isoformat()}) + '\n' for x in records))
+        self._file.flush()
+
+        if self.fsync == 'write':
+            os.fsync(self._file.fileno())
+        elif self.fsync == 'interval' and self._timer is None:
+            self._timer = Timer(self.fsync_interval, self._sync)
+            self._timer.daemon = True
+            self._timer.start()
+
+        if self.max_size and self._file.tell() >= self.max_size:
+            self._rotate()
+
+    def write(self, rows: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            records = [{**x, 'worklog_id': self.worklog_id + i} for i, x in enumerate(rows, start=1)]
+
+            self._write(records)
+            self.worklog_id += len(records)
+
+    def append(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Write worklogs which already carry their worklog_id, e.g. when migrating from another backend"""
+        with self._lock:
+            for row in rows:
+                assert row['worklog_id'] > self.worklog_id, f'Worklog {row["worklog_id"]} has already been written'
+                self.worklog_id = row['worklog_id']
+
+            self._write(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
+def _read_last_byte(filename: str) -> bytes:
+    with open(filename, mode='rb') as infile:
+        infile.seek(-1, os.SEEK_END)
+        return infile.read(1)
+
+
+def _read_last_lines(filename: str, block_size: int = 4096) -> List[str]:
+    """Read the last few lines of a file by seeking backwards from its end"""
+    with open(filename, mode='rb') as infile:
+        position = infile.seek(0, os.SEEK_END)
+        data = b''
+
+        while position > 0 and data.strip().count(b'\n') < 2:
+            step = min(block_size, position)
+            position -= step
+            infile.seek(position)
+            data = infile.read(step) + data
+
+    return [x.decode('utf-8', errors='replace') for x in data.strip().split(b'\n') if x.strip()]
+
+
+def get_journal_writer(config: BaseConfig) -> JournalWriter:
+    key = os.path.abspath(config.journal.output)
+
+    with _writers_lock:
+        if key not in _journal_writers:
+            _journal_writers[key] = JournalWriter(config.journal.output, config.journal.fsync,
+                                                  config.journal.fsync_interval, config.journal.max_size)
+
+        return _journal_writers[key]
+
+
+def get_csv_writer(config: BaseConfig) -> CsvWriter:
+    key = (os.path.abspath(config.csv.output), config.csv.delimiter, config.csv.quoting)
+
+    with _writers_lock:
+        if key not in _csv_writers:
+            _csv_writers[key] = CsvWriter(config.csv.output, config.csv.delimiter, config.csv.quoting)
+
+        return _csv_writers[key]
+
+
+def close_writers() -> None:
+    """Close all persistent writers, e.g. upon server shutdown"""
+    with _writers_lock:
+        for writer in [*_csv_writers.values(), *_journal_writers.values()]:
+            writer.close()
+
+        _csv_writers.clear()
+        _journal_writers.clear()
+
+
+def csv_writer(rows: Sequence[Dict[str, Any]], config: BaseConfig) -> None:
     try:
-        # Calculate number of rows in the CSV file to generate a sequential worklog_id
-        # NB: Unlike database sequences, this id will be off by n if we delete n rows
-        if os.path.isfile(config.csv.output):
-            with open(config.csv.output, mode='rb') as infile:
-                offset = sum(1 for _ in infile) - 1
-        else:
-            offset = 0
-
-        with open(config.csv.output, mode='a+', encoding='utf-8', newline='') as outfile:
-            if config.csv.quoting == 'all':
-                _quoting = csv.QUOTE_ALL
-            elif config.csv.quoting == 'minimal':
-                _quoting = csv.QUOTE_MINIMAL
-            elif config.csv.quoting == 'nonnumeric':
-                _quoting = csv.QUOTE_NONNUMERIC
-            elif config.csv.quoting == 'none':
-                _quoting = csv.QUOTE_NONE
-
-            writer = csv.DictWriter(
-                outfile,
-                fieldnames=[x.name for x in worklog.columns],
-                delimiter=config.csv.delimiter,
-                quoting=_quoting)
-
-            if os.stat(config.csv.output).st_size == 0:
-                writer.writeheader()
-
-            _row = {'worklog_id': offset + 1, **row, 'timestamp': datetime.now().isoformat()}
-
-            writer.writerow(_row)
+        get_csv_writer(config).write(rows)
 
     except Exception as e:
         logging.error(str(e))
         raise e
 
 
-def log_writer(row: Dict[str, Any], config: BaseConfig) -> None:
-    pass
+def log_writer(rows: Sequence[Dict[str, Any]], config: BaseConfig) -> None:
+    try:
+        get_journal_writer(config).write(rows)
 
+    except Exception as e:
+        logging.error(str(e))
+        raise e
 
-def postgresql_writer(row: Dict[str, Any], config: BaseConfig) -> None:
+
+def postgresql_writer(rows: Sequence[Dict[str, Any]], config: BaseConfig) -> None:
     try:
         engine = get_engine(config)
 
         with engine.begin() as connection:
-            connection.execute(worklog.insert(), row)
+            connection.execute(worklog.insert(), rows)
 
     except Exception as e:
         logging.error(str(e))
         raise e
 
 
-def sqlite_writer(row: Dict[str, Any], config: BaseConfig) -> None:
+def sqlite_writer(rows: Sequence[Dict[str, Any]], config: BaseConfig) -> None:
     database = config.sqlite.database
 
     try:
         assert os.path.isfile(database), 'Database file {database} does not exist'
         engine = get_engine(config)
 
-        # Override pysqlite's default transaction behaviour
-        # cf. https://docs.sqlalchemy.org/en/latest/dialects/sqlite.html
-        @event.listens_for(engine, "connect")
-        def do_connect(dbapi_connection, connection_record):
-            # disable pysqlite's emitting of the BEGIN statement entirely.
-            # also stops it from emitting COMMIT before any DDL.
-            dbapi_connection.isolation_level = None
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA foreign_keys=ON")
-            cursor.close()
-
-        @event.listens_for(engine, "begin")
-        def do_begin(connection):
-            # emit our own BEGIN
-            connection.execute("BEGIN EXCLUSIVE")
-
         with engine.begin() as connection:
-            connection.execute(worklog.insert(), row)
+            connection.execute(worklog.insert(), rows)
 
     except Exception as e:
         logging.error(str(e))
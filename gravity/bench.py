@@ -0,0 +1,225 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import websockets
+
+import gravity.database
+from gravity.action import insert_actions
+from gravity.backend.client import ClientSession
+from gravity.backend.server import start_listener
+from gravity.catalog import get_catalog
+from gravity.config import BaseConfig
+from gravity.model import action, project, worklog
+from gravity.project import insert_projects
+
+_projects = [{'project_id': f'bench-project-{x}', 'project_name': f'Project {x}'} for x in range(20)]
+_actions = [{'action_id': f'bench-action-{x}', 'action_name': f'Action {x}'} for x in range(4)]
+
+
+class _WebsocketClient(object):
+    """Websocket counterpart to ClientSession, issuing one request at a time"""
+
+    def __init__(self, config: BaseConfig) -> None:
+        self.config = config
+        self._websocket = None
+
+    async def connect(self) -> None:
+        self._websocket = await websockets.connect(f'ws://{self.config.tcp.host}:{self.config.tcp.port}')
+
+    async def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        await self._websocket.send(json.dumps(message))
+        return json.loads(await self._websocket.recv())
+
+    async def close(self) -> None:
+        await self._websocket.close()
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as _socket:
+        _socket.bind((host, 0))
+        return _socket.getsockname()[1]
+
+
+def _percentile(latencies: Sequence[float], percentile: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+
+    return statistics.quantiles(latencies, n=100, method='inclusive')[percentile - 1]
+
+
+@contextlib.contextmanager
+def _overrides(config: BaseConfig, overrides: Sequence[Tuple[str, str, Any]]):
+    for group, name, value in overrides:
+        config.set_override(name=name, override=value, group=group)
+
+    try:
+        yield config
+    finally:
+        for group, name, _ in overrides:
+            config.clear_override(name=name, group=group)
+
+
+def _prepare_backend(config: BaseConfig) -> None:
+    """Initialise storage for a benchmark run, and seed it with synthetic projects and actions"""
+    get_catalog().invalidate()
+
+    if config.backend.driver in gravity.database.database_backends:
+        gravity.database.initialise(config)
+
+        insert_projects(_projects, config)
+        insert_actions(_actions, config)
+
+    else:
+        for filename, rows in [(config.main.projects, _projects), (config.main.actions, _actions)]:
+            with open(filename, mode='w', encoding='utf-8') as outfile:
+                json.dump(rows, outfile)
+
+
+def _cleanup_backend(config: BaseConfig) -> None:
+    """Remove synthetic rows, since PostgreSQL benchmarks run against a (non-temporary) database"""
+    get_catalog().invalidate()
+
+    if config.backend.driver in gravity.database.database_backends:
+        engine = gravity.database.get_engine(config)
+
+        with engine.begin() as connection:
+            connection.execute(worklog.delete().where(worklog.c.project_id.in_([x['project_id'] for x in _projects])))
+            connection.execute(project.delete().where(project.c.project_id.in_([x['project_id'] for x in _projects])))
+            connection.execute(action.delete().where(action.c.action_id.in_([x['action_id'] for x in _actions])))
+
+        gravity.database.dispose_engines()
+
+
+async def _run_client(config: BaseConfig, requests: int, writes: float, seed: int) -> Tuple[List[float], int]:
+    """Issue a random mix of add_worklog and get_data requests, returning request latencies and the error count"""
+    _random = random.Random(seed)
+    client = _WebsocketClient(config) if config.socket.type == 'websockets' else ClientSession(config)
+    latencies, errors = [], 0
+
+    await client.connect()
+
+    try:
+        for _ in range(requests):
+            if _random.random() < writes:
+                _worklog = {'project_id': _random.choice(_projects)['project_id'],
+                            'action_id': _random.choice(_actions)['action_id']}
+                message = {'request': 'add_worklog', 'payload': {'worklog': _worklog}}
+            else:
+                message = {'request': 'get_data'}
+
+            start = perf_counter()
+            response = await client.request(message)
+            latencies.append(perf_counter() - start)
+
+            errors += 1 if isinstance(response.get('response'), dict) and 'error' in response['response'] else 0
+
+    finally:
+        await client.close()
+
+    return latencies, errors
+
+
+async def _wait_for_server(config: BaseConfig, server: asyncio.Future, timeout: float = 10) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while True:
+        assert not server.done(), f'Server exited prematurely: {server.exception() or "no error"}'
+        assert loop.time() < deadline, 'Server did not start in time'
+
+        try:
+            if config.socket.type == 'unix':
+                _, writer = await asyncio.open_unix_connection(path=config.unix.socket)
+            else:
+                _, writer = await asyncio.open_connection(host=config.tcp.host, port=config.tcp.port)
+
+            writer.close()
+            return
+
+        except OSError:
+            await asyncio.sleep(0.05)
+
+
+async def _run_scenario(config: BaseConfig, clients: int, requests: int, writes: float) -> Dict[str, Any]:
+    server = asyncio.ensure_future(start_listener(config))
+
+    try:
+        await _wait_for_server(config, server)
+
+        start = perf_counter()
+        results = await asyncio.gather(*[_run_client(config, requests, writes, seed) for seed in range(clients)])
+        duration = perf_counter() - start
+
+    finally:
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+    latencies = sorted(x for _latencies, _ in results for x in _latencies)
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(x for _, x in results),
+        'duration': round(duration, 3),
+        'requests_per_second': round(len(latencies) / duration, 1) if duration > 0 else None,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50) * 1000, 3),
+            'p95': round(_percentile(latencies, 95) * 1000, 3),
+            'p99': round(_percentile(latencies, 99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0
+        }
+    }
+
+
+def run_benchmark(config: BaseConfig, transports: Sequence[str], backends: Sequence[str], clients: int = 8,
+                  requests: int = 100, writes: float = 0.5, database: Union[str, None] = None) -> List[Dict[str, Any]]:
+    """Benchmark an in-process server for each combination of transport and storage backend
+
+    PostgreSQL backends are only benchmarked against an explicitly given database, never the configured one.
+    """
+    assert database is not None or not set(backends) & {'postgresql', 'postgresql-async'}, \
+        'PostgreSQL benchmarks write to their database, so pass a dedicated one via --database'
+
+    results = []
+
+    for backend in backends:
+        for transport in transports:
+            with tempfile.TemporaryDirectory(prefix='gravity-bench-') as directory:
+                overrides = [
+                    ('socket', 'type', transport),
+                    ('backend', 'driver', backend),
+                    ('tcp', 'port', _free_port(config.tcp.host)),
+                    ('unix', 'socket', os.path.join(directory, 'gravity.sock')),
+                    ('sqlite', 'database', os.path.join(directory, 'gravity_bench.sqlite')),
+                    ('csv', 'output', os.path.join(directory, 'gravity_bench.csv')),
+                    ('journal', 'output', os.path.join(directory, 'gravity_bench.jsonl')),
+                    ('main', 'projects', os.path.join(directory, 'gravity_projects.json')),
+                    ('main', 'actions', os.path.join(directory, 'gravity_actions.json'))
+                ]
+                overrides += [('postgresql', 'database', database)] if database is not None else []
+
+                with _overrides(config, overrides), open(os.devnull, mode='w') as devnull:
+                    _prepare_backend(config)
+
+                    # Keep the stdout backend from drowning the benchmark's own output
+                    try:
+                        with contextlib.redirect_stdout(devnull if backend == 'stdout' else sys.stdout):
+                            result = asyncio.run(_run_scenario(config, clients, requests, writes))
+                    finally:
+                        _cleanup_backend(config)
+
+            results.append({'transport': transport, 'backend': backend, 'clients': clients, **result})
+
+    return results
+
+
+def print_benchmark(results: Sequence[Dict[str, Any]]) -> None:
+    print(json.dumps(results, indent=4))
@@ -0,0 +1,168 @@
+from threading import RLock
+from typing import Any, Dict, List, Sequence, Union
+from uuid import uuid4
+
+
+class Catalog(object):
+    """In-memory copy of active projects and actions, kept up to date by the server's write paths
+
+    Every change increments the catalog version, which clients can pass back to skip downloading unchanged catalogs.
+    Loading the cache does not count as a change, since it merely reflects the storage backend. Versions are prefixed
+    with an epoch chosen at startup, so that a version handed out before a server restart never matches a later one.
+
+    Server worker processes share the catalog version via a counter in shared memory, so that each worker notices
+    changes made by the others, and drops its cache before serving the next request. They also share the epoch of the
+    supervisor which forked them, so that their versions match.
+    """
+
+    def __init__(self) -> None:
+        self._lock = RLock()
+        self._projects: Union[Dict[str, Dict[str, Any]], None] = None
+        self._actions: Union[Dict[str, Dict[str, Any]], None] = None
+        self._epoch = uuid4().hex
+        self._version = 0
+        self._generation = None
+        self._seen = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._projects is not None and self._actions is not None
+
+    @property
+    def shared(self) -> bool:
+        return self._generation is not None
+
+    @property
+    def version(self) -> str:
+        return f'{self._epoch}:{self._generation.value if self._generation is not None else self._version}'
+
+    def share(self, generation, epoch: Union[str, None] = None) -> None:
+        """Share the catalog version with other processes via a multiprocessing.Value, e.g. between server workers
+
+        Passing None stops sharing it. Processes sharing the version must also pass the same epoch.
+        """
+        with self._lock:
+            self._generation = generation
+            self._seen = generation.value if generation is not None else 0
+
+            if epoch is not None:
+                self._epoch = epoch
+
+    def sync(self) -> bool:
+        """Drop the cache if another process has changed the catalog since this one last looked, returning whether"""
+        if self._generation is None or self._generation.value == self._seen:
+            return False
+
+        with self._lock:
+            self._projects = None
+            self._actions = None
+            self._seen = self._generation.value
+
+        return True
+
+    def _changed(self) -> None:
+        if self._generation is None:
+            self._version += 1
+            return
+
+        with self._generation.get_lock():
+            # Changes made by other processes since the last sync are missing from this cache, so drop it
+            if self._generation.value != self._seen:
+                self._projects = None
+                self._actions = None
+
+            self._generation.value += 1
+            self._seen = self._generation.value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._projects = None
+            self._actions = None
+            self._changed()
+
+    # projects
+    def has_projects(self) -> bool:
+        return self._projects is not None
+
+    def get_projects(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(x) for x in self._projects.values()]
+
+    def get_project(self, project_id: str) -> Union[Dict[str, Any], None]:
+        with self._lock:
+            _project = self._projects.get(project_id)
+
+            return dict(_project) if _project is not None else None
+
+    def set_projects(self, projects: Sequence[Dict[str, Any]], version: Union[str, None] = None) -> bool:
+        """Fill the cache, unless the catalog has changed since `version`, i.e. while loading, returning whether"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+
+            self._projects = {x['project_id']: dict(x) for x in projects}
+
+            return True
+
+    def put_projects(self, projects: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            if self._projects is not None:
+                self._projects.update({x['project_id']: dict(x) for x in projects})
+
+            self._changed()
+
+    def update_project(self, project_id: str, values: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._projects is not None and project_id in self._projects:
+                self._projects[project_id].update(values)
+
+            self._changed()
+
+    def remove_projects(self, project_ids: Sequence[str]) -> None:
+        with self._lock:
+            if self._projects is not None:
+                for project_id in project_ids:
+                    self._projects.pop(project_id, None)
+
+            self._changed()
+
+    # actions
+    def has_actions(self) -> bool:
+        return self._actions is not None
+
+    def get_actions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(x) for x in self._actions.values()]
+
+    def set_actions(self, actions: Sequence[Dict[str, Any]], version: Union[str, None] = None) -> bool:
+        """Fill the cache, unless the catalog has changed since `version`, i.e. while loading, returning whether"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+
+            self._actions = {x['action_id']: dict(x) for x in actions}
+
+            return True
+
+    def put_actions(self, actions: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            if self._actions is not None:
+                self._actions.update({x['action_id']: dict(x) for x in actions})
+
+            self._changed()
+
+    def remove_actions(self, action_ids: Sequence[str]) -> None:
+        with self._lock:
+            if self._actions is not None:
+                for action_id in action_ids:
+                    self._actions.pop(action_id, None)
+
+            self._changed()
+
+
+_catalog = Catalog()
+
+
+def get_catalog() -> Catalog:
+    """Return the process-wide catalog cache"""
+    return _catalog
@@ -0,0 +1,68 @@
+import logging
+import os.path
+from typing import Any, Dict, List, Union
+
+from sqlalchemy import Table, func, select
+
+from gravity.action import _action_keys, load_actions
+from gravity.config import BaseConfig
+from gravity.database import database_backends, get_engine
+from gravity.model import action, catalog_sequence, project
+from gravity.project import _project_keys, load_projects
+
+
+def _changed_rows(connection, table: Table, keys: List[str], since: Union[int, None],
+                  until: int) -> List[Dict[str, Any]]:
+    if since is None:
+        query = table.select().where(table.c.deleted == None)
+    else:
+        query = table.select().where(table.c.change_sequence > since).where(table.c.change_sequence <= until)
+
+    return [{**{k: x[k] for k in keys}, 'deleted': x['deleted'] is not None} for x in connection.execute(query)]
+
+
+def _file_changes(config: BaseConfig, sequence: Union[int, None]) -> Dict[str, Any]:
+    """File backends keep no change sequence, so send the whole catalog whenever either file has been modified"""
+    _sequence = max([os.stat(x).st_mtime_ns // 1000 for x in [config.main.projects, config.main.actions]
+                     if os.path.isfile(x)], default=0)
+
+    if sequence is not None and sequence >= _sequence:
+        return {'sequence': sequence, 'full': False, 'projects': [], 'actions': []}
+
+    return {'sequence': _sequence, 'full': True, 'projects': [{**x, 'deleted': False} for x in load_projects(config)],
+            'actions': [{**x, 'deleted': False} for x in load_actions(config)]}
+
+
+def get_changes_since(sequence: Union[int, None], config: BaseConfig) -> Dict[str, Any]:
+    """Return projects and actions changed after a change sequence number, or all active ones if none is given
+
+    Every change to projects and actions takes the next number of a counter in the database, in the order in which
+    changes are committed, and removed rows are flagged as `deleted`. Clients pass back the returned `sequence` to only
+    receive subsequent changes, and compare the returned `count` of active rows with their own copy to notice rows
+    removed by `gravity database --prune`. Sequence numbers ahead of the server's, e.g. of a restored database, cannot
+    be resumed from, and are answered with all active rows.
+    """
+    try:
+        if config.backend.driver not in database_backends:
+            return _file_changes(config, sequence)
+
+        with get_engine(config).connect() as connection:
+            # Changes numbered up to the current sequence number have all been committed, so read them after it
+            current = connection.execute(select([catalog_sequence.c.sequence])).scalar() or 0
+            full = sequence is None or sequence > current
+            since = None if full else sequence
+
+            # Descriptions are not part of the server's catalog, but let clients search projects by them
+            projects = _changed_rows(connection, project, [*_project_keys, 'description'], since, current)
+            actions = _changed_rows(connection, action, _action_keys, since, current)
+
+            count = {
+                'projects': connection.execute(select([func.count()]).where(project.c.deleted == None)).scalar(),
+                'actions': connection.execute(select([func.count()]).where(action.c.deleted == None)).scalar()
+            }
+
+        return {'sequence': current, 'full': full, 'projects': projects, 'actions': actions, 'count': count}
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
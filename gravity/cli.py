@@ -0,0 +1,96 @@
+import json
+import logging
+import os.path
+from typing import Any, Dict, Sequence
+from uuid import uuid4
+
+# Client-side helpers of the command line interface, which prepare requests and print responses. Client commands only
+# import this module and the socket client, so it must not depend on the storage backend, i.e. SQLAlchemy.
+
+
+def add_projects(projects: Sequence[str]) -> Sequence[Dict[str, str]]:
+    try:
+        # Explicitly cast uuid4 objects to str, since sqlite doesn't take kindly to any other form
+        # NB: postgresql has a native UUID datatype, but for portability's sake, we use TEXT instead
+        _projects = [dict(project_id=str(uuid4()), project_name=project) for project in projects]
+
+        return _projects
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+def import_projects(filename: str) -> Sequence[Dict[str, str]]:
+    try:
+        assert os.path.isfile(filename), f'Projects file "{filename}" does not exist'
+
+        with open(filename, mode='r', encoding='utf-8') as infile:
+            _projects = json.load(infile)
+
+        return _projects
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+def list_projects(projects: Sequence[Dict[str, str]]) -> None:
+    for _project in projects:
+        print(f'{_project["project_id"]}\t{_project["project_name"]}')
+
+
+def export_projects(projects: Sequence[Dict[str, str]]) -> None:
+    keys = ['project_id', 'project_name', 'project_key']
+
+    _projects = [{k: v for k, v in p.items() if k in keys} for p in projects]
+
+    print(json.dumps(_projects, indent=4))
+
+
+def add_actions(actions: Sequence[str]) -> Sequence[Dict[str, str]]:
+    try:
+        # Explicitly cast uuid4 objects to str, since sqlite doesn't take kindly to any other form
+        # NB: postgresql has a native UUID datatype, but for portability's sake, we use TEXT instead
+        _actions = [dict(action_id=str(uuid4()), action_name=action) for action in actions]
+
+        return _actions
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+def import_actions(filename: str) -> Sequence[Dict[str, str]]:
+    try:
+        assert os.path.isfile(filename), f'Actions file "{filename}" does not exist'
+
+        with open(filename, mode='r', encoding='utf-8') as infile:
+            _actions = json.load(infile)
+
+        return _actions
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+def list_actions(actions: Sequence[Dict[str, str]]) -> None:
+    for _action in actions:
+        print(f'{_action["action_id"]}\t{_action["action_name"]}')
+
+
+def export_actions(actions: Sequence[Dict[str, str]]) -> None:
+    keys = ['action_id', 'action_name']
+
+    _actions = [{k: v for k, v in p.items() if k in keys} for p in actions]
+
+    print(json.dumps(_actions, indent=4))
+
+
+def print_report(rows: Sequence[Dict[str, Any]]) -> None:
+    for row in rows:
+        hours, remainder = divmod(int(row['seconds']), 3600)
+        columns = [str(v) if v is not None else '' for k, v in row.items() if k not in ['seconds', 'worklogs']]
+
+        print('\t'.join([*columns, f'{hours}:{remainder // 60:02d}']))
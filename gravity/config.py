@@ -1,5 +1,5 @@
 import argparse
-from typing import Sequence, Tuple
+from typing import Any, Sequence, Tuple
 
 from oslo_config import cfg
 
@@ -13,6 +13,16 @@ _quote_choices = [
     ('none', 'Do not quote any fields, only escape delimiters'),
 ]
 
+_journal_mode_choices = ['delete', 'truncate', 'persist', 'memory', 'wal', 'off']
+
+_synchronous_choices = ['off', 'normal', 'full', 'extra']
+
+_begin_choices = [
+    ('deferred', 'Acquire locks once a transaction first reads or writes'),
+    ('immediate', 'Acquire the write lock when a transaction starts, without blocking readers in WAL mode'),
+    ('exclusive', 'Acquire an exclusive lock when a transaction starts, blocking readers and writers'),
+]
+
 _frontend_choices = [
     ('cli', 'Command-line interface to log events'),
     ('curses', 'Curses-based interface to log events'),
@@ -24,23 +34,49 @@ _socket_choices = [
     ('websockets', 'Use a WebSocket to communicate with the server'),
 ]
 
+_executor_choices = [
+    ('inline', 'Run request handlers on the event loop'),
+    ('thread', 'Run request handlers in a bounded thread pool'),
+]
+
+_fsync_choices = [
+    ('write', 'Sync the journal to disk upon every write'),
+    ('interval', 'Sync the journal to disk at most fsync_interval milliseconds after a write'),
+    ('shutdown', 'Only sync the journal to disk when the server shuts down'),
+]
+
+_framing_choices = [
+    ('line', 'Send newline-delimited JSON messages'),
+    ('length', 'Send length-prefixed frames, using the negotiated encoding'),
+]
+
+_encoding_choices = [
+    ('json', 'Encode messages as JSON'),
+    ('msgpack', 'Encode messages as MessagePack, if available'),
+]
+
 _backend_choices = [
     ('stdout', 'Print events to stdout'),
     ('csv', 'Write events to a CSV file'),
     ('log', 'Write events to a log file'),
     ('sqlite', 'Write events to a SQLite database'),
     ('postgresql', 'Write events to a PostgreSQL database'),
+    ('postgresql-async', 'Write events to a PostgreSQL database, using asyncpg in the server'),
 ]
 
 # Option groups
 _main_group = cfg.OptGroup(name='main', help='Configure gravity project options.')
 _log_group = cfg.OptGroup(name='log', help='Configure logging options')
 _socket_group = cfg.OptGroup(name='socket', help='Configure client/server socket options.')
+_server_group = cfg.OptGroup(name='server', help='Configure server request handling options.')
+_metrics_group = cfg.OptGroup(name='metrics', help='Configure server metrics options.')
+_spool_group = cfg.OptGroup(name='spool', help='Configure the server\'s durable worklog spool.')
 _tcp_group = cfg.OptGroup(name='tcp', help='Configure TCP socket options.')
 _unix_group = cfg.OptGroup(name='unix', help='Configure UNIX socket options.')
 _frontend_group = cfg.OptGroup(name='frontend', help='Configure client frontend options.')
 _backend_group = cfg.OptGroup(name='backend', help='Configure storage backend options.')
 _csv_group = cfg.OptGroup(name='csv', help='Configure CSV storage backend options.')
+_journal_group = cfg.OptGroup(name='journal', help='Configure log (journal) storage backend options.')
 _sqlite_group = cfg.OptGroup(name='sqlite', help='Configure sqlite storage backend options.')
 _postgresql_group = cfg.OptGroup(name='postgresql', help='Configure postgresql storage backend options.')
 
@@ -54,11 +90,43 @@ _main_opts = [
 _log_opts = [
     cfg.StrOpt(name='level', default='info', help='Log level'),
     cfg.StrOpt(name='file', default='gravity.log', help='Log File'),
-    cfg.ListOpt(name='targets', default=['file', 'console'], help='Log target(s)', bounds=True)
+    cfg.ListOpt(name='targets', default=['file', 'console'], help='Log target(s)', bounds=True),
+    cfg.BoolOpt(name='queue', default=False, help='Write log records from a background thread'),
+    cfg.IntOpt(name='rate_limit', min=0, default=10, help='Errors to log per call site and interval (0: no limit)'),
+    cfg.FloatOpt(name='rate_limit_interval', min=0, default=60, help='Seconds per error rate limit interval')
 ]
 
 _socket_opts = [
-    cfg.StrOpt(name='type', default='tcp', help='Client/server socket type.', choices=_socket_choices, short='t')
+    cfg.StrOpt(name='type', default='tcp', help='Client/server socket type.', choices=_socket_choices, short='t'),
+    cfg.StrOpt(name='framing', default='length', help='Client message framing.', choices=_framing_choices),
+    cfg.StrOpt(name='encoding', default='json', help='Client message encoding.', choices=_encoding_choices),
+    cfg.IntOpt(name='max_frame_size', min=1024, default=2 ** 24, help='Maximum message size in bytes.')
+]
+
+_server_opts = [
+    cfg.StrOpt(name='executor', default='thread', help='Request execution mode', choices=_executor_choices),
+    cfg.IntOpt(name='threads', min=1, default=4, help='Number of threads handling requests'),
+    cfg.IntOpt(name='workers', min=1, default=1, help='Number of server processes sharing the listening socket'),
+    cfg.IntOpt(name='queue_size', min=0, default=64, help='Requests to queue before rejecting new ones'),
+    cfg.FloatOpt(name='request_timeout', min=0, default=30, help='Seconds to wait for a read request (0: no limit)'),
+    cfg.IntOpt(name='batch_size', min=1, default=500, help='Maximum number of worklogs to write per batch'),
+    cfg.FloatOpt(name='batch_linger', min=0, default=5, help='Milliseconds to wait for more worklogs per batch'),
+    cfg.IntOpt(name='subscriber_queue_size', min=1, default=256,
+               help='Events to queue per subscriber before disconnecting it')
+]
+
+_metrics_opts = [
+    cfg.BoolOpt(name='enabled', default=False, help='Record request counts and latencies'),
+    cfg.HostAddressOpt(name='host', default='127.0.0.1', help='Host to serve metrics via HTTP on'),
+    cfg.PortOpt(name='port', min=1, max=65535, default=None, help='Port to serve metrics via HTTP on (unset: none)')
+]
+
+_spool_opts = [
+    cfg.BoolOpt(name='enabled', default=False, help='Acknowledge worklogs once spooled, and write them in background'),
+    cfg.StrOpt(name='path', default='gravity_spool.sqlite', help='Spool database file'),
+    cfg.FloatOpt(name='retry_interval', min=0, default=0.5, help='Seconds to wait before retrying failed writes'),
+    cfg.FloatOpt(name='retry_max', min=0, default=30, help='Maximum seconds to wait between retries'),
+    cfg.IntOpt(name='max_attempts', min=0, default=0, help='Attempts after which to reject a submission (0: never)')
 ]
 
 _tcp_opts = [
@@ -71,7 +139,9 @@ _unix_opts = [
 ]
 
 _frontend_opts = [
-    cfg.StrOpt(name='interface', default='curses', help='Client frontend', choices=_frontend_choices, short='F')
+    cfg.StrOpt(name='interface', default='curses', help='Client frontend', choices=_frontend_choices, short='F'),
+    cfg.BoolOpt(name='cache', default=True, help='Cache projects and actions on disk, only fetching changes'),
+    cfg.StrOpt(name='cache_dir', default=None, help='Catalog cache directory (unset: $XDG_CACHE_HOME/gravity)')
 ]
 
 _backend_opts = [
@@ -84,8 +154,29 @@ _csv_opts = [
     cfg.StrOpt(name='quoting', default='all', help='CSV quoting character', choices=_quote_choices)
 ]
 
+_journal_opts = [
+    cfg.StrOpt(name='output', default='gravity_journal.jsonl', help='Journal output file'),
+    cfg.StrOpt(name='fsync', default='interval', help='Journal fsync policy', choices=_fsync_choices),
+    cfg.FloatOpt(name='fsync_interval', min=0, default=100, help='Milliseconds between journal syncs to disk'),
+    cfg.IntOpt(name='max_size', min=0, default=64 * 2 ** 20, help='Bytes after which to rotate the journal (0: never)')
+]
+
+_pool_opts = [
+    cfg.IntOpt(name='pool_size', min=1, default=5, help='Number of connections to keep open in the pool'),
+    cfg.IntOpt(name='max_overflow', min=-1, default=10, help='Connections to open beyond pool_size (-1: no limit)'),
+    cfg.IntOpt(name='pool_timeout', min=0, default=30, help='Seconds to wait for a connection from the pool'),
+    cfg.BoolOpt(name='pool_pre_ping', default=False, help='Test pooled connections for liveness upon checkout'),
+    cfg.IntOpt(name='pool_recycle', min=-1, default=-1, help='Seconds after which to recycle connections (-1: never)')
+]
+
 _sqlite_opts = [
-    cfg.StrOpt(name='database', default='gravity_storage.sqlite', help='SQLite database file')
+    cfg.StrOpt(name='database', default='gravity_storage.sqlite', help='SQLite database file'),
+    cfg.StrOpt(name='journal_mode', default='wal', help='SQLite journal mode', choices=_journal_mode_choices),
+    cfg.StrOpt(name='synchronous', default='normal', help='SQLite synchronous flag', choices=_synchronous_choices),
+    cfg.IntOpt(name='busy_timeout', min=0, default=5000, help='Milliseconds to wait for a locked database'),
+    cfg.IntOpt(name='mmap_size', min=0, default=0, help='Bytes of the database to memory-map (0: disabled)'),
+    cfg.StrOpt(name='begin', default='immediate', help='SQLite transaction mode', choices=_begin_choices),
+    *_pool_opts
 ]
 
 _postgresql_opts = [
@@ -93,18 +184,23 @@ _postgresql_opts = [
     cfg.PortOpt(name='port', min=1, max=65535, default=5432, help='PostgreSQL port'),
     cfg.StrOpt(name='username', default='postgres', help='PostgreSQL username'),
     cfg.StrOpt(name='password', default='', secret=True, help='PostgreSQL password'),
-    cfg.StrOpt(name='database', default='worklogs', help='PostgreSQL database')
+    cfg.StrOpt(name='database', default='worklogs', help='PostgreSQL database'),
+    *_pool_opts
 ]
 
 _opts = [
     (_main_group, _main_opts),
     (_log_group, _log_opts),
     (_socket_group, _socket_opts),
+    (_server_group, _server_opts),
+    (_metrics_group, _metrics_opts),
+    (_spool_group, _spool_opts),
     (_tcp_group, _tcp_opts),
     (_unix_group, _unix_opts),
     (_frontend_group, _frontend_opts),
     (_backend_group, _backend_opts),
     (_csv_group, _csv_opts),
+    (_journal_group, _journal_opts),
     (_sqlite_group, _sqlite_opts),
     (_postgresql_group, _postgresql_opts)
 ]
@@ -127,6 +223,7 @@ def add_subparsers(subparsers: argparse.Namespace) -> None:
     annotate.add_argument('-k', '--key', metavar='KEY', type=str, help='Project key')
 
     server = subparsers.add_parser('server', help='Start a gravity server instance')
+    server.add_argument('-w', '--workers', type=int, help='Number of server processes (default: [server] workers)')
     # server.add_argument('command', choices=['start', 'stop'])
 
     client = subparsers.add_parser('client', help='Run a gravity client instance')
@@ -145,15 +242,51 @@ def add_subparsers(subparsers: argparse.Namespace) -> None:
     database = subparsers.add_parser('database', help='Configure the backend database')
     # database.add_argument('command', choices=['initialise', 'truncate'])
     _database = database.add_mutually_exclusive_group(required=True)
+    _database.add_argument('-a', '--analyze', action='store_true', help='Show query plans for core queries')
     _database.add_argument('-d', '--drop', action='store_true', help='Drop database tables')
     _database.add_argument('-i', '--initialise', action='store_true', help='Initialise database tables')
+    _database.add_argument('-m', '--migrate', action='store_true', help='Copy all data from one backend to another')
     _database.add_argument('-p', '--prune', action='store_true', help='Prune database tables')
     _database.add_argument('-t', '--truncate', action='store_true', help='Truncate database tables')
+    database.add_argument('--from', dest='source', choices=['csv', 'log', 'sqlite', 'postgresql', 'postgresql-async'],
+                          help='Backend to migrate from')
+    database.add_argument('--to', dest='target', choices=['csv', 'log', 'sqlite', 'postgresql', 'postgresql-async'],
+                          help='Backend to migrate to')
+    database.add_argument('--batch-size', type=int, default=1000, help='Number of worklogs to migrate per batch')
 
     worklog = subparsers.add_parser('worklog', help='Manipulate worklog entries')
     _worklog = worklog.add_mutually_exclusive_group(required=True)
     _worklog.add_argument('-a', '--amend', nargs=argparse.REMAINDER, metavar='WORKLOG', help='Amend last worklog')
+    _worklog.add_argument('-e', '--export', action='store_true', help='Export worklogs')
+    _worklog.add_argument('-i', '--ingest', '--import', metavar='FILE', type=str, help='Import worklogs from CSV')
     _worklog.add_argument('-r', '--remove', action='store_true', help='Remove last worklog')
+    worklog.add_argument('-f', '--format', default='csv', choices=['csv', 'jsonl', 'columnar'],
+                         help='Export format: CSV, JSON lines, or one JSON object of columns per chunk')
+    worklog.add_argument('-o', '--output', metavar='FILE', type=str, help='Export to this file (default: stdout)')
+    worklog.add_argument('-s', '--start', metavar='TIMESTAMP', type=str,
+                         help='Export worklogs from this ISO timestamp')
+    worklog.add_argument('--end', metavar='TIMESTAMP', type=str, help='Export worklogs until this ISO timestamp')
+    worklog.add_argument('-p', '--project', nargs='+', metavar='PROJECT', help='Export worklogs of these project(s)')
+    worklog.add_argument('--chunk-size', type=int, default=1000,
+                         help='Number of worklogs per chunk to export or import')
+
+    report = subparsers.add_parser('report', help='Report time spent per project, action or ticket')
+    report.add_argument('-g', '--group-by', nargs='+', default=['day', 'project'], metavar='GROUPING',
+                        choices=['day', 'week', 'project', 'action', 'ticket'], help='Group time spent by field(s)')
+    report.add_argument('-s', '--start', metavar='TIMESTAMP', type=str, help='Report events from this ISO timestamp')
+    report.add_argument('-e', '--end', metavar='TIMESTAMP', type=str, help='Report events until this ISO timestamp')
+
+    bench = subparsers.add_parser('bench', help='Benchmark an in-process server')
+    bench.add_argument('-t', '--transports', nargs='+', default=['tcp', 'unix', 'websockets'], metavar='TRANSPORT',
+                       choices=[x for x, _ in _socket_choices], help='Socket type(s) to benchmark')
+    bench.add_argument('-b', '--backends', nargs='+', default=['sqlite', 'csv', 'stdout'], metavar='BACKEND',
+                       choices=['sqlite', 'csv', 'log', 'stdout', 'postgresql', 'postgresql-async'],
+                       help='Storage backend(s) to benchmark')
+    bench.add_argument('-c', '--clients', type=int, default=8, help='Number of concurrent clients')
+    bench.add_argument('-n', '--requests', type=int, default=100, help='Number of requests per client')
+    bench.add_argument('-w', '--writes', type=float, default=0.5, help='Share of add_worklog requests, from 0 to 1')
+    bench.add_argument('-d', '--database', metavar='NAME', type=str,
+                       help='PostgreSQL database to benchmark against, required by the postgresql backends')
 
     # Dummy parser to use for testing, making sure that "argument" is still supplied
     _ = subparsers.add_parser('test')
@@ -174,3 +307,9 @@ class BaseConfig(cfg.ConfigOpts):
             self.register_cli_opts(opts, group)
 
         self.register_cli_opt(cfg.SubCommandOpt('argument', handler=add_subparsers))
+
+    def get_override(self, name: str, group: str) -> Tuple[bool, Any]:
+        """Return whether an option has been overridden, and its override"""
+        opt_info = self._get_opt_info(name, group)
+
+        return 'override' in opt_info, opt_info.get('override')
@@ -1,13 +1,24 @@
 import logging
-from typing import Union
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, Tuple, Union
 
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine, url
+from sqlalchemy import create_engine, event, func, inspect, select
+from sqlalchemy.engine import Connection, Engine, url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
 from gravity.config import BaseConfig
-from gravity.model import _metadata
+from gravity.model import _metadata, action, catalog_sequence, project, worklog
+
+# Backends storing data in a database, rather than in files
+database_backends = ['sqlite', 'postgresql', 'postgresql-async']
+
+# Process-wide engine registry, keyed on the backend settings used to create each engine
+_engines: Dict[Tuple[Any, ...], Engine] = {}
+_engines_lock = Lock()
 
 
 # Add support for PostgreSQL IDENTITY columns
@@ -19,15 +30,94 @@ def use_identity(element, compiler, **kw):
     return text
 
 
-def get_engine(config: BaseConfig) -> Union[Engine, None]:
+class Explain(Executable, ClauseElement):
+    """Wrap a statement in order to retrieve its query plan instead of its results"""
+
+    def __init__(self, statement: ClauseElement) -> None:
+        self.statement = statement
+
+
+@compiles(Explain)
+def visit_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN' if compiler.dialect.name == 'sqlite' else 'EXPLAIN'
+    return f'{prefix} {compiler.process(element.statement, **kw)}'
+
+
+class CountingQueuePool(QueuePool):
+    """QueuePool that counts connection checkouts, and checkouts that had to wait for a free connection"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super(CountingQueuePool, self).__init__(*args, **kwargs)
+        self._counter_lock = Lock()
+        self.checkouts = 0
+        self.waits = 0
+
+    def _do_get(self):
+        # QueuePool blocks on its internal queue once all pooled and overflow connections are checked out
+        saturated = self._max_overflow > -1 and self.overflow() >= self._max_overflow and self._pool.empty()
+
+        with self._counter_lock:
+            self.checkouts += 1
+            self.waits += 1 if saturated else 0
+
+        return super(CountingQueuePool, self)._do_get()
+
+
+def _sqlite_settings(config: BaseConfig) -> Dict[str, Any]:
+    return {
+        'pragmas': {
+            'foreign_keys': 'ON',
+            'journal_mode': config.sqlite.journal_mode.upper(),
+            'synchronous': config.sqlite.synchronous.upper(),
+            'busy_timeout': config.sqlite.busy_timeout,
+            'mmap_size': config.sqlite.mmap_size
+        },
+        'begin': f'BEGIN {config.sqlite.begin.upper()}'
+    }
+
+
+def _configure_sqlite(engine: Engine, settings: Dict[str, Any]) -> None:
+    """Register SQLite connection/transaction listeners once per engine"""
+
+    # Override pysqlite's default transaction behaviour
+    # cf. https://docs.sqlalchemy.org/en/latest/dialects/sqlite.html
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        # disable pysqlite's emitting of the BEGIN statement entirely.
+        # also stops it from emitting COMMIT before any DDL.
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma, value in settings['pragmas'].items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def do_begin(connection):
+        # emit our own BEGIN; IMMEDIATE takes the write lock upfront, without locking out WAL readers
+        connection.execute(settings['begin'])
+
+
+def _pool_options(options: Any) -> Dict[str, Any]:
+    return {
+        'poolclass': CountingQueuePool,
+        'pool_size': options.pool_size,
+        'max_overflow': options.max_overflow,
+        'pool_timeout': options.pool_timeout,
+        'pool_pre_ping': options.pool_pre_ping,
+        'pool_recycle': options.pool_recycle
+    }
+
+
+def _engine_settings(config: BaseConfig) -> Union[Tuple[url.URL, Dict[str, Any]], None]:
     backend = config.backend.driver
-    engine = None
 
     if backend == 'sqlite':
         database_url = url.URL('sqlite', database=config.sqlite.database)
-        engine = create_engine(database_url)
+        # Pooled connections may be checked out by a different thread than the one that created them
+        options = {**_pool_options(config.sqlite), 'connect_args': {'check_same_thread': False}}
 
-    elif backend == 'postgresql':
+    # The asynchronous backend still uses psycopg2 for administrative commands and fallback request handlers
+    elif backend in ['postgresql', 'postgresql-async']:
         database_url = url.URL(
             'postgresql+psycopg2',
             username=config.postgresql.username,
@@ -35,11 +125,71 @@ def get_engine(config: BaseConfig) -> Union[Engine, None]:
             host=config.postgresql.hostname,
             port=config.postgresql.port,
             database=config.postgresql.database)
-        engine = create_engine(database_url, client_encoding='utf-8', use_batch_mode=True)
+        options = {**_pool_options(config.postgresql), 'client_encoding': 'utf-8', 'use_batch_mode': True}
+
+    else:
+        return None
+
+    return database_url, options
+
+
+def _engine_key(database_url: url.URL, options: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (str(database_url), *sorted((k, repr(v)) for k, v in options.items()))
+
+
+def get_engine(config: BaseConfig) -> Union[Engine, None]:
+    """Return the process-wide engine for the configured backend, creating it on first use"""
+    settings = _engine_settings(config)
+
+    if settings is None:
+        return None
+
+    database_url, options = settings
+    sqlite_settings = _sqlite_settings(config) if database_url.drivername == 'sqlite' else {}
+    key = _engine_key(database_url, {**options, **sqlite_settings})
+
+    with _engines_lock:
+        engine = _engines.get(key)
+
+        if engine is None:
+            engine = create_engine(database_url, **options)
+
+            if engine.name == 'sqlite':
+                _configure_sqlite(engine, sqlite_settings)
+
+            _engines[key] = engine
 
     return engine
 
 
+def dispose_engines() -> None:
+    """Close all pooled connections and empty the engine registry"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+        _engines.clear()
+
+
+def get_pool_statistics(config: BaseConfig) -> Dict[str, int]:
+    """Return connection pool counters for the configured backend's engine"""
+    engine = get_engine(config)
+
+    if engine is None or not isinstance(engine.pool, CountingQueuePool):
+        return {}
+
+    pool = engine.pool
+
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'checkouts': pool.checkouts,
+        'waits': pool.waits
+    }
+
+
 def drop(config: BaseConfig) -> None:
     try:
         engine = get_engine(config)
@@ -52,6 +202,18 @@ def drop(config: BaseConfig) -> None:
         raise e
 
 
+def next_sequence(connection: Connection) -> int:
+    """Take the next change sequence number for projects and actions, within the transaction changing them
+
+    Incrementing the single counter row locks it until the transaction ends, so that changes are numbered in the order
+    in which they are committed, and no change is visible before all changes with smaller numbers have been committed.
+    """
+    if connection.execute(catalog_sequence.update().values(sequence=catalog_sequence.c.sequence + 1)).rowcount == 0:
+        connection.execute(catalog_sequence.insert().values(sequence_id=1, sequence=1))
+
+    return connection.execute(select([catalog_sequence.c.sequence])).scalar()
+
+
 def initialise(config: BaseConfig) -> None:
     try:
         engine = get_engine(config)
@@ -59,6 +221,24 @@ def initialise(config: BaseConfig) -> None:
 
         _metadata.create_all(engine, checkfirst=True)
 
+        # create_all() only creates columns and indexes alongside new tables, so add them to existing tables
+        inspector = inspect(engine)
+
+        for table in _metadata.sorted_tables:
+            _columns = {x['name'] for x in inspector.get_columns(table.name)}
+            _indexes = {x['name'] for x in inspector.get_indexes(table.name)}
+
+            for column in [x for x in table.columns if x.name not in _columns]:
+                engine.execute(f'ALTER TABLE {table.name} ADD COLUMN '
+                               f'{CreateColumn(column).compile(dialect=engine.dialect)}')
+
+            for index in table.indexes:
+                index.create(engine) if index.name not in _indexes else None
+
+        with engine.begin() as connection:
+            if connection.execute(select([func.count()]).select_from(catalog_sequence)).scalar() == 0:
+                connection.execute(catalog_sequence.insert().values(sequence_id=1, sequence=0))
+
     except Exception as e:
         logging.error(str(e))
         raise e
@@ -84,11 +264,49 @@ def truncate(config: BaseConfig) -> None:
         engine = get_engine(config)
         assert engine is not None
 
-        for table in _metadata.tables:
-            _table = _metadata.tables[table]
-            if _table.exists(engine):
+        # Delete from referencing tables first, so as not to violate foreign keys. The change sequence is kept, so
+        # that clients notice the removal of everything they have synced.
+        for _table in reversed(_metadata.sorted_tables):
+            if _table.exists(engine) and _table is not catalog_sequence:
                 engine.execute(_table.delete())
 
     except Exception as e:
         logging.error(str(e))
         raise e
+
+
+def _core_queries(dialect: str) -> Dict[str, ClauseElement]:
+    """Queries issued by the server's request handlers, with representative parameters"""
+    # NB: imported here, since the report module itself depends on this module
+    from gravity.report import report_query
+
+    _now = datetime.now()
+
+    return {
+        'get_projects': project.select().where(project.c.deleted == None),
+        'get_actions': action.select().where(action.c.deleted == None),
+        'get_changes_since': project.select().where(project.c.change_sequence > 0),
+        'modify_worklog': worklog.select().order_by(worklog.c.worklog_id.desc()).limit(1),
+        'worklogs_by_project': worklog.select().where(worklog.c.project_id == '').where(worklog.c.timestamp >= _now),
+        'worklogs_by_ticket': worklog.select().where(worklog.c.ticket_key == ''),
+        'get_report': report_query(dialect, ['day', 'project'], _now, _now)
+    }
+
+
+def analyze(config: BaseConfig) -> None:
+    """Update planner statistics, and print query plans for the server's core queries"""
+    try:
+        engine = get_engine(config)
+        assert engine is not None
+
+        with engine.connect() as connection:
+            connection.execute('ANALYZE')
+
+            for name, query in _core_queries(engine.name).items():
+                print(f'-- {name}')
+                for row in connection.execute(Explain(query)):
+                    print('\t'.join(str(x) for x in row))
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
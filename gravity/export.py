@@ -0,0 +1,81 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Union
+
+_worklog_keys = ['worklog_id', 'project_id', 'action_id', 'ticket_key', 'timestamp']
+
+
+def _write_csv(chunks: Iterable[List[Dict[str, Any]]], outfile: TextIO) -> int:
+    writer = csv.DictWriter(outfile, fieldnames=_worklog_keys, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+
+    for chunk in chunks:
+        writer.writerows(chunk)
+        count += len(chunk)
+
+    return count
+
+
+def _write_jsonl(chunks: Iterable[List[Dict[str, Any]]], outfile: TextIO) -> int:
+    count = 0
+
+    for chunk in chunks:
+        outfile.writelines(json.dumps({k: x.get(k) for k in _worklog_keys}) + '\n' for x in chunk)
+        count += len(chunk)
+
+    return count
+
+
+def _write_columnar(chunks: Iterable[List[Dict[str, Any]]], outfile: TextIO) -> int:
+    """Write one JSON object per chunk, holding an array of values per column"""
+    count = 0
+
+    for chunk in chunks:
+        outfile.write(json.dumps({k: [x.get(k) for x in chunk] for k in _worklog_keys}) + '\n')
+        count += len(chunk)
+
+    return count
+
+
+export_formats = {
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+    'columnar': _write_columnar
+}
+
+
+@contextmanager
+def _open_output(output: Union[str, None]) -> Iterator[TextIO]:
+    if output is None or output == '-':
+        yield sys.stdout
+    else:
+        with open(output, mode='w', encoding='utf-8', newline='') as outfile:
+            yield outfile
+
+
+def _worklog_chunks(responses: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    for response in responses:
+        error = response.get('response', {}).get('error')
+
+        if error:
+            raise Exception(error)
+
+        # The final response only marks the end of the stream
+        if response.get('more'):
+            yield response.get('response', {}).get('worklogs', [])
+
+
+def export_worklogs(responses: Iterable[Dict[str, Any]], export_format: str, output: Union[str, None]) -> int:
+    """Write worklogs streamed by the server to a file (or stdout) as they arrive, returning the number written"""
+    assert export_format in export_formats, f'Export format is not one of: {", ".join(export_formats)}'
+
+    try:
+        with _open_output(output) as outfile:
+            return export_formats[export_format](_worklog_chunks(responses), outfile)
+
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        exit(1)
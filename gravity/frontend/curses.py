@@ -1,132 +1,290 @@
 import curses
-import curses.panel
-from re import match
-from typing import Dict
+from time import monotonic
+from typing import Any, Dict, List, Sequence, Tuple, Union
 
-from gravity.backend.client import send_message
+from gravity.backend.cache import ClientCatalog
+from gravity.backend.client import Session, send_message
 from gravity.config import BaseConfig
+from gravity.search import ProjectIndex
 
+_controls = {'C': 'Commit', 'N': 'Next', 'R': 'Reset', 'Q': 'Quit'}
 
-def _curses_main(stdscr, config: BaseConfig, column_limit: int = 4) -> None:
-    def _transform_actions(config: BaseConfig) -> Dict[str, Dict[str, str]]:
-        actions = {}
-        used_commands = set()
+_help = {
+    'action': 'Press an action\'s key, [Esc] Quit',
+    'project': 'Type to filter, [Up/Down] Select, [Enter] Confirm, [Esc] Back',
+    'ticket': 'Type the ticket number, [Enter] Confirm, [Esc] Back',
+    'confirm': ' '.join(f'[{k}]{v[1:]}' for k, v in _controls.items())
+}
 
-        _actions_response = send_message({'request': 'get_actions'}, config).get('response').get('actions')
+_max_ticket_length = 5
 
-        for action in _actions_response:
-            _id = action['action_id']
-            _name = action['action_name']
-            _keys = [x.upper() for x in _name if x.upper() not in used_commands]
+# Seconds after which starting a new worklog fetches project usage from the server again
+_usage_ttl = 300
 
-            if len(_keys) > 0:
-                _command = _keys[0]
-                used_commands.add(_command)
-            else:
-                raise ValueError(f'Could not find unique letter in action {_name} to use as command key')
 
-            actions[_command] = {'action_id': _id, 'action_name': _name}
+def transform_actions(actions: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Assign each action the first letter of its name which has not been assigned to another action yet"""
+    _actions = {}
 
-        return actions
+    for action in actions:
+        _name = action['action_name']
+        _keys = [x.upper() for x in _name if x.isalpha() and x.upper() not in _actions]
 
-    _projects_response = send_message({'request': 'get_projects'}, config).get('response').get('projects')
+        if len(_keys) == 0:
+            raise ValueError(f'Could not find unique letter in action {_name} to use as command key')
 
-    _actions = _transform_actions(config)
-    _controls = {'C': 'Commit', 'N': 'Next', 'R': 'Reset', 'Q': 'Quit'}
-    _projects = dict(enumerate(sorted(_projects_response, key=lambda x: x['project_name'])))
+        _actions[_keys[0]] = {'action_id': action['action_id'], 'action_name': _name}
 
-    # TODO: consider using a (scrollable) pad to avoid errors if we have _many_ projects (or a very, very small window)
-    height, _ = stdscr.getmaxyx()
+    return _actions
 
-    curses.curs_set(0)
 
-    stdscr.addstr(0, 0, 'Actions: ')
-    for idx, action in enumerate(_actions.items()):
-        _command, _action = action
-        y = idx if idx < height - 2 else idx % (height - 1)
-        x = 0 if idx < height - 2 else int(idx / (height - 1)) * 50
-        stdscr.addstr(y + 1, x, f'[{_command}] {_action["action_name"].capitalize()}')
+class PadView(object):
+    """Scrollable list drawn on a curses pad, only rewriting lines which have changed since they were last drawn"""
 
-    while True:
-        command = stdscr.getkey()
-        command = command.upper() if match(r'[a-zA-Z]+', command) else None
+    def __init__(self) -> None:
+        self.pad = None
+        self.top = 0
+        self.lines: List[Tuple[str, int]] = []
 
-        if command in _actions.keys():
-            action = _actions[command]
-            break
+    def reset(self) -> None:
+        self.pad = None
+        self.top = 0
+        self.lines = []
 
-    stdscr.clear()
+    def render(self, lines: Sequence[str], selected: Union[int, None], width: int) -> None:
+        _lines = [(x, curses.A_REVERSE if idx == selected else curses.A_NORMAL) for idx, x in enumerate(lines)]
+        rows = max(len(_lines), len(self.lines), 1)
 
-    stdscr.addstr(0, 0, 'Projects:')
-    for idx, project in _projects.items():
-        y = idx if idx < height - 2 else idx % (height - 1)
-        x = 0 if idx < height - 2 else int(idx / (height - 1)) * 50
-        stdscr.addstr(y + 1, x, f'[{idx}] {project["project_name"]}')
-        stdscr.clrtoeol()
+        if self.pad is None:
+            self.pad = curses.newpad(rows, width)
+        elif self.pad.getmaxyx()[0] < rows or self.pad.getmaxyx()[1] != width:
+            self.pad.resize(rows, width)
+            self.pad.erase()
+            self.lines = []
 
-    while True:
-        key = stdscr.getstr(3).decode('utf-8')
-        key = int(key) if match(r'\d+', key) else None
+        for idx in range(max(len(_lines), len(self.lines))):
+            line = _lines[idx] if idx < len(_lines) else ('', curses.A_NORMAL)
 
-        if key in _projects:
-            project = _projects[key]
-            break
+            if idx < len(self.lines) and self.lines[idx] == line:
+                continue
 
-    stdscr.clear()
+            self.pad.move(idx, 0)
+            self.pad.clrtoeol()
+            self.pad.addnstr(idx, 0, line[0], width - 1, line[1])
 
-    if project.get('project_key') is not None:
-        curses.curs_set(1)
-        stdscr.addstr(0, 0, 'Enter ticket number: ')
-        curses.setsyx(1, 0)
-        curses.echo()
+        self.lines = _lines
 
-        while True:
-            ticket = stdscr.getstr(5).decode('utf-8')
-            ticket = int(ticket) if match(r'\d+', ticket) else None
+    def refresh(self, selected: Union[int, None], y: int, height: int, width: int) -> None:
+        # Scroll just far enough to keep the selected line in view
+        if selected is not None:
+            self.top = min(max(self.top, selected - height + 1), selected)
+
+        self.top = max(min(self.top, len(self.lines) - height), 0)
+        self.pad.noutrefresh(self.top, 0, y, 0, y + height - 1, width - 1)
+
+
+class CursesFrontend(object):
+    """Record worklogs by choosing an action, a project and optionally a ticket, in a single event loop
+
+    Projects and actions are read from the client-side catalog, which only fetches changes from the server whenever
+    a new worklog is started. Projects, and recently used tickets, are searched via a local index ranked by usage,
+    which is only fetched again once it is older than a few minutes.
+    """
+
+    def __init__(self, stdscr, config: BaseConfig, session: Session, catalog: ClientCatalog) -> None:
+        self.stdscr = stdscr
+        self.config = config
+        self.session = session
+        self.catalog = catalog
+        self.view = PadView()
+
+        self.actions: Dict[str, Dict[str, Any]] = {}
+        self.index = ProjectIndex([])
+        self.usage: Dict[str, Any] = {}
+        self.fetched: Union[float, None] = None
+        self.query = ''
+        self.matches: List[Dict[str, Any]] = []
 
-            break
+        self.stage = 'action'
+        self.selected = 0
+        self.action = None
+        self.project = None
+        self.ticket = ''
+        self.dirty = True
 
-        curses.noecho()
+    def _start(self) -> None:
+        """Start a new worklog, only rebuilding the action keys and search index if the catalog or usage is stale"""
+        modified = self.catalog.sync(self.session).modified or not self.actions
+
+        # Usage weights decay over time, so they differ with every request, and are refreshed on a timer instead
+        stale = self.fetched is None or monotonic() - self.fetched > _usage_ttl
+
+        if stale:
+            response = send_message({'request': 'get_project_usage'}, self.config, self.session)
+            self.usage = response.get('response') or {}
+            self.fetched = monotonic()
+
+        if modified:
+            self.actions = transform_actions(self.catalog.get_actions())
+
+        if modified or stale:
+            self.index = ProjectIndex(self.catalog.get_projects(), self.usage)
+
+        self._search('')
+        self._enter('action')
+
+    def _search(self, query: str) -> None:
+        self.query = query
+        self.matches = self.index.search(query, limit=None)
+        self.selected = 0
+
+    def _enter(self, stage: str) -> None:
+        self.stage = stage
+        self.selected = 0
+        self.ticket = '' if stage != 'confirm' else self.ticket
+        self.view.reset()
+        self.dirty = True
+
+    # rendering
+    def _header(self) -> str:
+        if self.stage == 'action':
+            return 'Actions:'
+        elif self.stage == 'project':
+            return f'{self.action["action_name"].capitalize()} project: {self.query}'
+        elif self.stage == 'ticket':
+            return f'Enter ticket number: {self.project["project_key"]}-{self.ticket}'
+
+        return 'Confirm:'
+
+    def _lines(self) -> List[str]:
+        if self.stage == 'action':
+            return [f'[{k}] {v["action_name"].capitalize()}' for k, v in self.actions.items()]
+        elif self.stage == 'project':
+            return [f'{x["project_key"]}-{x["ticket_key"]}  ({x["project_name"]})' if x.get('ticket_key') is not None
+                    else x['project_name'] for x in self.matches]
+        elif self.stage == 'ticket':
+            return []
+
+        lines = [f'Command: {self.action["action_name"].capitalize()}', f'Project: {self.project["project_name"]}']
+
+        return lines + [f'Ticket:  {self.project["project_key"]}-{self.ticket}'] if self.ticket else lines
+
+    def render(self) -> None:
+        height, width = self.stdscr.getmaxyx()
+
+        if self.dirty:
+            self.stdscr.erase()
+            self.stdscr.addnstr(height - 1, 0, _help[self.stage], width - 1, curses.A_DIM)
+            self.dirty = False
+
+        # The header changes with every keystroke while filtering, so it is the only line of stdscr to be redrawn
+        self.stdscr.move(0, 0)
+        self.stdscr.clrtoeol()
+        self.stdscr.addnstr(0, 0, self._header(), width - 1, curses.A_BOLD)
+        self.stdscr.noutrefresh()
+
+        selected = self.selected if self.stage == 'project' else None
+
+        self.view.render(self._lines(), selected, width)
+        self.view.refresh(selected, 1, max(height - 2, 1), width)
+
+        curses.doupdate()
+
+    # input
+    def _submit(self) -> None:
+        message = {'project_id': self.project['project_id'], 'action_id': self.action['action_id']}
+        message = {**message, 'ticket_key': int(self.ticket)} if self.ticket else message
+
+        send_message({'request': 'add_worklog', 'payload': {'worklog': message}}, self.config, self.session)
+
+    def _choose_project(self) -> None:
+        self.project = self.matches[self.selected]
+
+        # Choosing a recently used ticket skips entering its number
+        if self.project.get('ticket_key') is not None:
+            self.ticket = str(self.project['ticket_key'])
+            self._enter('confirm')
+        else:
+            self._enter('ticket' if self.project.get('project_key') is not None else 'confirm')
+
+    def handle(self, key: Union[str, int]) -> bool:
+        """Handle a single key press, returning whether to keep running"""
+        if key == curses.KEY_RESIZE:
+            self.view.reset()
+            self.dirty = True
+
+        elif self.stage == 'action':
+            if key == '\x1b':
+                return False
+            elif isinstance(key, str) and key.upper() in self.actions:
+                self.action = self.actions[key.upper()]
+                self._enter('project')
+
+        elif self.stage == 'project':
+            matches = len(self.matches)
+
+            if key == '\x1b' and self.query:
+                self._search('')
+            elif key == '\x1b':
+                self._enter('action')
+            elif key in [curses.KEY_UP, curses.KEY_DOWN, curses.KEY_PPAGE, curses.KEY_NPAGE]:
+                _page = max(self.stdscr.getmaxyx()[0] - 2, 1)
+                _steps = {curses.KEY_UP: -1, curses.KEY_DOWN: 1, curses.KEY_PPAGE: -_page, curses.KEY_NPAGE: _page}
+                self.selected = min(max(self.selected + _steps[key], 0), max(matches - 1, 0))
+            elif key in ['\n', '\r', curses.KEY_ENTER]:
+                self._choose_project() if matches > 0 else None
+            elif key in [curses.KEY_BACKSPACE, '\x7f', '\b']:
+                self._search(self.query[:-1])
+            elif isinstance(key, str) and key.isprintable():
+                self._search(self.query + key)
+
+        elif self.stage == 'ticket':
+            if key == '\x1b':
+                self._enter('project')
+            elif key in ['\n', '\r', curses.KEY_ENTER]:
+                self._enter('confirm')
+            elif key in [curses.KEY_BACKSPACE, '\x7f', '\b']:
+                self.ticket = self.ticket[:-1]
+            elif isinstance(key, str) and key.isdigit() and len(self.ticket) < _max_ticket_length:
+                self.ticket += key
+
+        elif self.stage == 'confirm':
+            select = key.upper() if isinstance(key, str) else None
+
+            if select == 'C':
+                self._submit()
+                return False
+            elif select == 'N':
+                self._submit()
+                self._start()
+            elif select == 'R':
+                self._start()
+            elif select == 'Q':
+                return False
+
+        return True
+
+    def run(self) -> None:
         curses.curs_set(0)
-        stdscr.clear()
-    else:
-        ticket = None
-
-    stdscr.hline('=', 16)
-    stdscr.addstr(1, 0, f'Command: {action["action_name"].capitalize()}')
-    stdscr.addstr(2, 0, f'Project: {project["project_name"]}')
-    stdscr.addstr(3, 0, f'Ticket:  {project["project_key"]}-{ticket}') if ticket is not None else None
-    stdscr.move(4, 0) if ticket is not None else stdscr.move(3, 0)
-    stdscr.hline('=', 16)
-
-    stdscr.move(6, 0) if ticket is not None else stdscr.move(5, 0)
-    for idx, control in enumerate(_controls.values()):
-        stdscr.addstr(f'[{control[0:1].upper()}]{control[1:]} ')
-
-    message = {'project_id': project['project_id'], 'action_id': action['action_id']}
-    message = {**message, 'ticket_key': ticket} if ticket is not None else message
-
-    while True:
-        select = stdscr.getkey()
-        select = select.upper() if match(r'[a-zA-Z]+', select) else None
-
-        if select == 'C':
-            send_message({'request': 'add_worklog', 'payload': {'worklog': message}}, config)
-            exit(0)
-        elif select == 'N':
-            send_message({'request': 'add_worklog', 'payload': {'worklog': message}}, config)
-            stdscr.clear()
-            _curses_main(stdscr, config, column_limit)
-        elif select == 'R':
-            stdscr.clear()
-            _curses_main(stdscr, config, column_limit)
-        elif select == 'Q':
-            exit(0)
+        curses.set_escdelay(25) if hasattr(curses, 'set_escdelay') else None
+
+        self._start()
+
+        while True:
+            self.render()
+
+            if not self.handle(self.stdscr.get_wch()):
+                break
+
+
+def _curses_main(stdscr, config: BaseConfig, session: Session, catalog: ClientCatalog) -> None:
+    CursesFrontend(stdscr, config, session, catalog).run()
 
 
 def run_curses(config: BaseConfig):
     try:
-        curses.wrapper(_curses_main, config)
+        with Session(config) as session:
+            curses.wrapper(_curses_main, config, session, ClientCatalog(config))
     except KeyboardInterrupt:
         exit(1)
 
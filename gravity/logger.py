@@ -1,4 +1,11 @@
+import atexit
+import copy
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Tuple, Union
 
 from gravity.config import BaseConfig
 
@@ -10,25 +17,125 @@ _log_levels = {
     'debug': logging.DEBUG
 }
 
+_listener: Union[QueueListener, None] = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop error records beyond a limit per call site and interval, noting the number of dropped records"""
+
+    def __init__(self, limit: int, interval: float, level: int = logging.ERROR) -> None:
+        super(RateLimitFilter, self).__init__()
+
+        self.limit = limit
+        self.interval = interval
+        self.level = level
+
+        self._lock = Lock()
+        self._windows: Dict[Tuple[str, int], List[Union[float, int]]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit == 0 or record.levelno < self.level:
+            return True
+
+        now = monotonic()
+
+        with self._lock:
+            # Window per call site: start time, records logged, records suppressed
+            window = self._windows.setdefault((record.pathname, record.lineno), [now, 0, 0])
+
+            if now - window[0] >= self.interval:
+                suppressed = window[2]
+                window[:] = [now, 0, 0]
+            else:
+                suppressed = 0
+
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+
+            window[1] += 1
+
+        if suppressed:
+            record.msg = f'{record.msg} ({suppressed} similar message(s) suppressed)'
+
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records without formatting them, leaving formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+def _stop_listener() -> None:
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def restart_listener() -> None:
+    """Replace the queue listener after forking, e.g. when daemonising, as its thread does not survive the fork
+
+    Stopping the inherited listener would merely enqueue its sentinel for the new thread to stop at, so a new listener
+    with a new queue takes over its handlers, and the root logger's queue handler is pointed at the new queue.
+    """
+    global _listener
+
+    if _listener is None:
+        return
+
+    _listener = QueueListener(queue.SimpleQueue(), *_listener.handlers,
+                              respect_handler_level=_listener.respect_handler_level)
+    _listener.start()
+
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, LazyQueueHandler):
+            handler.queue = _listener.queue
+
+
+def log_streams() -> List:
+    """Return the streams written to by log handlers, to keep them open when daemonising"""
+    handlers = _listener.handlers if _listener is not None else logging.getLogger().handlers
+
+    return [x.stream for x in handlers if isinstance(x, logging.FileHandler)]
+
 
 def initialise_logging(config: BaseConfig):
+    global _listener
+
     handlers = []
-    fh = logging.FileHandler(config.log.file, 'a', 'utf-8')
-    ch = logging.StreamHandler()
 
     if 'file' in config.log.targets:
-        handlers.append(fh)
+        handlers.append(logging.FileHandler(config.log.file, 'a', 'utf-8'))
 
     if 'console' in config.log.targets:
-        handlers.append(ch)
+        handlers.append(logging.StreamHandler())
+
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(module)s: %(message)s')
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if config.log.queue:
+        _stop_listener()
+
+        # Handlers run on the listener's thread, so that logging never waits for disk I/O on the event loop
+        _listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+        _listener.start()
+
+        atexit.unregister(_stop_listener)
+        atexit.register(_stop_listener)
+
+        handlers = [LazyQueueHandler(_listener.queue)]
 
-    logging_conf = {
-        'level': _log_levels[config.log.level],
-        'handlers': handlers,
-        'format': '%(asctime)s %(levelname)s %(module)s: %(message)s'
-    }
+    # Every handler counts records against its own limit, as a shared filter would count each record once per handler
+    for handler in handlers:
+        handler.addFilter(RateLimitFilter(config.log.rate_limit, config.log.rate_limit_interval))
 
-    logging.basicConfig(**logging_conf)
+    logging.basicConfig(level=_log_levels[config.log.level], handlers=handlers, force=True)
     logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
     logging.getLogger('asyncio').setLevel(logging.WARNING)
     logging.captureWarnings(True)
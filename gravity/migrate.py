@@ -0,0 +1,213 @@
+import json
+import logging
+import os.path
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Sequence
+
+from sqlalchemy import Table, func, select
+from sqlalchemy.engine import Engine
+
+import gravity.database
+from gravity.action import _action_keys
+from gravity.backend.writer import close_writers, get_csv_writer, get_journal_writer
+from gravity.config import BaseConfig
+from gravity.database import database_backends, get_engine
+from gravity.model import action, project, worklog
+from gravity.project import _project_keys
+from gravity.worklog import _copy_worklogs, file_backends, read_file_worklogs
+
+# Backends which can be read from as well as written to
+migration_backends = [*file_backends, *database_backends]
+
+_catalog_keys = {'project': _project_keys, 'action': _action_keys}
+
+
+@contextmanager
+def _driver(config: BaseConfig, driver: str) -> Iterator[BaseConfig]:
+    """Temporarily switch the configured backend, e.g. to get the engine of either end of a migration"""
+    overridden, previous = config.get_override(name='driver', group='backend')
+    config.set_override(name='driver', override=driver, group='backend')
+
+    try:
+        yield config
+    finally:
+        if overridden:
+            config.set_override(name='driver', override=previous, group='backend')
+        else:
+            config.clear_override(name='driver', group='backend')
+
+
+def _engine(config: BaseConfig, driver: str) -> Engine:
+    with _driver(config, driver):
+        return get_engine(config)
+
+
+def _catalog_file(config: BaseConfig, table: Table) -> str:
+    return config.main.projects if table is project else config.main.actions
+
+
+def _read_catalog(config: BaseConfig, driver: str, table: Table) -> List[Dict[str, Any]]:
+    """Read all projects or actions, which are few enough to be read at once, including deleted ones"""
+    if driver in database_backends:
+        with _engine(config, driver).connect() as connection:
+            return [dict(x) for x in connection.execute(table.select())]
+
+    filename = _catalog_file(config, table)
+
+    if not os.path.isfile(filename):
+        return []
+
+    with open(filename, mode='r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def _write_catalog(config: BaseConfig, driver: str, table: Table, rows: Sequence[Dict[str, Any]]) -> int:
+    """Add projects or actions missing from a backend, returning the number of rows added"""
+    key = table.primary_key.columns.values()[0].name
+    current = _read_catalog(config, driver, table)
+    existing = {x[key] for x in current}
+    now = datetime.now()
+
+    if driver in database_backends:
+        rows = [{**{x.name: row.get(x.name) for x in table.columns}, 'created': row.get('created') or now,
+                 'updated': row.get('updated') or now} for row in rows if row[key] not in existing]
+        rows = [_naive(x) for x in rows] if driver == 'sqlite' else rows
+
+        if rows:
+            with _engine(config, driver).begin() as connection:
+                sequence = gravity.database.next_sequence(connection)
+                connection.execute(table.insert(), [{**x, 'change_sequence': sequence} for x in rows])
+
+        return len(rows)
+
+    # Project and action files only hold active entries
+    rows = [{k: row.get(k) for k in _catalog_keys[table.name]} for row in rows
+            if row[key] not in existing and row.get('deleted') is None]
+
+    if rows:
+        with open(_catalog_file(config, table), mode='w', encoding='utf-8') as outfile:
+            json.dump([*current, *rows], outfile, indent=4)
+
+    return len(rows)
+
+
+def _checkpoint(config: BaseConfig, driver: str) -> int:
+    """Return the highest worklog id written to a backend, after which an interrupted migration resumes"""
+    if driver in database_backends:
+        with _engine(config, driver).connect() as connection:
+            return connection.execute(select([func.max(worklog.c.worklog_id)])).scalar() or 0
+
+    return (get_csv_writer(config) if driver == 'csv' else get_journal_writer(config)).worklog_id
+
+
+def _read_worklogs(config: BaseConfig, driver: str, after: int, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Stream worklogs in batches, in order of their ids, starting after a given id"""
+    if driver in database_backends:
+        query = select([worklog]).where(worklog.c.worklog_id > after).order_by(worklog.c.worklog_id)
+
+        with _engine(config, driver).connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+
+            for rows in iter(lambda: result.fetchmany(batch_size), []):
+                yield [dict(x) for x in rows]
+
+    else:
+        assert driver != 'csv' or os.path.isfile(config.csv.output), f'CSV file "{config.csv.output}" does not exist'
+
+        with _driver(config, driver):
+            rows = (x for x in read_file_worklogs(config) if x['worklog_id'] > after)
+
+        yield from iter(lambda: list(islice(rows, batch_size)), [])
+
+
+def _naive(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert timestamps read from PostgreSQL to naive local time, in which SQLite and files record them"""
+    return {k: v.astimezone().replace(tzinfo=None) if isinstance(v, datetime) and v.tzinfo is not None else v
+            for k, v in row.items()}
+
+
+def _write_worklogs(config: BaseConfig, driver: str, rows: Sequence[Dict[str, Any]]) -> None:
+    if driver in ['postgresql', 'postgresql-async']:
+        with _engine(config, driver).begin() as connection:
+            _copy_worklogs(connection, rows, [x.name for x in worklog.columns])
+
+    elif driver == 'sqlite':
+        with _engine(config, driver).begin() as connection:
+            connection.execute(worklog.insert(), [_naive(x) for x in rows])
+
+    else:
+        (get_csv_writer(config) if driver == 'csv' else get_journal_writer(config)).append([_naive(x) for x in rows])
+
+
+def migrate(config: BaseConfig, source: str, target: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """Copy all projects, actions and worklogs from one backend to another, preserving their ids and timestamps
+
+    Worklogs are copied in batches, each of which is committed on its own. Since they are copied in order of their
+    ids, an interrupted migration resumes after the highest worklog id present in the target.
+    """
+    try:
+        assert source in migration_backends and target in migration_backends, \
+            f'Migrations are only supported between backends: {", ".join(migration_backends)}'
+        assert source != target and {source, target} != {'postgresql', 'postgresql-async'}, \
+            'Source and target backends must differ'
+        assert batch_size > 0, 'Batch size must be positive'
+
+        if target in database_backends:
+            with _driver(config, target):
+                gravity.database.initialise(config)
+
+        start = perf_counter()
+
+        projects = _write_catalog(config, target, project, _read_catalog(config, source, project))
+        actions = _write_catalog(config, target, action, _read_catalog(config, source, action))
+
+        checkpoint = _checkpoint(config, target)
+        worklogs = 0
+
+        logging.info('Migrating worklogs from %s to %s after worklog %d', source, target, checkpoint)
+
+        for rows in _read_worklogs(config, source, checkpoint, batch_size):
+            _write_worklogs(config, target, rows)
+
+            worklogs += len(rows)
+            checkpoint = rows[-1]['worklog_id']
+
+            logging.debug('Migrated %d worklogs, up to worklog %d', worklogs, checkpoint)
+
+        # Worklog ids have been set explicitly, so move the identity sequence past them
+        if target in ['postgresql', 'postgresql-async']:
+            with _engine(config, target).begin() as connection:
+                connection.execute("SELECT setval(pg_get_serial_sequence('worklog', 'worklog_id'), "
+                                   "(SELECT max(worklog_id) FROM worklog))")
+
+        seconds = perf_counter() - start
+
+        logging.info('Migrated %d projects, %d actions and %d worklogs from %s to %s in %.2f s',
+                     projects, actions, worklogs, source, target, seconds)
+
+        return {
+            'source': source,
+            'target': target,
+            'projects': projects,
+            'actions': actions,
+            'worklogs': worklogs,
+            'checkpoint': checkpoint,
+            'seconds': seconds,
+            'rows_per_second': (projects + actions + worklogs) / seconds if seconds > 0 else 0.0
+        }
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+    finally:
+        close_writers()
+
+
+def print_migration(result: Dict[str, Any]) -> None:
+    print(f'Migrated {result["projects"]} projects, {result["actions"]} actions and {result["worklogs"]} worklogs '
+          f'from {result["source"]} to {result["target"]} in {result["seconds"]:.2f} s '
+          f'({result["rows_per_second"]:.0f} rows/s), up to worklog {result["checkpoint"]}')
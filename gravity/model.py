@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import MetaData, Table, Column, INTEGER, VARCHAR, TIMESTAMP, ForeignKey
+from sqlalchemy import MetaData, Table, Column, BIGINT, INTEGER, VARCHAR, TIMESTAMP, ForeignKey, Index
 
 _metadata = MetaData()
 
@@ -12,7 +12,8 @@ project = Table(
     Column('project_key', VARCHAR, nullable=True),
     Column('created', TIMESTAMP(timezone=True), nullable=False, default=datetime.now),
     Column('updated', TIMESTAMP(timezone=True), nullable=False, default=datetime.now, onupdate=datetime.now),
-    Column('deleted', TIMESTAMP(timezone=True), nullable=True, default=None))
+    Column('deleted', TIMESTAMP(timezone=True), nullable=True, default=None),
+    Column('change_sequence', BIGINT, nullable=True))
 
 action = Table(
     'action', _metadata,
@@ -21,7 +22,14 @@ action = Table(
     Column('description', VARCHAR, nullable=True),
     Column('created', TIMESTAMP(timezone=True), nullable=False, default=datetime.now),
     Column('updated', TIMESTAMP(timezone=True), nullable=False, default=datetime.now, onupdate=datetime.now),
-    Column('deleted', TIMESTAMP(timezone=True), nullable=True, default=None))
+    Column('deleted', TIMESTAMP(timezone=True), nullable=True, default=None),
+    Column('change_sequence', BIGINT, nullable=True))
+
+# Single row counting changes to projects and actions, cf. gravity.database.next_sequence()
+catalog_sequence = Table(
+    'catalog_sequence', _metadata,
+    Column('sequence_id', INTEGER, primary_key=True, autoincrement=False),
+    Column('sequence', BIGINT, nullable=False))
 
 worklog = Table(
     'worklog', _metadata,
@@ -30,3 +38,18 @@ worklog = Table(
     Column('action_id', VARCHAR(36), ForeignKey('action.action_id'), nullable=False),
     Column('ticket_key', VARCHAR(36), nullable=True),
     Column('timestamp', TIMESTAMP(timezone=True), nullable=False, default=datetime.now))
+
+# Indexes supporting reports by time range, project, or ticket
+Index('ix_worklog_timestamp', worklog.c.timestamp)
+Index('ix_worklog_project_timestamp', worklog.c.project_id, worklog.c.timestamp)
+Index('ix_worklog_ticket_key', worklog.c.ticket_key)
+
+# Partial indexes covering only active projects/actions, as read by get_projects/get_actions
+Index('ix_project_active', project.c.project_name,
+      postgresql_where=project.c.deleted.is_(None), sqlite_where=project.c.deleted.is_(None))
+Index('ix_action_active', action.c.action_name,
+      postgresql_where=action.c.deleted.is_(None), sqlite_where=action.c.deleted.is_(None))
+
+# Indexes supporting incremental catalog syncs, which read rows changed after a client's last sync
+Index('ix_project_change_sequence', project.c.change_sequence)
+Index('ix_action_change_sequence', action.c.change_sequence)
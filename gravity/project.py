@@ -3,32 +3,24 @@ import logging
 import os.path
 from datetime import datetime
 from typing import Any, Dict, Sequence, Tuple, Union
-from uuid import uuid4
 
+from gravity.catalog import Catalog, get_catalog
 from gravity.config import BaseConfig
-from gravity.database import get_engine
+from gravity.database import database_backends, get_engine, next_sequence
 from gravity.model import project
 
+_project_keys = ['project_id', 'project_name', 'project_key']
+
 
 def insert_projects(projects: Sequence[Dict[str, str]], config: BaseConfig) -> None:
     try:
         engine = get_engine(config)
 
         with engine.begin() as connection:
-            connection.execute(project.insert(), projects)
+            sequence = next_sequence(connection)
+            connection.execute(project.insert(), [{**x, 'change_sequence': sequence} for x in projects])
 
-    except Exception as e:
-        logging.error(str(e))
-        raise e
-
-
-def add_projects(projects: Sequence[str]) -> Sequence[Dict[str, str]]:
-    try:
-        # Explicitly cast uuid4 objects to str, since sqlite doesn't take kindly to any other form
-        # NB: postgresql has a native UUID datatype, but for portability's sake, we use TEXT instead
-        _projects = [dict(project_id=str(uuid4()), project_name=project) for project in projects]
-
-        return _projects
+        get_catalog().put_projects([{k: x.get(k) for k in _project_keys} for x in projects])
 
     except Exception as e:
         logging.error(str(e))
@@ -42,7 +34,9 @@ def remove_projects(projects: Sequence[str], config: BaseConfig) -> None:
         with engine.begin() as connection:
             connection.execute(project.update()
                                .where(project.c.project_id.in_(projects))
-                               .values(deleted=datetime.now()))
+                               .values(deleted=datetime.now(), change_sequence=next_sequence(connection)))
+
+        get_catalog().remove_projects(projects)
 
     except Exception as e:
         logging.error(str(e))
@@ -53,7 +47,8 @@ def _get_projects(config: BaseConfig) -> Sequence[Union[Tuple[str, Any], None]]:
     try:
         engine = get_engine(config)
 
-        with engine.begin() as connection:
+        # Read outside of an explicit transaction, so as not to take SQLite's write lock
+        with engine.connect() as connection:
             result = connection.execute(project.select().where(project.c.deleted == None))
 
             return result.fetchall()
@@ -63,31 +58,34 @@ def _get_projects(config: BaseConfig) -> Sequence[Union[Tuple[str, Any], None]]:
         raise e
 
 
-def list_projects(projects: Sequence[Dict[str, str]]) -> None:
-    for _project in projects:
-        print(f'{_project["project_id"]}\t{_project["project_name"]}')
+def load_projects(config: BaseConfig) -> Sequence[Dict[str, Any]]:
+    """Read all active projects from the storage backend, bypassing the catalog cache"""
+    if config.backend.driver in database_backends:
+        projects = _get_projects(config)
+        projects = [{k: v for k, v in x.items() if k in _project_keys} for x in projects]
+    else:
+        assert os.path.isfile(config.main.projects), f'Projects file "{config.main.projects}" does not exist'
 
+        with open(config.main.projects, mode='r', encoding='utf-8') as infile:
+            projects = json.load(infile)
 
-def export_projects(projects: Sequence[Dict[str, str]]) -> None:
-    keys = ['project_id', 'project_name', 'project_key']
+    return projects
 
-    _projects = [{k: v for k, v in p.items() if k in keys} for p in projects]
 
-    print(json.dumps(_projects, indent=4))
+def _get_catalog(config: BaseConfig) -> Catalog:
+    _catalog = get_catalog()
 
+    # Rows loaded while a write was committed may miss it, so load them again should the catalog change meanwhile
+    while not _catalog.has_projects():
+        version = _catalog.version
+        _catalog.set_projects(load_projects(config), version)
 
-def get_projects(config: BaseConfig) -> Sequence[Dict[str, Any]]:
-    try:
-        keys = ['project_id', 'project_name', 'project_key']
+    return _catalog
 
-        if config.backend.driver in ['sqlite', 'postgresql']:
-            projects = _get_projects(config)
-            projects = [{k: v for k, v in x.items() if k in keys} for x in projects]
-        else:
-            assert os.path.isfile(config.gravity.projects), f'Projects file "{config.gravity.projects}" does not exist'
 
-            with open(config.main.projects, mode='r', encoding='utf-8') as infile:
-                projects = json.load(infile)
+def get_projects(config: BaseConfig) -> Sequence[Dict[str, Any]]:
+    try:
+        projects = _get_catalog(config).get_projects()
 
         assert len(projects) > 0, 'No projects could be found'
         return projects
@@ -97,36 +95,23 @@ def get_projects(config: BaseConfig) -> Sequence[Dict[str, Any]]:
         raise e
 
 
-def import_projects(filename: str) -> Sequence[Dict[str, str]]:
-    try:
-        assert os.path.isfile(filename), f'Projects file "{filename}" does not exist'
-
-        with open(filename, mode='r', encoding='utf-8') as infile:
-            _projects = json.load(infile)
-
-        return _projects
-
-    except Exception as e:
-        logging.error(str(e))
-        raise e
-
-
 def annotate_project(annotation: Dict[str, str], config: BaseConfig) -> str:
     try:
         engine = get_engine(config)
 
-        _projects = get_projects(config)
-
         _project = annotation.get('project')
         _description = annotation.get('description')
         _key = annotation.get('key')
 
-        assert _project in [x.get('project_id') for x in _projects], f'Project {_project} does not exist'
+        assert _get_catalog(config).get_project(_project) is not None, f'Project {_project} does not exist'
 
         with engine.begin() as connection:
             connection.execute(project.update()
                                .where(project.c.project_id == _project)
-                               .values(description=_description, project_key=_key))
+                               .values(description=_description, project_key=_key,
+                                       change_sequence=next_sequence(connection)))
+
+        get_catalog().update_project(_project, {'project_key': _key})
 
         message = f'Annotated project {_project}'
         logging.info(message)
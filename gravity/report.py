@@ -0,0 +1,174 @@
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+from sqlalchemy import and_, func, literal_column, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import ColumnElement, Select
+
+from gravity.action import get_actions
+from gravity.config import BaseConfig
+from gravity.database import database_backends, get_engine
+from gravity.model import action, project, worklog
+from gravity.project import get_projects
+from gravity.worklog import file_backends, parse_timestamp, read_file_worklogs
+
+# Columns returned for each grouping, in order
+_group_columns = {
+    'day': ['day'],
+    'week': ['week'],
+    'project': ['project_id', 'project_name'],
+    'action': ['action_id', 'action_name'],
+    'ticket': ['ticket_key']
+}
+
+
+def _duration(dialect: str, start: ColumnElement, end: ColumnElement) -> ColumnElement:
+    """Return the number of seconds between two timestamp columns"""
+    if dialect == 'sqlite':
+        # julianday() is a floating point number of days, so round away its sub-millisecond imprecision
+        return func.round((func.julianday(end) - func.julianday(start)) * literal_column('86400.0'), 3)
+
+    return func.extract('epoch', end - start)
+
+
+def _day(dialect: str, timestamp: ColumnElement) -> ColumnElement:
+    if dialect == 'sqlite':
+        return func.date(timestamp)
+
+    return func.to_char(timestamp, 'YYYY-MM-DD')
+
+
+def _week(dialect: str, timestamp: ColumnElement) -> ColumnElement:
+    """Return the date of the Monday starting a timestamp's (ISO) week"""
+    if dialect == 'sqlite':
+        return func.date(timestamp, 'weekday 0', '-6 days')
+
+    return func.to_char(func.date_trunc('week', timestamp), 'YYYY-MM-DD')
+
+
+def report_query(dialect: str, group_by: Sequence[str], start: Union[datetime, None] = None,
+                 end: Union[datetime, None] = None) -> Select:
+    """Build a query turning worklog events into intervals, which last until the next event, and aggregate them"""
+    _next = func.lead(worklog.c.timestamp).over(order_by=[worklog.c.timestamp, worklog.c.worklog_id])
+
+    # Events before the start of the report cannot affect intervals starting within it
+    intervals = select([worklog, _next.label('next_timestamp')])
+    intervals = intervals.where(worklog.c.timestamp >= start) if start is not None else intervals
+    intervals = intervals.alias('intervals')
+
+    columns = {
+        'day': _day(dialect, intervals.c.timestamp),
+        'week': _week(dialect, intervals.c.timestamp),
+        'project_id': project.c.project_id,
+        'project_name': project.c.project_name,
+        'action_id': action.c.action_id,
+        'action_name': action.c.action_name,
+        'ticket_key': intervals.c.ticket_key
+    }
+    _columns = [columns[x].label(x) for grouping in group_by for x in _group_columns[grouping]]
+
+    query = select([
+        *_columns,
+        func.sum(_duration(dialect, intervals.c.timestamp, intervals.c.next_timestamp)).label('seconds'),
+        func.count().label('worklogs')
+    ])
+    query = query.select_from(
+        intervals
+        .join(project, project.c.project_id == intervals.c.project_id)
+        .join(action, action.c.action_id == intervals.c.action_id))
+
+    conditions = [intervals.c.next_timestamp.isnot(None)]
+    conditions = [*conditions, intervals.c.timestamp < end] if end is not None else conditions
+
+    return query.where(and_(*conditions)).group_by(*_columns).order_by(*_columns)
+
+
+def _aggregate(events: Iterable[Dict[str, Any]], group_by: Sequence[str], names: Dict[str, str],
+               start: Union[datetime, None] = None, end: Union[datetime, None] = None) -> List[Dict[str, Any]]:
+    """Aggregate intervals between consecutive events, streaming over events ordered by timestamp"""
+    totals: Dict[Tuple[Any, ...], List[Union[float, int]]] = {}
+    previous = None
+
+    for event in events:
+        if start is not None and event['timestamp'] < start:
+            continue
+
+        if previous is not None and (end is None or previous['timestamp'] < end):
+            _timestamp = previous['timestamp']
+            _values = {
+                'day': _timestamp.date().isoformat(),
+                'week': (_timestamp.date() - timedelta(days=_timestamp.weekday())).isoformat(),
+                'project_id': previous['project_id'],
+                'project_name': names.get(previous['project_id']),
+                'action_id': previous['action_id'],
+                'action_name': names.get(previous['action_id']),
+                'ticket_key': previous['ticket_key']
+            }
+            key = tuple(_values[x] for grouping in group_by for x in _group_columns[grouping])
+
+            total = totals.setdefault(key, [0.0, 0])
+            total[0] += (event['timestamp'] - _timestamp).total_seconds()
+            total[1] += 1
+
+        previous = event
+
+    keys = [x for grouping in group_by for x in _group_columns[grouping]]
+
+    return [
+        {**dict(zip(keys, key)), 'seconds': seconds, 'worklogs': worklogs}
+        for key, (seconds, worklogs) in sorted(totals.items(), key=lambda x: [(y is not None, str(y)) for y in x[0]])
+    ]
+
+
+def _read_database_worklogs(engine: Engine, start: Union[datetime, None]) -> Iterable[Dict[str, Any]]:
+    query = select([worklog]).order_by(worklog.c.timestamp, worklog.c.worklog_id)
+    query = query.where(worklog.c.timestamp >= start) if start is not None else query
+
+    with engine.connect() as connection:
+        for row in connection.execution_options(stream_results=True).execute(query):
+            yield dict(row)
+
+
+def _supports_window_functions(engine: Engine) -> bool:
+    return engine.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 25, 0)
+
+
+def get_report(group_by: Sequence[str], config: BaseConfig, start: Union[str, datetime, None] = None,
+               end: Union[str, datetime, None] = None) -> List[Dict[str, Any]]:
+    """Report the time spent between consecutive worklog events, grouped by any of day/week/project/action/ticket"""
+    try:
+        assert len(group_by) > 0, 'Report requires at least one grouping'
+        assert all(x in _group_columns for x in group_by), f'Report groupings must be any of {list(_group_columns)}'
+
+        _start = parse_timestamp(start)
+        _end = parse_timestamp(end)
+
+        if config.backend.driver in database_backends:
+            engine = get_engine(config)
+
+            if _supports_window_functions(engine):
+                with engine.connect() as connection:
+                    result = connection.execute(report_query(engine.name, group_by, _start, _end))
+
+                    return [{**dict(x), 'seconds': float(x['seconds'])} for x in result]
+
+            events = _read_database_worklogs(engine, _start)
+
+        elif config.backend.driver in file_backends:
+            events = read_file_worklogs(config)
+
+        else:
+            raise AssertionError(f'Reports are not supported for backend {config.backend.driver}')
+
+        names = {
+            **{x['project_id']: x['project_name'] for x in get_projects(config)},
+            **{x['action_id']: x['action_name'] for x in get_actions(config)}
+        }
+
+        return _aggregate(events, group_by, names, _start, _end)
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
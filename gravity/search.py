@@ -0,0 +1,203 @@
+import heapq
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple, Union
+
+# Usage halves every half-life
+_usage_half_life = timedelta(days=14)
+
+# Weights of how well a search term matches a field, and of the fields themselves
+_match_weights = {'exact': 1.0, 'prefix': 0.8, 'word': 0.6, 'substring': 0.4}
+_field_weights = {'name': 1.0, 'key': 0.9, 'ticket': 1.0, 'description': 0.4}
+
+# Usage only breaks ties between matches of similar quality, rather than outranking better matches
+_usage_weight = 5
+
+_separators = re.compile(r'[^0-9a-z]+')
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[x:x + 3] for x in range(len(text) - 2)}
+
+
+def fuzzy_score(query: str, text: str) -> Union[Tuple[int, int], None]:
+    """Match a query against text as a case-insensitive subsequence, returning a sort key, or None if it does not match
+
+    Matches are ranked by how spread out the matched characters are, then by where the first of them is.
+    """
+    _text = text.lower()
+    start = position = _text.find(query[0]) if query else 0
+
+    if position < 0:
+        return None
+
+    for character in query[1:]:
+        position = _text.find(character, position + 1)
+
+        if position < 0:
+            return None
+
+    return position - start, start
+
+
+def usage_weights(rows: Iterable[Dict[str, Any]], now: datetime) -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+    """Weigh projects and tickets by how often, and how recently, worklogs have been recorded for them
+
+    Takes rows of `project_id`, `ticket_key`, the number of worklogs and the timestamp of the last one.
+    """
+    projects: Dict[str, float] = {}
+    tickets = []
+
+    for row in rows:
+        # Compare timestamps as naive local time, in which SQLite and files record them
+        _last = datetime.fromisoformat(row['last']) if isinstance(row['last'], str) else row['last']
+        _last = _last.astimezone().replace(tzinfo=None) if _last.tzinfo is not None else _last
+
+        weight = math.log1p(row['worklogs']) * 0.5 ** (max(now - _last, timedelta()) / _usage_half_life)
+
+        projects[row['project_id']] = projects.get(row['project_id'], 0) + weight
+
+        if row['ticket_key'] is not None:
+            tickets.append({'project_id': row['project_id'], 'ticket_key': str(row['ticket_key']), 'weight': weight})
+
+    return projects, tickets
+
+
+class ProjectIndex(object):
+    """Search index over project names, keys and descriptions, and over recently used tickets
+
+    Words are indexed by their first one or two characters, which answer short queries, and all fields by their
+    trigrams, which answer longer ones. Candidates found via the index are then scored by how well every term of the
+    query matches them, and by how often and how recently they have been used. Queries matching nothing that way
+    fall back to matching project names as subsequences, e.g. `grv` matches "Gravity".
+    """
+
+    def __init__(self, projects: Sequence[Dict[str, Any]], usage: Union[Dict[str, Any], None] = None) -> None:
+        usage = usage or {}
+        weights = usage.get('projects', {})
+
+        self.entries: List[Dict[str, Any]] = sorted(
+            [{**x, 'weight': weights.get(x['project_id'], 0.0)} for x in projects],
+            key=lambda x: (-x['weight'], x['project_name'].lower()))
+
+        # Tickets can only be searched for by their project's key, e.g. "GRV-42"
+        _projects = {x['project_id']: x for x in projects if x.get('project_key')}
+
+        self.entries += [{**_projects[x['project_id']], 'ticket_key': x['ticket_key'], 'weight': x['weight']}
+                         for x in usage.get('tickets', []) if x['project_id'] in _projects]
+
+        self._fields: List[Dict[str, str]] = [self._entry_fields(x) for x in self.entries]
+        # Fields with their words separated by single spaces, to find words starting with a term in one go
+        self._words: List[Dict[str, str]] = [{k: ' ' + ' '.join(_separators.split(v)) for k, v in x.items()}
+                                             for x in self._fields]
+        self._weights = [x['weight'] for x in self.entries]
+
+        # Short terms can only match the start of a word, so their scores are known upfront
+        self._prefixes: Dict[str, Dict[int, float]] = {}
+        self._trigrams: Dict[str, Set[int]] = {}
+
+        for idx, fields in enumerate(self._fields):
+            for field, text in fields.items():
+                for prefix in {y for x in self._words[idx][field].split() for y in [x[:1], x[:2]]}:
+                    scores = self._prefixes.setdefault(prefix, {})
+                    scores[idx] = max(scores.get(idx, 0.0), self._score(idx, prefix))
+
+                for trigram in _trigrams(text):
+                    self._trigrams.setdefault(trigram, set()).add(idx)
+
+        self.projects = len(projects)
+        self._cache: Dict[str, Dict[int, float]] = {}
+
+    @staticmethod
+    def _entry_fields(entry: Dict[str, Any]) -> Dict[str, str]:
+        if entry.get('ticket_key') is not None:
+            return {'ticket': f'{entry["project_key"]}-{entry["ticket_key"]}'.lower()}
+
+        fields = {
+            'name': entry['project_name'],
+            'key': entry.get('project_key'),
+            'description': entry.get('description')
+        }
+
+        return {k: v.lower() for k, v in fields.items() if v}
+
+    def _score(self, idx: int, term: str) -> float:
+        """Return how well the best matching field of an entry matches a term"""
+        score = 0.0
+        _term = ' ' + term
+
+        for field, text in self._fields[idx].items():
+            if text == term:
+                quality = 'exact'
+            elif text.startswith(term):
+                quality = 'prefix'
+            elif _term in self._words[idx][field]:
+                quality = 'word'
+            elif term in text:
+                quality = 'substring'
+            else:
+                continue
+
+            score = max(score, _match_weights[quality] * _field_weights[field])
+
+        return score
+
+    def _matches(self, term: str, within: Union[Set[int], None] = None) -> Dict[int, float]:
+        """Return the entries matching a term, optionally only among some entries, and how well they match it"""
+        if len(term) < 3:
+            return self._prefixes.get(term, {})
+
+        # The other terms of a query are not changed by typing, so only score their matches once
+        if within is None and term in self._cache:
+            return self._cache[term]
+
+        # Intersect the smallest posting lists first, and verify that the trigrams appear in sequence
+        postings = sorted([self._trigrams.get(x, set()) for x in _trigrams(term)], key=len)
+        postings = [within, *postings] if within is not None else postings
+        candidates = set.intersection(*postings) if postings else set()
+
+        matches = {x: y for x, y in [(x, self._score(x, term)) for x in candidates] if y}
+
+        if within is None:
+            self._cache = self._cache if len(self._cache) < 1000 else {}
+            self._cache[term] = matches
+
+        return matches
+
+    def _rank(self, scores: Dict[int, float], limit: Union[int, None]) -> List[Dict[str, Any]]:
+        # Entries are already ordered by usage and name, which breaks ties between equal ranks
+        ranks = [(-(100 * y + _usage_weight * self._weights[x]), x) for x, y in scores.items()]
+        ranked = heapq.nsmallest(limit, ranks) if limit is not None else sorted(ranks)
+
+        return [{**self.entries[x], 'score': round(-y, 3)} for y, x in ranked]
+
+    def search(self, query: str, limit: Union[int, None] = 20) -> List[Dict[str, Any]]:
+        """Return projects and tickets matching all terms of a query, best matches first"""
+        terms = query.lower().split()
+
+        # Without a query, list all projects, most used first
+        if not terms:
+            return [{**x, 'score': round(_usage_weight * x['weight'], 3)}
+                    for x in self.entries[:self.projects][:limit]]
+
+        scores: Union[Dict[int, float], None] = None
+
+        for term in sorted(terms, key=len, reverse=True):
+            matches = self._matches(term, set(scores) if scores is not None else None)
+            scores = dict(matches) if scores is None else \
+                {x: y + matches[x] for x, y in scores.items() if x in matches}
+
+            if not scores:
+                break
+
+        if scores:
+            return self._rank(scores, limit)
+
+        # Subsequence matches are worth less than any substring match
+        _query = ''.join(terms)
+        scores = {idx: 0.2 / (1 + spread[0]) for idx, spread in
+                  [(x, fuzzy_score(_query, self.entries[x]['project_name'])) for x in range(self.projects)]
+                  if spread is not None}
+
+        return self._rank(scores, limit)
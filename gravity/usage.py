@@ -0,0 +1,114 @@
+import json
+import logging
+import os.path
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, List, Tuple, Union
+
+from sqlalchemy import func, select
+
+from gravity.catalog import get_catalog
+from gravity.config import BaseConfig
+from gravity.database import database_backends, get_engine
+from gravity.model import project, worklog
+from gravity.project import _get_catalog
+from gravity.search import ProjectIndex, usage_weights
+from gravity.worklog import file_backends, read_file_worklogs
+
+# Worklogs older than the usage window do not count towards usage
+_usage_window = timedelta(days=90)
+
+# Seconds after which the server reads usage from the worklog table again
+_usage_ttl = 60
+
+
+def _read_usage(config: BaseConfig, now: datetime) -> List[Dict[str, Any]]:
+    """Count recent worklogs per project and ticket"""
+    if config.backend.driver in database_backends:
+        engine = get_engine(config)
+        since = now - _usage_window
+        since = since.astimezone() if engine.name != 'sqlite' else since
+
+        query = select([worklog.c.project_id, worklog.c.ticket_key, func.count().label('worklogs'),
+                        func.max(worklog.c.timestamp).label('last')]) \
+            .where(worklog.c.timestamp >= since) \
+            .group_by(worklog.c.project_id, worklog.c.ticket_key)
+
+        with engine.connect() as connection:
+            return [dict(x) for x in connection.execute(query)]
+
+    elif config.backend.driver in file_backends:
+        usage: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+
+        for row in read_file_worklogs(config):
+            if row['timestamp'] < now - _usage_window:
+                continue
+
+            entry = usage.setdefault((row['project_id'], row['ticket_key']), {
+                'project_id': row['project_id'], 'ticket_key': row['ticket_key'], 'worklogs': 0,
+                'last': row['timestamp']})
+            entry['worklogs'] += 1
+            entry['last'] = max(entry['last'], row['timestamp'])
+
+        return list(usage.values())
+
+    return []
+
+
+def get_project_usage(config: BaseConfig) -> Dict[str, Any]:
+    try:
+        projects, tickets = usage_weights(_read_usage(config, datetime.now()), datetime.now())
+
+        return {'projects': projects, 'tickets': tickets}
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+_index: Union[ProjectIndex, None] = None
+_index_state: Tuple[Any, ...] = (None, None)
+_index_lock = Lock()
+
+
+def _read_descriptions(config: BaseConfig) -> Dict[str, str]:
+    """Read project descriptions, which the catalog cache does not hold"""
+    if config.backend.driver in database_backends:
+        with get_engine(config).connect() as connection:
+            return dict(connection.execute(select([project.c.project_id, project.c.description])
+                                           .where(project.c.deleted == None)).fetchall())
+
+    if not os.path.isfile(config.main.projects):
+        return {}
+
+    with open(config.main.projects, mode='r', encoding='utf-8') as infile:
+        return {x['project_id']: x.get('description') for x in json.load(infile)}
+
+
+def get_search_index(config: BaseConfig) -> ProjectIndex:
+    """Return the server's project index, rebuilt once the catalog has changed, or usage is out of date"""
+    global _index, _index_state
+
+    with _index_lock:
+        version, updated = _index_state
+
+        if _index is None or version != get_catalog().version or monotonic() - updated > _usage_ttl:
+            version = get_catalog().version
+            descriptions = _read_descriptions(config)
+            projects = [{**x, 'description': descriptions.get(x['project_id'])}
+                        for x in _get_catalog(config).get_projects()]
+
+            _index = ProjectIndex(projects, get_project_usage(config))
+            _index_state = (version, monotonic())
+
+        return _index
+
+
+def search_projects(query: str, config: BaseConfig, limit: Union[int, None] = 20) -> List[Dict[str, Any]]:
+    try:
+        return get_search_index(config).search(query or '', limit)
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
@@ -1,12 +1,27 @@
+import csv
+import io
+import json
 import logging
+import os.path
 import re
-from datetime import timedelta
-from typing import Dict, Union
+from datetime import datetime, timedelta
+from itertools import islice
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Sequence, Set, Tuple, Union
 
-from gravity.backend.writer import csv_writer, log_writer, postgresql_writer, sqlite_writer
+from sqlalchemy import and_, select
+from sqlalchemy.engine import Connection
+
+from gravity.backend.writer import csv_quoting, csv_writer, journal_files, log_writer, postgresql_writer, sqlite_writer
 from gravity.config import BaseConfig
-from gravity.database import get_engine
-from gravity.model import worklog
+from gravity.database import database_backends, get_engine
+from gravity.model import action, project, worklog
+
+# Backends storing worklogs in files which can be read back
+file_backends = ['csv', 'log']
+
+# Number of rejected rows to report individually when ingesting worklogs
+_rejected_samples = 20
 
 
 def _parse_modifier(modifier: str) -> Union[timedelta, None]:
@@ -77,19 +92,263 @@ def remove_worklog(config: BaseConfig) -> str:
         raise e
 
 
-def add_worklog(row: Dict[str, str], config: BaseConfig) -> None:
+def prepare_worklogs(rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalise worklog rows so that they can be inserted in bulk, timestamping rows that do not carry a timestamp"""
+    now = datetime.now()
+    _rows = []
+
+    for row in rows:
+        assert row.get('project_id') and row.get('action_id'), f'Worklog {row} lacks a project_id or action_id'
+
+        _timestamp = row.get('timestamp') or now
+        _timestamp = datetime.fromisoformat(_timestamp) if isinstance(_timestamp, str) else _timestamp
+
+        _rows.append({
+            'project_id': row['project_id'],
+            'action_id': row['action_id'],
+            'ticket_key': row.get('ticket_key'),
+            'timestamp': _timestamp
+        })
+
+    return _rows
+
+
+def add_worklogs(rows: Sequence[Dict[str, Any]], config: BaseConfig) -> None:
     try:
+        _rows = prepare_worklogs(rows)
+
+        if len(_rows) == 0:
+            return
+
         if config.backend.driver == 'csv':
-            csv_writer(row, config)
+            csv_writer(_rows, config)
         elif config.backend.driver == 'log':
-            log_writer(row, config)
-        elif config.backend.driver == 'postgresql':
-            postgresql_writer(row, config)
+            log_writer(_rows, config)
+        elif config.backend.driver in ['postgresql', 'postgresql-async']:
+            postgresql_writer(_rows, config)
         elif config.backend.driver == 'sqlite':
-            sqlite_writer(row, config)
+            sqlite_writer(_rows, config)
         elif config.backend.driver == 'stdout':
-            print(row)
+            for _row in _rows:
+                print({**_row, 'timestamp': _row['timestamp'].isoformat()})
 
     except Exception as e:
         logging.error(str(e))
         raise e
+
+
+def add_worklog(row: Dict[str, str], config: BaseConfig) -> None:
+    add_worklogs([row], config)
+
+
+def parse_timestamp(timestamp: Union[str, datetime, None]) -> Union[datetime, None]:
+    """Parse an ISO timestamp, passing datetimes and None through"""
+    return datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+
+
+def read_csv_worklogs(config: BaseConfig) -> Iterator[Dict[str, Any]]:
+    """Read worklogs written by the CSV backend one by one, in the order in which they were written"""
+    with open(config.csv.output, mode='r', encoding='utf-8', newline='') as infile:
+        reader = csv.DictReader(infile, delimiter=config.csv.delimiter, quoting=csv_quoting(config.csv.quoting))
+
+        for row in reader:
+            yield {
+                **row,
+                'worklog_id': int(float(row['worklog_id'])),
+                'ticket_key': row.get('ticket_key') or None,
+                'timestamp': parse_timestamp(row['timestamp'])
+            }
+
+
+def read_journal_worklogs(config: BaseConfig) -> Iterator[Dict[str, Any]]:
+    """Read worklogs written by the log backend one by one, across rotated journal files, in the order written"""
+    for filename in journal_files(config.journal.output):
+        with open(filename, mode='r', encoding='utf-8') as infile:
+            for line in infile:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Only a journal's last record may be partially written, i.e. if the server crashed mid-write
+                    logging.warning('Skipping partially written record in journal %s', filename)
+                    continue
+
+                yield {**record, 'timestamp': parse_timestamp(record['timestamp'])}
+
+
+def read_file_worklogs(config: BaseConfig) -> Iterator[Dict[str, Any]]:
+    """Read worklogs written by a file backend one by one"""
+    assert config.backend.driver in file_backends, f'Backend {config.backend.driver} does not store worklogs in files'
+
+    return read_csv_worklogs(config) if config.backend.driver == 'csv' else read_journal_worklogs(config)
+
+
+def read_worklogs(config: BaseConfig, start: Union[str, datetime, None] = None,
+                  end: Union[str, datetime, None] = None, projects: Union[Sequence[str], None] = None,
+                  chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """Stream worklogs from the storage backend in chunks, optionally within [start, end) and for given projects"""
+    try:
+        assert chunk_size > 0, 'Chunk size must be positive'
+
+        _start = parse_timestamp(start)
+        _end = parse_timestamp(end)
+
+        if config.backend.driver in database_backends:
+            conditions = [
+                *([worklog.c.timestamp >= _start] if _start is not None else []),
+                *([worklog.c.timestamp < _end] if _end is not None else []),
+                *([worklog.c.project_id.in_(projects)] if projects else [])
+            ]
+            query = select([worklog]).where(and_(*conditions)).order_by(worklog.c.worklog_id)
+
+            # Server-side cursors keep the database from sending (and the driver from buffering) the full result
+            with get_engine(config).connect() as connection:
+                result = connection.execution_options(stream_results=True).execute(query)
+
+                for rows in iter(lambda: result.fetchmany(chunk_size), []):
+                    yield [{**x, 'timestamp': x['timestamp'].isoformat()} for x in map(dict, rows)]
+
+        elif config.backend.driver in file_backends:
+            rows = (x for x in read_file_worklogs(config)
+                    if (_start is None or x['timestamp'] >= _start) and (_end is None or x['timestamp'] < _end)
+                    and (not projects or x['project_id'] in projects))
+
+            for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+                yield [{**x, 'timestamp': x['timestamp'].isoformat()} for x in chunk]
+
+        else:
+            raise AssertionError(f'Reading worklogs is not supported for backend {config.backend.driver}')
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+def _read_ingest_chunks(filename: str, chunk_size: int) -> Iterator[List[Tuple[int, Dict[str, str]]]]:
+    """Read a CSV file of worklogs in chunks of (line number, row), detecting its delimiter from the header"""
+    with open(filename, mode='r', encoding='utf-8', newline='') as infile:
+        try:
+            dialect = csv.Sniffer().sniff(infile.readline(), delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+
+        infile.seek(0)
+        reader = csv.DictReader(infile, dialect=dialect)
+
+        missing = {'project_id', 'action_id', 'timestamp'} - set(reader.fieldnames or [])
+        assert not missing, f'File "{filename}" lacks column(s): {", ".join(sorted(missing))}'
+
+        rows = ((reader.line_num, x) for x in reader)
+
+        yield from iter(lambda: list(islice(rows, chunk_size)), [])
+
+
+def _validate_worklog(row: Dict[str, str], project_ids: Set[str], action_ids: Set[str]) -> Dict[str, Any]:
+    """Normalise an ingested worklog, raising a ValueError describing why it is rejected otherwise"""
+    _project = (row.get('project_id') or '').strip()
+    _action = (row.get('action_id') or '').strip()
+
+    if _project not in project_ids:
+        raise ValueError(f'Unknown project "{_project}"')
+
+    if _action not in action_ids:
+        raise ValueError(f'Unknown action "{_action}"')
+
+    try:
+        _timestamp = datetime.fromisoformat((row.get('timestamp') or '').strip())
+    except ValueError:
+        raise ValueError(f'Invalid timestamp "{row.get("timestamp")}"')
+
+    # Worklogs are recorded in naive local time
+    _timestamp = _timestamp.astimezone().replace(tzinfo=None) if _timestamp.tzinfo is not None else _timestamp
+
+    return {
+        'project_id': _project,
+        'action_id': _action,
+        'ticket_key': (row.get('ticket_key') or '').strip() or None,
+        'timestamp': _timestamp
+    }
+
+
+def _known_ids(connection: Connection) -> Tuple[Set[str], Set[str]]:
+    # Deleted projects and actions are included, since historical worklogs may well refer to them
+    project_ids = {x for x, in connection.execute(select([project.c.project_id]))}
+    action_ids = {x for x, in connection.execute(select([action.c.action_id]))}
+
+    return project_ids, action_ids
+
+
+def _copy_worklogs(connection: Connection, rows: Sequence[Dict[str, Any]],
+                   columns: Sequence[str] = ('project_id', 'action_id', 'ticket_key', 'timestamp')) -> None:
+    """Insert worklogs via COPY, using the transaction of a SQLAlchemy connection to PostgreSQL"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [x[k].isoformat() if k == 'timestamp' else x[k] for k in columns] for x in rows)
+    buffer.seek(0)
+
+    # Unquoted empty values are read as NULL
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY worklog ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def ingest_worklogs(filename: str, config: BaseConfig, chunk_size: int = 1000) -> Dict[str, Any]:
+    """Import worklogs from a CSV file in a single transaction, skipping (and reporting) rows which fail validation
+
+    The file is read in chunks, each of which is copied (PostgreSQL) or inserted via executemany (SQLite) once its rows
+    have been checked against the project and action ids known to the database.
+    """
+    try:
+        assert config.backend.driver in database_backends, 'Ingesting worklogs requires a database backend'
+        assert os.path.isfile(filename), f'File "{filename}" does not exist'
+        assert chunk_size > 0, 'Chunk size must be positive'
+
+        start = perf_counter()
+        count, rejected, samples = 0, 0, []
+
+        with get_engine(config).begin() as connection:
+            project_ids, action_ids = _known_ids(connection)
+
+            for chunk in _read_ingest_chunks(filename, chunk_size):
+                rows = []
+
+                for line, row in chunk:
+                    try:
+                        rows.append(_validate_worklog(row, project_ids, action_ids))
+                    except ValueError as e:
+                        rejected += 1
+                        samples.append((line, str(e))) if len(samples) < _rejected_samples else None
+
+                if len(rows) == 0:
+                    continue
+                elif config.backend.driver in ['postgresql', 'postgresql-async']:
+                    _copy_worklogs(connection, rows)
+                else:
+                    connection.execute(worklog.insert(), rows)
+
+                count += len(rows)
+
+        seconds = perf_counter() - start
+
+        logging.info('Ingested %d worklogs from %s in %.2f s, rejected %d', count, filename, seconds, rejected)
+
+        return {
+            'worklogs': count,
+            'rejected': rejected,
+            'rejected_lines': samples,
+            'seconds': seconds,
+            'rows_per_second': count / seconds if seconds > 0 else 0.0
+        }
+
+    except Exception as e:
+        logging.error(str(e))
+        raise e
+
+
+def print_ingest(result: Dict[str, Any]) -> None:
+    print(f'Ingested {result["worklogs"]} worklogs in {result["seconds"]:.2f} s '
+          f'({result["rows_per_second"]:.0f} rows/s), rejected {result["rejected"]}')
+
+    for line, reason in result['rejected_lines']:
+        print(f'Line {line}: {reason}')
+
+    if result['rejected'] > len(result['rejected_lines']):
+        print(f'... and {result["rejected"] - len(result["rejected_lines"])} more rejected row(s)')
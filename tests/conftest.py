@@ -5,8 +5,9 @@ import pytest
 from sqlalchemy import MetaData
 from sqlalchemy.engine import Engine
 
+from gravity.catalog import get_catalog
 from gravity.config import BaseConfig
-from gravity.database import _metadata, get_engine
+from gravity.database import _metadata, dispose_engines, get_engine
 
 
 @pytest.fixture(scope='module')
@@ -29,3 +30,6 @@ def test_database(prepared_config, tmpdir) -> Tuple[BaseConfig, Engine, MetaData
     _engine = get_engine(_config)
 
     yield _config, _engine, _metadata
+
+    dispose_engines()
+    get_catalog().invalidate()
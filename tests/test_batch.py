@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import gravity.database
+from gravity.backend.batch import WorklogBatcher
+from gravity.backend.executor import RequestExecutor
+from gravity.model import action, project, worklog
+
+
+@pytest.fixture(scope='function')
+def catalog_database(test_database):
+    """Prepare a test database containing a single project and action"""
+    config, engine, metadata = test_database
+
+    gravity.database.initialise(config)
+
+    engine.execute(project.insert(), {'project_id': 'p1', 'project_name': 'foo'})
+    engine.execute(action.insert(), {'action_id': 'a1', 'action_name': 'start'})
+
+    yield config, engine, metadata
+
+
+def test_batcher_group_commit(catalog_database) -> None:
+    """Check that concurrently submitted worklogs are written in a single batch"""
+    config, engine, _ = catalog_database
+    config.set_override(name='batch_linger', override=50, group='server')
+
+    executor = RequestExecutor(config)
+    batcher = WorklogBatcher(config, executor)
+    batches = []
+
+    async def run():
+        batcher.start()
+
+        _write = batcher._write
+
+        async def write(rows):
+            batches.append(len(rows))
+            await _write(rows)
+
+        batcher._write = write
+
+        await asyncio.gather(*[batcher.submit([{'project_id': 'p1', 'action_id': 'a1'}]) for _ in range(10)])
+        await batcher.stop()
+
+    asyncio.run(run())
+    executor.shutdown()
+    config.clear_override(name='batch_linger', group='server')
+
+    assert batches == [10]
+    assert len(engine.execute(worklog.select()).fetchall()) == 10
+
+
+def test_batcher_invalid_submission(catalog_database) -> None:
+    """Check that an invalid submission only fails its own request, not the rest of its batch"""
+    config, engine, _ = catalog_database
+
+    executor = RequestExecutor(config)
+    batcher = WorklogBatcher(config, executor)
+
+    async def run():
+        batcher.start()
+
+        results = await asyncio.gather(
+            batcher.submit([{'project_id': 'p1', 'action_id': 'a1'}]),
+            batcher.submit([{'project_id': 'missing', 'action_id': 'a1'}]),
+            batcher.submit([{'project_id': 'p1', 'action_id': 'a1', 'ticket_key': '42'}]),
+            return_exceptions=True)
+
+        await batcher.stop()
+
+        return results
+
+    results = asyncio.run(run())
+    executor.shutdown()
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], Exception)
+    assert len(engine.execute(worklog.select()).fetchall()) == 2
+
+
+def test_batcher_stop(catalog_database) -> None:
+    """Check that stopping the batcher writes pending submissions rather than leaving their requests waiting"""
+    config, engine, _ = catalog_database
+    config.set_override(name='batch_linger', override=5000, group='server')
+
+    executor = RequestExecutor(config)
+    batcher = WorklogBatcher(config, executor)
+
+    async def run():
+        batcher.start()
+
+        submissions = [asyncio.ensure_future(batcher.submit([{'project_id': 'p1', 'action_id': 'a1'}]))
+                       for _ in range(5)]
+        await asyncio.sleep(0.05)
+
+        # The first batch is still lingering for more submissions, and stopping must not wait it out
+        await asyncio.wait_for(batcher.stop(), timeout=1)
+
+        return await asyncio.wait_for(asyncio.gather(*submissions, return_exceptions=True), timeout=1)
+
+    results = asyncio.run(run())
+    executor.shutdown()
+    config.clear_override(name='batch_linger', group='server')
+
+    assert results == [None] * 5
+    assert len(engine.execute(worklog.select()).fetchall()) == 5
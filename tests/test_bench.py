@@ -0,0 +1,24 @@
+import pytest
+
+from gravity.bench import run_benchmark
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'csv', 'stdout'])
+def test_run_benchmark(prepared_config, backend):
+    """Check that every transport is benchmarked against the backend, and that every request succeeds"""
+    results = run_benchmark(prepared_config, ['tcp', 'unix'], [backend], clients=2, requests=10, writes=0.5)
+
+    assert [(x['transport'], x['backend']) for x in results] == [('tcp', backend), ('unix', backend)]
+
+    for result in results:
+        assert result['requests'] == 20
+        assert result['errors'] == 0
+        assert result['requests_per_second'] > 0
+        assert 0 < result['latency_ms']['p50'] <= result['latency_ms']['p99'] <= result['latency_ms']['max']
+
+
+@pytest.mark.parametrize('backend', ['postgresql', 'postgresql-async'])
+def test_benchmark_requires_database(prepared_config, backend):
+    """Check that PostgreSQL backends are not benchmarked against the configured database"""
+    with pytest.raises(AssertionError, match='--database'):
+        run_benchmark(prepared_config, ['tcp'], ['sqlite', backend], clients=1, requests=1)
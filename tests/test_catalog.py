@@ -0,0 +1,129 @@
+import multiprocessing
+
+import gravity.catalog
+import gravity.database
+import gravity.project
+from gravity.backend.server import request_handler
+from gravity.catalog import Catalog, get_catalog
+from gravity.model import project
+
+
+def test_catalog_write_through(test_database) -> None:
+    """Check that cached projects are served without querying the database, and updated by write paths"""
+    config, engine, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': '1', 'project_name': 'foo'}], config)
+
+    assert gravity.project.get_projects(config) == [{'project_id': '1', 'project_name': 'foo', 'project_key': None}]
+
+    # Rows written behind the server's back are not picked up by the cache
+    engine.execute(project.insert(), {'project_id': '2', 'project_name': 'bar'})
+
+    assert [x['project_id'] for x in gravity.project.get_projects(config)] == ['1']
+
+    gravity.project.insert_projects([{'project_id': '3', 'project_name': 'baz'}], config)
+    gravity.project.annotate_project({'project': '1', 'key': 'FOO'}, config)
+    gravity.project.remove_projects(['3'], config)
+
+    assert gravity.project.get_projects(config) == [{'project_id': '1', 'project_name': 'foo', 'project_key': 'FOO'}]
+    assert gravity.project.get_projects(config) == [
+        {k: v for k, v in x.items() if k in ['project_id', 'project_name', 'project_key']}
+        for x in engine.execute(project.select().where(project.c.project_id == '1'))
+    ]
+
+
+def test_catalog_version(test_database) -> None:
+    """Check that catalogs are only returned to clients whose catalog version is out of date"""
+    config, _, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': '1', 'project_name': 'foo'}], config)
+
+    response = request_handler({'request': 'get_projects'}, config)()
+    version = response['version']
+
+    assert len(response['projects']) == 1
+    assert request_handler({'request': 'get_projects', 'payload': {'version': version}}, config)() == {
+        'version': version
+    }
+
+    gravity.project.remove_projects(['1'], config)
+
+    assert get_catalog().version != version
+
+
+def test_catalog_load_race(test_database, monkeypatch) -> None:
+    """Check that rows loaded while a write is committed do not hide that write from the cache"""
+    config, _, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': '1', 'project_name': 'foo'}], config)
+    get_catalog().invalidate()
+
+    _load_projects = gravity.project.load_projects
+    loads = []
+
+    def load_projects(_config):
+        projects = _load_projects(_config)
+
+        # Another thread commits a write after the rows have been read, but before they fill the cache
+        if not loads:
+            gravity.project.insert_projects([{'project_id': '2', 'project_name': 'bar'}], _config)
+
+        loads.append(projects)
+
+        return projects
+
+    monkeypatch.setattr(gravity.project, 'load_projects', load_projects)
+
+    assert sorted(x['project_id'] for x in gravity.project.get_projects(config)) == ['1', '2']
+    assert len(loads) == 2
+
+
+def test_catalog_version_epoch(test_database, monkeypatch) -> None:
+    """Check that versions handed out before a server restart get the full catalogs, even if the count matches"""
+    config, _, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': '1', 'project_name': 'foo'}], config)
+
+    version = request_handler({'request': 'get_projects'}, config)()['version']
+
+    # A restarted server counts its changes from scratch
+    restarted = Catalog()
+
+    while restarted.version.split(':')[1] != version.split(':')[1]:
+        restarted.invalidate()
+
+    monkeypatch.setattr(gravity.catalog, '_catalog', restarted)
+    response = request_handler({'request': 'get_projects', 'payload': {'version': version}}, config)()
+
+    assert response['version'] != version and len(response['projects']) == 1
+
+
+def test_catalog_shared_version() -> None:
+    """Check that workers sharing a catalog version drop their cache when another worker changes the catalog"""
+    generation = multiprocessing.Value('Q', 0)
+    first, second = Catalog(), Catalog()
+
+    for catalog in [first, second]:
+        catalog.share(generation, 'epoch')
+        catalog.set_projects([{'project_id': '1', 'project_name': 'foo'}])
+        catalog.sync()
+
+    first.put_projects([{'project_id': '2', 'project_name': 'bar'}])
+
+    assert first.version == second.version == 'epoch:1'
+    assert second.has_projects()
+
+    second.sync()
+
+    assert first.has_projects() and not second.has_projects()
+
+    # A change made on top of a missed change must not keep the stale cache either
+    second.set_projects([{'project_id': '1', 'project_name': 'foo'}])
+    first.remove_projects(['2'])
+    second.put_projects([{'project_id': '3', 'project_name': 'baz'}])
+
+    assert not second.has_projects() and second.version == 'epoch:3'
@@ -0,0 +1,114 @@
+import os.path
+
+import gravity.action
+import gravity.database
+import gravity.project
+from gravity.backend.cache import ClientCatalog
+from gravity.backend.server import request_handler
+from gravity.changes import get_changes_since
+from gravity.database import next_sequence
+from gravity.model import project
+
+
+class _Session(object):
+    """Answers client requests in-process, counting the projects and actions sent by the server"""
+
+    def __init__(self, config):
+        self.config = config
+        self.rows = 0
+
+    def request(self, message):
+        response = request_handler(message, self.config)()
+        self.rows += len(response['projects']) + len(response['actions'])
+
+        return {'response': response}
+
+
+def test_changes_since(test_database) -> None:
+    """Check that only projects and actions changed after a sequence number are returned, including removed ones"""
+    config, _, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': str(x), 'project_name': f'project {x}'} for x in range(3)], config)
+    gravity.action.insert_actions([{'action_id': 'start', 'action_name': 'Start'}], config)
+
+    changes = get_changes_since(None, config)
+
+    assert changes['full'] and len(changes['projects']) == 3 and len(changes['actions']) == 1
+    assert changes['count'] == {'projects': 3, 'actions': 1}
+
+    unchanged = get_changes_since(changes['sequence'], config)
+
+    assert (unchanged['projects'], unchanged['actions'], unchanged['sequence']) == ([], [], changes['sequence'])
+
+    gravity.project.remove_projects(['1'], config)
+    gravity.project.annotate_project({'project': '2', 'key': 'FOO'}, config)
+
+    delta = get_changes_since(changes['sequence'], config)
+
+    assert not delta['full'] and delta['sequence'] > changes['sequence']
+    assert sorted((x['project_id'], x['project_key'], x['deleted']) for x in delta['projects']) == [
+        ('1', None, True), ('2', 'FOO', False)]
+    assert delta['actions'] == [] and delta['count']['projects'] == 2
+
+    # A sequence number the server has not reached yet, e.g. of a restored database, is answered with everything
+    ahead = get_changes_since(delta['sequence'] + 1, config)
+
+    assert ahead['full'] and ahead['sequence'] == delta['sequence'] and len(ahead['projects']) == 2
+
+
+def test_changes_commit_order(test_database) -> None:
+    """Check that a change committed after a client's sync is sent with the next sync, however long it took"""
+    config, engine, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': str(x), 'project_name': f'project {x}'} for x in range(3)], config)
+
+    changes = get_changes_since(None, config)
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        connection.execute(project.update().where(project.c.project_id == '0')
+                           .values(project_key='FOO', change_sequence=next_sequence(connection)))
+
+        # Changes still being written are not visible yet, so the sequence number must not advance past them
+        unchanged = get_changes_since(changes['sequence'], config)
+
+        transaction.commit()
+
+    assert unchanged['projects'] == [] and unchanged['sequence'] == changes['sequence']
+
+    delta = get_changes_since(unchanged['sequence'], config)
+
+    assert [(x['project_id'], x['project_key']) for x in delta['projects']] == [('0', 'FOO')]
+
+
+def test_client_catalog(test_database, tmpdir) -> None:
+    """Check that the client cache survives restarts, fetches deltas only, and recovers from pruned rows"""
+    config, engine, _ = test_database
+    config.set_override(name='cache_dir', override=os.path.join(tmpdir, 'cache'), group='frontend')
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{'project_id': str(x), 'project_name': str(x)} for x in range(50)], config)
+    gravity.action.insert_actions([{'action_id': 'start', 'action_name': 'Start'}], config)
+
+    session = _Session(config)
+
+    assert len(ClientCatalog(config).sync(session).get_projects()) == 50
+    assert session.rows == 51
+
+    # A new client starts from the cache on disk, and only receives the changed project
+    gravity.project.annotate_project({'project': '7', 'key': 'FOO'}, config)
+    catalog = ClientCatalog(config).sync(session)
+
+    assert session.rows == 52
+    assert [x for x in catalog.get_projects() if x['project_id'] == '7'][0]['project_key'] == 'FOO'
+
+    # Pruned projects cannot be told apart from unchanged ones, so the client falls back to fetching everything
+    engine.execute(project.delete().where(project.c.project_id == '3'))
+    catalog.sync(session)
+
+    assert len(catalog.get_projects()) == 49
+    assert session.rows == 52 + 50
+
+    config.clear_override(name='cache_dir', group='frontend')
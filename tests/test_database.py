@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from sqlalchemy import inspect
 from sqlalchemy.engine import Engine, url
 
 import gravity.database
@@ -60,6 +61,52 @@ def test_get_engine_none(prepared_config) -> None:
     assert engine is None
 
 
+def test_get_engine_cached(test_database) -> None:
+    """Check that engines are created once per set of backend settings and reused afterwards"""
+    config, engine, _ = test_database
+
+    assert gravity.database.get_engine(config) is engine
+
+    config.set_override(name='pool_size', override=2, group='sqlite')
+
+    engine_resized = gravity.database.get_engine(config)
+
+    assert engine_resized is not engine
+    assert engine_resized.pool.size() == 2
+
+    config.clear_override(name='pool_size', group='sqlite')
+
+    assert gravity.database.get_engine(config) is engine
+
+
+def test_get_pool_statistics(test_database) -> None:
+    """Check that pool counters track connection checkouts"""
+    config, engine, _ = test_database
+
+    gravity.database.initialise(config)
+
+    checkouts = gravity.database.get_pool_statistics(config)['checkouts']
+
+    with engine.connect() as connection:
+        connection.execute(gravity.model.project.select()).fetchall()
+
+    statistics = gravity.database.get_pool_statistics(config)
+
+    assert statistics['checkouts'] == checkouts + 1
+    assert statistics['waits'] == 0
+    assert statistics['size'] == config.sqlite.pool_size
+
+
+def test_get_engine_sqlite_pragmas(test_database) -> None:
+    """Check that configured SQLite pragmas are applied to every pooled connection"""
+    config, engine, _ = test_database
+
+    with engine.connect() as connection:
+        assert connection.execute('PRAGMA journal_mode').scalar() == config.sqlite.journal_mode
+        assert connection.execute('PRAGMA busy_timeout').scalar() == config.sqlite.busy_timeout
+        assert connection.execute('PRAGMA foreign_keys').scalar() == 1
+
+
 def test_initialise(test_database) -> None:
     """Check that initialising all database tables meets expectations"""
     config, engine, metadata = test_database
@@ -72,6 +119,36 @@ def test_initialise(test_database) -> None:
         assert engine.has_table(_table.name)
 
 
+def test_initialise_indexes(test_database) -> None:
+    """Check that initialising adds missing indexes to tables which already exist"""
+    config, engine, metadata = test_database
+
+    gravity.database.initialise(config)
+
+    index = next(iter(metadata.tables['worklog'].indexes))
+    index.drop(engine)
+
+    gravity.database.initialise(config)
+
+    for table in metadata.sorted_tables:
+        _indexes = {x['name'] for x in inspect(engine).get_indexes(table.name)}
+
+        assert {x.name for x in table.indexes} <= _indexes
+
+
+def test_analyze(test_database, capsys) -> None:
+    """Check that query plans are printed for all core queries"""
+    config, _, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.database.analyze(config)
+
+    output = capsys.readouterr().out
+
+    assert 'ix_worklog_project_timestamp' in output
+    assert all(f'-- {x}' in output for x in gravity.database._core_queries('sqlite'))
+
+
 def test_drop(test_database) -> None:
     """Check that dropping all database tables meets expectations"""
     config, engine, metadata = test_database
@@ -97,8 +174,8 @@ def test_prune(test_database) -> None:
     _select = gravity.model.project.select()
 
     rows = [
-        ['1', 'foo', 'foo description', 'FOO', _now, _now, _now],
-        ['2', 'bar', 'bar description', 'BAR', _now, _now, None],
+        ['1', 'foo', 'foo description', 'FOO', _now, _now, _now, 1],
+        ['2', 'bar', 'bar description', 'BAR', _now, _now, None, 2],
     ]
     rows = [dict(zip(_keys, x)) for x in rows]
 
@@ -127,8 +204,8 @@ def test_truncate(test_database) -> None:
     _select = gravity.model.project.select()
 
     rows = [
-        ['1', 'foo', 'foo description', 'FOO', _now, _now, _now],
-        ['2', 'bar', 'bar description', 'BAR', _now, _now, None],
+        ['1', 'foo', 'foo description', 'FOO', _now, _now, _now, 1],
+        ['2', 'bar', 'bar description', 'BAR', _now, _now, None, 2],
     ]
     rows = [dict(zip(_keys, x)) for x in rows]
 
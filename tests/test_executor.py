@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from gravity.backend.executor import RequestExecutor
+
+
+def test_executor_thread(prepared_config) -> None:
+    """Check that handlers run outside of the event loop's thread"""
+    config = prepared_config
+    config.set_override(name='executor', override='thread', group='server')
+
+    executor = RequestExecutor(config)
+
+    async def run():
+        return await executor.run(lambda: threading.current_thread().name)
+
+    assert asyncio.run(run()).startswith('gravity')
+
+    executor.shutdown()
+
+
+def test_executor_timeout(prepared_config) -> None:
+    """Check that read requests exceeding the configured timeout raise an error, while writes are waited for"""
+    config = prepared_config
+    config.set_override(name='executor', override='thread', group='server')
+    config.set_override(name='request_timeout', override=0.01, group='server')
+
+    executor = RequestExecutor(config)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(executor.run(lambda: time.sleep(0.1)))
+
+    assert asyncio.run(executor.run(lambda: time.sleep(0.1) or 'written', write=True)) == 'written'
+
+    executor.shutdown()
+    config.clear_override(name='request_timeout', group='server')
+
+
+def test_executor_backpressure(prepared_config) -> None:
+    """Check that requests are rejected once the request queue is full"""
+    config = prepared_config
+    config.set_override(name='executor', override='thread', group='server')
+    config.set_override(name='threads', override=1, group='server')
+    config.set_override(name='queue_size', override=1, group='server')
+
+    executor = RequestExecutor(config)
+    event = threading.Event()
+
+    async def run():
+        pending = [asyncio.ensure_future(executor.run(event.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(AssertionError, match='queue is full'):
+            await executor.run(event.wait)
+
+        event.set()
+
+        return await asyncio.gather(*pending)
+
+    assert asyncio.run(run()) == [True, True]
+
+    executor.shutdown()
+    config.clear_override(name='threads', group='server')
+    config.clear_override(name='queue_size', group='server')
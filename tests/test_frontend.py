@@ -0,0 +1,86 @@
+import pytest
+
+import gravity.frontend.curses
+from gravity.frontend.curses import CursesFrontend, transform_actions
+from gravity.search import ProjectIndex
+
+
+def test_transform_actions() -> None:
+    """Check that actions are assigned the first letter of their name which is still free"""
+    actions = [{'action_id': str(x), 'action_name': name} for x, name in enumerate(['start', 'stop', 'sleep'])]
+
+    assert {k: v['action_name'] for k, v in transform_actions(actions).items()} == {
+        'S': 'start', 'T': 'stop', 'L': 'sleep'}
+
+    with pytest.raises(ValueError):
+        transform_actions([{'action_id': '1', 'action_name': 'ab'}, {'action_id': '2', 'action_name': 'ba'},
+                           {'action_id': '3', 'action_name': 'a-b'}])
+
+
+def test_fuzzy_filter() -> None:
+    """Check that projects are filtered as a subsequence of the query while typing, ranking compact matches first"""
+    projects = [{'project_id': str(x), 'project_name': f'Project {x:03d}'} for x in range(300)]
+    projects += [{'project_id': 'g', 'project_name': 'Gravity'}, {'project_id': 'd', 'project_name': 'Database'}]
+
+    frontend = CursesFrontend(None, None, None, None)
+    frontend.index = ProjectIndex(projects)
+    frontend.stage = 'project'
+    frontend._search('')
+
+    assert len(frontend.matches) == 302
+
+    for character in 'p09':
+        frontend.handle(character)
+
+    assert [x['project_name'] for x in frontend.matches[:3]] == ['Project 090', 'Project 091', 'Project 092']
+    assert len(frontend.matches) == 21
+
+    frontend.handle('\x7f')
+    frontend.handle('\x7f')
+
+    assert frontend.query == 'p' and len(frontend.matches) == 300
+
+    frontend.handle('\x1b')
+    frontend.handle('A')
+
+    assert [x['project_name'] for x in frontend.matches] == ['Database', 'Gravity']
+
+
+class _Catalog(object):
+    """Stands in for the client-side catalog, which never changes"""
+
+    modified = False
+
+    def sync(self, session):
+        return self
+
+    def get_projects(self):
+        return [{'project_id': '1', 'project_name': 'Gravity'}]
+
+    def get_actions(self):
+        return [{'action_id': 'start', 'action_name': 'start'}]
+
+
+def test_usage_ttl(monkeypatch) -> None:
+    """Check that starting a new worklog only fetches usage and rebuilds the search index once usage is stale"""
+    requests = []
+
+    def send_message(message, config, session):
+        requests.append(message['request'])
+        return {'response': {'projects': {'1': 0.5 / len(requests)}, 'tickets': []}}
+
+    monkeypatch.setattr(gravity.frontend.curses, 'send_message', send_message)
+
+    frontend = CursesFrontend(None, None, None, _Catalog())
+    frontend._start()
+    index = frontend.index
+
+    frontend._start()
+
+    assert requests == ['get_project_usage'] and frontend.index is index
+
+    frontend.fetched -= gravity.frontend.curses._usage_ttl + 1
+    frontend._start()
+
+    assert len(requests) == 2 and frontend.index is not index
+    assert frontend.matches[0]['weight'] == 0.25
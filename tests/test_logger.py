@@ -0,0 +1,131 @@
+import logging
+import os.path
+
+import pytest
+
+import gravity.logger
+from gravity.logger import RateLimitFilter, initialise_logging
+
+
+def _record(message: str, level: int = logging.ERROR, lineno: int = 1) -> logging.LogRecord:
+    return logging.LogRecord('test', level, __file__, lineno, message, None, None)
+
+
+def test_rate_limit_filter() -> None:
+    _filter = RateLimitFilter(limit=2, interval=60)
+
+    assert [_filter.filter(_record(f'error {x}')) for x in range(4)] == [True, True, False, False]
+
+    # Rate limits apply per call site, and only to errors
+    assert _filter.filter(_record('error', lineno=2))
+    assert all(_filter.filter(_record('warning', level=logging.WARNING)) for _ in range(4))
+
+
+def test_rate_limit_suppressed() -> None:
+    _filter = RateLimitFilter(limit=1, interval=0.01)
+    records = [_record(f'error {x}') for x in range(3)]
+
+    assert [_filter.filter(x) for x in records] == [True, False, False]
+
+    _filter._windows[(__file__, 1)][0] -= 1
+    record = _record('error 3')
+
+    assert _filter.filter(record)
+    assert record.getMessage() == 'error 3 (2 similar message(s) suppressed)'
+
+
+@pytest.fixture(scope='function')
+def root_logger():
+    """Restore the root logger's handlers and level after a test has initialised logging"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    root.handlers = []
+
+    yield root
+
+    gravity.logger._stop_listener()
+
+    for handler in root.handlers:
+        handler.close()
+
+    root.handlers, root.level = handlers, level
+
+
+def test_queue_logging(prepared_config, root_logger, tmpdir) -> None:
+    config = prepared_config
+    config.set_override(name='file', override=os.path.join(tmpdir, 'gravity.log'), group='log')
+    config.set_override(name='targets', override=['file'], group='log')
+    config.set_override(name='queue', override=True, group='log')
+
+    initialise_logging(config)
+
+    assert isinstance(root_logger.handlers[0], gravity.logger.LazyQueueHandler)
+
+    for x in range(20):
+        logging.info('Worklog %d', x)
+        logging.error('Error %d', x)
+
+    gravity.logger._stop_listener()
+
+    with open(config.log.file, mode='r', encoding='utf-8') as infile:
+        lines = infile.read().splitlines()
+
+    assert len([x for x in lines if 'INFO' in x]) == 20
+    assert len([x for x in lines if 'ERROR' in x]) == config.log.rate_limit
+    assert lines[0].endswith('test_logger: Worklog 0')
+
+    for name in ['file', 'targets', 'queue']:
+        config.clear_override(name=name, group='log')
+
+
+def test_rate_limit_handlers(prepared_config, root_logger, tmpdir) -> None:
+    """Check that records logged to several targets count only once against the rate limit of each target"""
+    config = prepared_config
+    config.set_override(name='file', override=os.path.join(tmpdir, 'gravity.log'), group='log')
+    config.set_override(name='targets', override=['file', 'console'], group='log')
+
+    initialise_logging(config)
+
+    for x in range(20):
+        logging.error('Error %d', x)
+
+    with open(config.log.file, mode='r', encoding='utf-8') as infile:
+        assert len(infile.read().splitlines()) == config.log.rate_limit
+
+    for name in ['file', 'targets']:
+        config.clear_override(name=name, group='log')
+
+
+def test_queue_logging_fork(prepared_config, root_logger, tmpdir) -> None:
+    """Check that a forked process, e.g. a daemon or server worker, keeps logging via a restarted listener"""
+    config = prepared_config
+    config.set_override(name='file', override=os.path.join(tmpdir, 'gravity.log'), group='log')
+    config.set_override(name='targets', override=['file'], group='log')
+    config.set_override(name='queue', override=True, group='log')
+
+    initialise_logging(config)
+    logging.info('Before fork')
+
+    pid = os.fork()
+
+    if pid == 0:
+        gravity.logger.restart_listener()
+
+        for x in range(3):
+            logging.info('Forked %d', x)
+
+        gravity.logger._stop_listener()
+        os._exit(0)
+
+    os.waitpid(pid, 0)
+    logging.info('Parent')
+    gravity.logger._stop_listener()
+
+    with open(config.log.file, mode='r', encoding='utf-8') as infile:
+        lines = infile.read().splitlines()
+
+    assert len([x for x in lines if 'Forked' in x]) == 3
+    assert any(x.endswith('Before fork') for x in lines) and any(x.endswith('Parent') for x in lines)
+
+    for name in ['file', 'targets', 'queue']:
+        config.clear_override(name=name, group='log')
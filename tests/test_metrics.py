@@ -0,0 +1,44 @@
+from gravity.backend.metrics import Histogram, Metrics
+
+
+def test_histogram() -> None:
+    histogram = Histogram(buckets=(0.1, 1.0))
+
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [('0.1', 2), ('1.0', 3), ('+Inf', 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 2.65
+
+
+def test_render() -> None:
+    metrics = Metrics()
+    metrics.request('add_worklog')
+    metrics.request('add_worklog', error=True)
+    metrics.phase('handler', 0.002, 'add_worklog')
+    metrics.register_gauge('gravity_write_queue_depth', lambda: 3)
+
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE gravity_requests_total counter' in lines
+    assert 'gravity_requests_total{request="add_worklog"} 2' in lines
+    assert 'gravity_request_errors_total{request="add_worklog"} 1' in lines
+    assert 'gravity_request_phase_seconds_bucket{phase="handler",request="add_worklog",le="0.0025"} 1' in lines
+    assert 'gravity_request_phase_seconds_bucket{phase="handler",request="add_worklog",le="0.001"} 0' in lines
+    assert 'gravity_request_phase_seconds_count{phase="handler",request="add_worklog"} 1' in lines
+    assert 'gravity_write_queue_depth 3' in lines
+
+
+def test_label_values() -> None:
+    """Check that client-chosen request types cannot create an unbounded number of series"""
+    metrics = Metrics()
+
+    for x in range(100):
+        metrics.request(f'request_{x}')
+
+    metrics.request(None)
+    rendered = metrics.render()
+
+    assert 'gravity_requests_total{request="other"} 36' in rendered
+    assert 'gravity_requests_total{request="invalid"} 1' in rendered
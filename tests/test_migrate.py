@@ -0,0 +1,111 @@
+import json
+import os.path
+from datetime import datetime, timedelta
+
+import pytest
+
+from gravity.backend.writer import close_writers
+from gravity.migrate import _driver, migrate
+from gravity.model import worklog
+from gravity.worklog import add_worklogs, read_csv_worklogs
+
+
+@pytest.fixture(scope='function')
+def csv_source(test_database, tmpdir):
+    """Prepare projects, actions and worklogs stored by the CSV backend, next to an empty SQLite database"""
+    config, engine, _ = test_database
+    overrides = [
+        ('csv', 'output', os.path.join(tmpdir, 'worklogs.csv')),
+        ('main', 'projects', os.path.join(tmpdir, 'projects.json')),
+        ('main', 'actions', os.path.join(tmpdir, 'actions.json'))
+    ]
+
+    for group, name, value in overrides:
+        config.set_override(name=name, override=value, group=group)
+
+    with open(config.main.projects, mode='w', encoding='utf-8') as outfile:
+        json.dump([{'project_id': 'p1', 'project_name': 'foo', 'project_key': 'F'}], outfile)
+
+    with open(config.main.actions, mode='w', encoding='utf-8') as outfile:
+        json.dump([{'action_id': 'a1', 'action_name': 'start'}], outfile)
+
+    config.set_override(name='driver', override='csv', group='backend')
+    add_worklogs([{'project_id': 'p1', 'action_id': 'a1', 'ticket_key': str(x) if x % 2 else None,
+                   'timestamp': datetime(2020, 6, 1, 9, 0) + timedelta(minutes=x)} for x in range(10)], config)
+    config.clear_override(name='driver', group='backend')
+    close_writers()
+
+    yield config, engine
+
+    for group, name, _ in overrides:
+        config.clear_override(name=name, group=group)
+
+
+def test_migrate(csv_source, tmpdir) -> None:
+    """Check that migrations preserve ids and timestamps, and resume after the last migrated worklog"""
+    config, engine = csv_source
+    source = list(read_csv_worklogs(config))
+
+    result = migrate(config, 'csv', 'sqlite', batch_size=3)
+
+    assert (result['projects'], result['actions'], result['worklogs'], result['checkpoint']) == (1, 1, 10, 10)
+
+    rows = [dict(x) for x in engine.execute(worklog.select().order_by(worklog.c.worklog_id))]
+
+    assert rows == source
+
+    # Interrupted migrations only copy worklogs beyond the last one present in the target
+    engine.execute(worklog.delete().where(worklog.c.worklog_id > 4))
+
+    assert migrate(config, 'csv', 'sqlite', batch_size=3)['worklogs'] == 6
+
+    config.set_override(name='output', override=os.path.join(tmpdir, 'migrated.csv'), group='csv')
+    config.set_override(name='projects', override=os.path.join(tmpdir, 'migrated.json'), group='main')
+
+    result = migrate(config, 'sqlite', 'csv')
+
+    assert (result['projects'], result['actions'], result['worklogs']) == (1, 0, 10)
+    assert list(read_csv_worklogs(config)) == source
+
+    with open(config.main.projects, mode='r', encoding='utf-8') as infile:
+        assert json.load(infile) == [{'project_id': 'p1', 'project_name': 'foo', 'project_key': 'F'}]
+
+
+def test_migrate_journal(csv_source, tmpdir) -> None:
+    """Check that journals written by the log backend can be replayed into a database"""
+    config, engine = csv_source
+    config.set_override(name='output', override=os.path.join(tmpdir, 'journal.jsonl'), group='journal')
+
+    source = list(read_csv_worklogs(config))
+
+    assert migrate(config, 'csv', 'log')['worklogs'] == 10
+    assert migrate(config, 'log', 'sqlite', batch_size=4)['worklogs'] == 10
+
+    assert [dict(x) for x in engine.execute(worklog.select().order_by(worklog.c.worklog_id))] == source
+
+    config.clear_override(name='output', group='journal')
+
+
+def test_driver_override(prepared_config) -> None:
+    """Check that temporarily switching the backend restores the previous override, or none at all"""
+    config = prepared_config
+    default = config.backend.driver
+
+    with _driver(config, 'csv'):
+        assert config.backend.driver == 'csv'
+
+    assert config.get_override(name='driver', group='backend') == (False, None)
+
+    config.set_default(name='driver', default='log', group='backend')
+
+    assert config.backend.driver == 'log'
+
+    config.set_default(name='driver', default=default, group='backend')
+    config.set_override(name='driver', override='stdout', group='backend')
+
+    with _driver(config, 'csv'):
+        pass
+
+    assert config.get_override(name='driver', group='backend') == (True, 'stdout')
+
+    config.clear_override(name='driver', group='backend')
@@ -0,0 +1,161 @@
+import asyncio
+import os
+
+import pytest
+
+import gravity.database
+import gravity.migrate
+import gravity.worklog
+from gravity.backend.client import ClientSession
+from gravity.backend.server import start_listener
+from gravity.catalog import get_catalog
+from gravity.model import action, project, worklog
+
+pytest.importorskip('asyncpg')
+
+# Tests against PostgreSQL only run if a (disposable!) database is given, since they truncate all of its tables
+_hostname = os.environ.get('GRAVITY_TEST_POSTGRESQL_HOSTNAME')
+
+pytestmark = pytest.mark.skipif(_hostname is None, reason='GRAVITY_TEST_POSTGRESQL_HOSTNAME is not set')
+
+
+@pytest.fixture(scope='function')
+def async_config(prepared_config, tmpdir):
+    """Prepare a postgresql-async server listening on a UNIX socket, backed by an empty database"""
+    config = prepared_config
+    overrides = [
+        ('backend', 'driver', 'postgresql-async'),
+        ('postgresql', 'hostname', _hostname),
+        ('postgresql', 'port', int(os.environ.get('GRAVITY_TEST_POSTGRESQL_PORT', 5432))),
+        ('postgresql', 'username', os.environ.get('GRAVITY_TEST_POSTGRESQL_USERNAME', 'postgres')),
+        ('postgresql', 'password', os.environ.get('GRAVITY_TEST_POSTGRESQL_PASSWORD', '')),
+        ('postgresql', 'database', os.environ.get('GRAVITY_TEST_POSTGRESQL_DATABASE', 'worklogs')),
+        ('socket', 'type', 'unix'),
+        ('unix', 'socket', os.path.join(tmpdir, 'gravity.sock'))
+    ]
+
+    for group, name, value in overrides:
+        config.set_override(name=name, override=value, group=group)
+
+    gravity.database.initialise(config)
+    gravity.database.truncate(config)
+    get_catalog().invalidate()
+
+    yield config
+
+    for group, name, _ in overrides:
+        config.clear_override(name=name, group=group)
+
+    gravity.database.dispose_engines()
+    get_catalog().invalidate()
+
+
+def run_with_server(config, client):
+    async def run():
+        server = asyncio.ensure_future(start_listener(config))
+
+        while not os.path.exists(config.unix.socket):
+            await asyncio.sleep(0.01)
+
+        try:
+            return await client()
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_async_backend(async_config) -> None:
+    """Check that catalogs and worklogs are written and read via asyncpg"""
+    config = async_config
+    projects = [{'project_id': str(x), 'project_name': f'project {x}'} for x in range(3)]
+    actions = [{'action_id': 'start', 'action_name': 'Start'}]
+    worklogs = [{'project_id': str(x % 3), 'action_id': 'start'} for x in range(10)]
+
+    async def client():
+        session = ClientSession(config)
+
+        await session.request({'request': 'insert_projects', 'payload': {'projects': projects}})
+        await session.request({'request': 'insert_actions', 'payload': {'actions': actions}})
+        await session.request({'request': 'remove_projects', 'payload': {'projects': ['2']}})
+
+        # A single worklog is inserted, while multiple worklogs are copied
+        await session.request({'request': 'add_worklog', 'payload': {'worklog': worklogs[0]}})
+        await session.request({'request': 'add_worklogs', 'payload': {'worklogs': worklogs[1:]}})
+
+        responses = await asyncio.gather(
+            session.request({'request': 'get_data'}),
+            session.request({'request': 'modify_worklog', 'payload': {'modifier': '+5m'}}),
+            session.request({'request': 'annotate_project', 'payload': {'annotation': {'project': '0', 'key': 'K'}}}),
+            session.request({'request': 'get_report', 'payload': {'group_by': ['project']}}))
+
+        await session.request({'request': 'remove_worklog'})
+        await session.close()
+
+        return responses
+
+    data, modified, annotated, report = [x['response'] for x in run_with_server(config, client)]
+
+    assert sorted(x['project_id'] for x in data['projects']) == ['0', '1']
+    assert data['actions'] == actions
+    assert modified.startswith('Modified last worklog')
+    assert annotated == 'Annotated project 0'
+    assert sum(x['worklogs'] for x in report['report']) == 9
+
+    with gravity.database.get_engine(config).connect() as connection:
+        assert connection.execute('SELECT count(*) FROM worklog').scalar() == 9
+        assert connection.execute("SELECT project_key FROM project WHERE project_id = '0'").scalar() == 'K'
+
+
+def test_ingest_worklogs(async_config, tmpdir) -> None:
+    """Check that worklogs are imported into PostgreSQL via COPY"""
+    config = async_config
+    filename = os.path.join(tmpdir, 'worklogs.csv')
+
+    with gravity.database.get_engine(config).begin() as connection:
+        connection.execute(project.insert(), [{'project_id': 'p1', 'project_name': 'foo'}])
+        connection.execute(action.insert(), [{'action_id': 'a1', 'action_name': 'start'}])
+
+    with open(filename, mode='w', encoding='utf-8') as outfile:
+        outfile.write('project_id,action_id,ticket_key,timestamp\n')
+        # Odd rows carry a ticket key which needs quoting, even rows none at all
+        tickets = ['', '"T,1"']
+        outfile.writelines(f'p1,a1,{tickets[x % 2]},2020-06-01T09:{x:02d}:00\n' for x in range(50))
+        outfile.write('p2,a1,,2020-06-01T10:00:00\n')
+
+    result = gravity.worklog.ingest_worklogs(filename, config, chunk_size=20)
+
+    assert (result['worklogs'], result['rejected']) == (50, 1)
+
+    with gravity.database.get_engine(config).connect() as connection:
+        assert connection.execute('SELECT count(*) FROM worklog WHERE ticket_key IS NULL').scalar() == 25
+        assert connection.execute('SELECT max(timestamp) FROM worklog').scalar().minute == 49
+
+
+def test_migrate(async_config, tmpdir) -> None:
+    """Check that worklogs migrated to PostgreSQL keep their ids, and that new worklogs are numbered after them"""
+    config = async_config
+    config.set_override(name='database', override=os.path.join(tmpdir, 'migrated.sqlite'), group='sqlite')
+    engine = gravity.database.get_engine(config)
+
+    with engine.begin() as connection:
+        connection.execute(project.insert(), [{'project_id': 'p1', 'project_name': 'foo'}])
+        connection.execute(action.insert(), [{'action_id': 'a1', 'action_name': 'start'}])
+        connection.execute(worklog.insert(), [{'worklog_id': x * 2, 'project_id': 'p1', 'action_id': 'a1'}
+                                              for x in range(1, 11)])
+
+    assert gravity.migrate.migrate(config, 'postgresql', 'sqlite', batch_size=4)['worklogs'] == 10
+
+    gravity.database.truncate(config)
+
+    result = gravity.migrate.migrate(config, 'sqlite', 'postgresql-async', batch_size=4)
+
+    assert (result['projects'], result['actions'], result['worklogs'], result['checkpoint']) == (1, 1, 10, 20)
+
+    with engine.begin() as connection:
+        connection.execute(worklog.insert(), [{'project_id': 'p1', 'action_id': 'a1'}])
+
+        assert connection.execute('SELECT max(worklog_id) FROM worklog').scalar() == 21
+
+    config.clear_override(name='database', group='sqlite')
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+import gravity.database
+import gravity.report
+from gravity.model import action, project, worklog
+
+
+@pytest.fixture(scope='function')
+def worklog_database(test_database):
+    """Prepare a test database containing a day's worth of worklog events"""
+    config, engine, metadata = test_database
+
+    gravity.database.initialise(config)
+
+    engine.execute(project.insert(), [
+        {'project_id': 'p1', 'project_name': 'foo'},
+        {'project_id': 'p2', 'project_name': 'bar'}
+    ])
+    engine.execute(action.insert(), [
+        {'action_id': 'a1', 'action_name': 'start'},
+        {'action_id': 'a2', 'action_name': 'stop'}
+    ])
+    engine.execute(worklog.insert(), [
+        {'project_id': 'p1', 'action_id': 'a1', 'ticket_key': '1', 'timestamp': datetime(2020, 6, 1, 9, 0)},
+        {'project_id': 'p2', 'action_id': 'a1', 'ticket_key': None, 'timestamp': datetime(2020, 6, 1, 10, 30)},
+        {'project_id': 'p1', 'action_id': 'a1', 'ticket_key': '2', 'timestamp': datetime(2020, 6, 1, 11, 0)},
+        {'project_id': 'p1', 'action_id': 'a2', 'ticket_key': None, 'timestamp': datetime(2020, 6, 1, 12, 0)},
+        {'project_id': 'p2', 'action_id': 'a1', 'ticket_key': None, 'timestamp': datetime(2020, 6, 2, 9, 0)}
+    ])
+
+    yield config, engine, metadata
+
+
+def test_report_project(worklog_database) -> None:
+    """Check that intervals between consecutive events are attributed to the earlier event's project"""
+    config, _, _ = worklog_database
+
+    report = gravity.report.get_report(['project'], config, end='2020-06-01T23:59:59')
+
+    assert [(x['project_name'], x['seconds'], x['worklogs']) for x in report] == [
+        ('foo', 5400.0 + 3600.0 + 75600.0, 3),
+        ('bar', 1800.0, 1)
+    ]
+
+
+@pytest.mark.parametrize('group_by', [['day'], ['week', 'project'], ['action', 'ticket'], ['day', 'project']])
+def test_report_fallback(worklog_database, group_by) -> None:
+    """Check that the set-based report query and the streaming fallback agree"""
+    config, engine, _ = worklog_database
+
+    names = {'p1': 'foo', 'p2': 'bar', 'a1': 'start', 'a2': 'stop'}
+    events = gravity.report._read_database_worklogs(engine, None)
+
+    report = gravity.report.get_report(group_by, config)
+    fallback = gravity.report._aggregate(events, group_by, names)
+
+    assert len(report) == len(fallback)
+
+    for row, fallback_row in zip(report, fallback):
+        assert row == pytest.approx(fallback_row)
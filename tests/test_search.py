@@ -0,0 +1,109 @@
+import os
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import gravity.database
+import gravity.project
+import gravity.worklog
+from gravity.action import insert_actions
+from gravity.backend.server import request_handler
+from gravity.search import ProjectIndex, fuzzy_score, usage_weights
+
+# Time budget of a single search, in milliseconds
+_budget = float(os.environ.get('GRAVITY_SEARCH_BUDGET', 1))
+
+_projects = [{'project_id': str(x), 'project_name': f'Project {x:04d}', 'project_key': None} for x in range(5000)]
+_projects += [
+    {'project_id': 'g', 'project_name': 'Gravity', 'project_key': 'GRV', 'description': 'Time tracking'},
+    {'project_id': 'd', 'project_name': 'Database migration', 'project_key': 'DB', 'description': None},
+    {'project_id': 'm', 'project_name': 'Metrics', 'project_key': 'MET', 'description': 'Prometheus gravity exporter'}
+]
+
+
+def _names(results):
+    return [x['project_name'] if x.get('ticket_key') is None else f'{x["project_key"]}-{x["ticket_key"]}'
+            for x in results]
+
+
+def test_project_index() -> None:
+    """Check that names rank before keys and descriptions, and that unmatched queries fall back to subsequences"""
+    index = ProjectIndex(_projects)
+
+    assert _names(index.search('gravity')) == ['Gravity', 'Metrics']
+    assert _names(index.search('db')) == ['Database migration']
+    assert _names(index.search('migr data')) == ['Database migration']
+    assert _names(index.search('project 004', limit=3)) == ['Project 0040', 'Project 0041', 'Project 0042']
+    assert len(index.search('project', limit=None)) == 5000
+
+    assert fuzzy_score('gty', 'Gravity') == (6, 0)
+    assert _names(index.search('grvty')) == ['Gravity']
+    assert index.search('xyz') == []
+
+
+def test_usage_weights() -> None:
+    """Check that frequently and recently used projects and tickets rank first"""
+    now = datetime(2020, 6, 15)
+    rows = [
+        {'project_id': 'g', 'ticket_key': 42, 'worklogs': 10, 'last': now - timedelta(days=1)},
+        {'project_id': 'g', 'ticket_key': 7, 'worklogs': 10, 'last': now - timedelta(days=60)},
+        {'project_id': 'm', 'ticket_key': None, 'worklogs': 3, 'last': (now - timedelta(hours=1)).isoformat()}
+    ]
+
+    projects, tickets = usage_weights(rows, now)
+
+    assert projects['g'] > projects['m'] > 0
+    assert [x['ticket_key'] for x in sorted(tickets, key=lambda x: -x['weight'])] == ['42', '7']
+
+    index = ProjectIndex(_projects, {'projects': projects, 'tickets': tickets})
+
+    assert _names(index.search('', limit=3)) == ['Gravity', 'Metrics', 'Database migration']
+    assert _names(index.search('grv')) == ['Gravity', 'GRV-42', 'GRV-7']
+    assert _names(index.search('grv-4')) == ['GRV-42']
+
+    # Usage breaks ties, but does not outrank better matches
+    assert _names(index.search('met')) == ['Metrics']
+    assert _names(ProjectIndex(_projects, {'projects': {'d': 100.0}}).search('gravity')) == ['Gravity', 'Metrics']
+
+
+def test_search_time() -> None:
+    """Check that every keystroke of a query is answered within the time budget, for a catalog of 2000 projects"""
+    words = ['alpha', 'backend', 'billing', 'client', 'data', 'frontend', 'infra', 'mobile', 'platform', 'web']
+    index = ProjectIndex([{'project_id': str(x), 'project_name': f'{words[x % 10]} {words[x // 10 % 10]} {x}'.title(),
+                           'project_key': None} for x in range(2000)])
+    query = 'backend web 12'
+
+    for length in range(1, len(query) + 1):
+        elapsed = []
+
+        # Take the fastest of a few runs, to not fail on a busy machine
+        for _ in range(3):
+            start = perf_counter()
+            index.search(query[:length])
+            elapsed.append((perf_counter() - start) * 1000)
+
+        assert min(elapsed) < _budget, \
+            f'Searching for "{query[:length]}" took {min(elapsed):.2f} ms, exceeding {_budget} ms'
+
+
+def test_search_projects(test_database) -> None:
+    """Check that the server's index searches descriptions, and weighs projects by worklogs"""
+    config, _, _ = test_database
+
+    gravity.database.initialise(config)
+    gravity.project.insert_projects([{k: v for k, v in x.items() if k != 'project_key'} for x in _projects[-3:]],
+                                    config)
+    gravity.project.annotate_project({'project': 'g', 'key': 'GRV'}, config)
+    insert_actions([{'action_id': 'start', 'action_name': 'Start'}], config)
+    gravity.worklog.add_worklogs([{'project_id': 'm', 'action_id': 'start', 'ticket_key': None}] * 3 +
+                                 [{'project_id': 'g', 'action_id': 'start', 'ticket_key': '42'}], config)
+
+    def search(query):
+        return request_handler({'request': 'search_projects', 'payload': {'query': query}}, config)()['projects']
+
+    assert _names(search('')) == ['Metrics', 'Gravity', 'Database migration']
+    assert _names(search('exporter')) == ['Metrics']
+    assert _names(search('grv')) == ['Gravity', 'GRV-42']
+
+    usage = request_handler({'request': 'get_project_usage'}, config)()
+
+    assert set(usage['projects']) == {'g', 'm'} and usage['tickets'][0]['ticket_key'] == '42'
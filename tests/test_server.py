@@ -0,0 +1,409 @@
+import asyncio
+import multiprocessing
+import os.path
+import signal
+import socket
+import time
+
+import pytest
+
+import gravity.database
+from gravity.backend.client import ClientSession, message_writer
+from gravity.backend.metrics import get_metrics
+from gravity.backend.server import RequestDispatcher, _shutdown, start_listener, start_workers
+from gravity.backend.subscription import Subscriptions
+from gravity.catalog import get_catalog
+from gravity.database import dispose_engines
+from gravity.export import export_worklogs
+from gravity.logger import initialise_logging
+
+
+@pytest.fixture(scope='function')
+def server_config(test_database, tmpdir):
+    """Prepare a server listening on a UNIX socket, backed by an initialised test database"""
+    config, _, _ = test_database
+    config.set_override(name='type', override='unix', group='socket')
+    config.set_override(name='socket', override=os.path.join(tmpdir, 'gravity.sock'), group='unix')
+
+    gravity.database.initialise(config)
+
+    yield config
+
+    config.clear_override(name='type', group='socket')
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as _socket:
+        _socket.bind(('127.0.0.1', 0))
+        return _socket.getsockname()[1]
+
+
+def run_with_server(config, client):
+    """Run a client coroutine against an in-process server"""
+    async def run():
+        server = asyncio.ensure_future(start_listener(config))
+
+        while not os.path.exists(config.unix.socket):
+            await asyncio.sleep(0.01)
+
+        try:
+            return await client()
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('framing,encoding', [('line', 'json'), ('length', 'json'), ('length', 'msgpack')])
+def test_session_pipelining(server_config, framing, encoding) -> None:
+    """Check that pipelined requests on a single connection are matched to their responses"""
+    config = server_config
+    config.set_override(name='framing', override=framing, group='socket')
+    config.set_override(name='encoding', override=encoding, group='socket')
+
+    if encoding == 'msgpack':
+        pytest.importorskip('msgpack')
+    projects = [{'project_id': str(x), 'project_name': f'project {x}'} for x in range(3)]
+
+    async def client():
+        session = ClientSession(config)
+
+        await session.request({'request': 'insert_projects', 'payload': {'projects': projects}})
+
+        responses = await asyncio.gather(
+            session.request({'request': 'get_projects'}),
+            session.request({'request': 'invalid'}),
+            session.request({'request': 'get_pool_statistics'}))
+
+        await session.close()
+
+        return responses
+
+    projects_response, error_response, statistics_response = run_with_server(config, client)
+
+    assert len(projects_response['response']['projects']) == 3
+    assert 'error' in error_response['response']
+    assert 'pool' in statistics_response['response']
+
+    config.clear_override(name='framing', group='socket')
+    config.clear_override(name='encoding', group='socket')
+
+
+def test_legacy_request(server_config) -> None:
+    """Check that one-shot requests terminated by EOF are still supported"""
+    config = server_config
+
+    async def client():
+        return await message_writer({'request': 'get_pool_statistics'}, config)
+
+    assert 'pool' in run_with_server(config, client)['response']
+
+
+def test_max_frame_size(server_config) -> None:
+    """Check that frames exceeding the maximum frame size are rejected"""
+    config = server_config
+    config.set_override(name='max_frame_size', override=1024, group='socket')
+
+    projects = [{'project_id': str(x), 'project_name': f'project {x}'} for x in range(100)]
+
+    async def client():
+        session = ClientSession(config)
+
+        with pytest.raises(ConnectionError, match='exceeds maximum frame size'):
+            await session.request({'request': 'insert_projects', 'payload': {'projects': projects}})
+
+        await session.close()
+
+    run_with_server(config, client)
+
+    config.clear_override(name='max_frame_size', group='socket')
+
+
+def test_metrics(server_config) -> None:
+    """Check that request metrics are served both as a request type and via HTTP"""
+    config = server_config
+    config.set_override(name='enabled', override=True, group='metrics')
+    config.set_override(name='port', override=_free_port(), group='metrics')
+
+    get_metrics().reset()
+
+    async def client():
+        session = ClientSession(config)
+
+        projects = [{'project_id': '1', 'project_name': 'foo'}]
+
+        await session.request({'request': 'insert_projects', 'payload': {'projects': projects}})
+        await session.request({'request': 'get_projects'})
+        await session.request({'request': 'invalid'})
+        response = await session.request({'request': 'get_metrics'})
+
+        reader, writer = await asyncio.open_connection(host=config.metrics.host, port=config.metrics.port)
+        writer.write(b'GET /metrics HTTP/1.0\r\n\r\n')
+        http_response = await reader.read()
+        writer.close()
+
+        await session.close()
+
+        return response['response']['metrics'], http_response.decode(encoding='utf-8')
+
+    metrics, http_response = run_with_server(config, client)
+
+    assert 'gravity_requests_total{request="get_projects"} 1' in metrics
+    assert 'gravity_request_errors_total{request="invalid"} 1' in metrics
+    assert 'gravity_request_phase_seconds_count{phase="handler",request="get_projects"} 1' in metrics
+    assert 'gravity_db_statement_seconds_count{statement="insert"} 1' in metrics
+    assert 'gravity_connections_in_flight 1' in metrics
+
+    assert http_response.startswith('HTTP/1.0 200 OK')
+    assert 'gravity_requests_total{request="get_metrics"} 1' in http_response
+
+    config.clear_override(name='enabled', group='metrics')
+    config.clear_override(name='port', group='metrics')
+    get_metrics().reset()
+
+
+def test_export_stream(server_config, tmpdir) -> None:
+    """Check that worklog exports are streamed in chunks, and that abandoned streams leave the session usable"""
+    config = server_config
+
+    projects = [{'project_id': str(x), 'project_name': f'project {x}'} for x in range(2)]
+    actions = [{'action_id': 'start', 'action_name': 'Start'}]
+    worklogs = [{'project_id': str(x % 2), 'action_id': 'start'} for x in range(25)]
+    message = {'request': 'export_worklogs', 'payload': {'projects': ['0'], 'chunk_size': 5}}
+
+    async def client():
+        session = ClientSession(config)
+
+        await session.request({'request': 'insert_projects', 'payload': {'projects': projects}})
+        await session.request({'request': 'insert_actions', 'payload': {'actions': actions}})
+        await session.request({'request': 'add_worklogs', 'payload': {'worklogs': worklogs}})
+
+        responses = [x async for x in session.stream(message)]
+
+        async for _ in session.stream(message):
+            break
+
+        statistics = await session.request({'request': 'get_pool_statistics'})
+        await session.close()
+
+        return responses, statistics
+
+    responses, statistics = run_with_server(config, client)
+    chunks = [x['response']['worklogs'] for x in responses if x.get('more')]
+
+    assert [len(x) for x in chunks] == [5, 5, 3]
+    assert responses[-1] == {'response': {}}
+    assert all(x['project_id'] == '0' for chunk in chunks for x in chunk)
+    assert 'pool' in statistics['response']
+
+    output = os.path.join(tmpdir, 'worklogs.csv')
+
+    assert export_worklogs(responses, 'csv', output) == 13
+
+    with open(output, mode='r', encoding='utf-8') as infile:
+        assert len(infile.readlines()) == 14
+
+
+class _Connection(object):
+    """Stands in for a WebSocket connection, recording whether the server has closed it"""
+
+    def __init__(self):
+        self.code = None
+
+    async def close(self, code=1000, reason=''):
+        self.code = code
+
+
+def test_subscriptions(server_config) -> None:
+    """Check that subscribers receive catalog changes and worklogs, and that slow subscribers are disconnected"""
+    config = server_config
+    config.set_override(name='subscriber_queue_size', override=3, group='server')
+
+    async def run():
+        dispatcher = RequestDispatcher(config)
+        await dispatcher.start()
+
+        fast, slow = _Connection(), _Connection()
+        events = dispatcher.stream({'request': 'subscribe'}, fast)
+        lagging = dispatcher.stream({'request': 'subscribe', 'payload': {'topics': ['catalog']}}, slow)
+
+        try:
+            subscribed = [await events.__anext__(), await lagging.__anext__()]
+
+            requests = [
+                ('insert_projects', {'projects': [{'project_id': str(x), 'project_name': str(x)} for x in range(4)]}),
+                ('insert_actions', {'actions': [{'action_id': 'start', 'action_name': 'Start'}]}),
+                ('remove_projects', {'projects': ['3']}),
+                ('add_worklog', {'worklog': {'project_id': '0', 'action_id': 'start'}}),
+                ('annotate_project', {'annotation': {'project': '0', 'key': 'FOO'}})
+            ]
+            received = []
+
+            for request, payload in requests:
+                await dispatcher.dispatch({'request': request, 'payload': payload})
+                received.append(await events.__anext__())
+
+            await asyncio.sleep(0)
+
+            dispatcher.subscriptions.disconnect(fast)
+            remaining = [x async for x in events]
+
+            return subscribed, received, remaining, slow.code, len(dispatcher.subscriptions.subscribers)
+
+        finally:
+            await lagging.aclose()
+            await dispatcher.stop()
+
+    subscribed, received, remaining, code, subscribers = asyncio.run(run())
+
+    assert subscribed[0]['topics'] == ['catalog', 'worklogs'] and subscribed[1]['topics'] == ['catalog']
+    assert [x['event'] for x in received] == [
+        'projects_added', 'actions_added', 'projects_removed', 'worklogs_added', 'project_annotated']
+    assert received[0]['version'] != received[2]['version']
+    assert received[3]['worklogs'][0]['project_id'] == '0' and 'timestamp' in received[3]['worklogs'][0]
+    assert received[4]['project'] == {'project_id': '0', 'project_key': 'FOO'}
+    assert remaining == []
+
+    # The catalog-only subscriber never read its events, so it got disconnected upon the fourth one
+    assert code == 1013
+    assert subscribers == 0
+
+    config.clear_override(name='subscriber_queue_size', group='server')
+
+
+def test_subscription_dropped() -> None:
+    """Check that the stream of a subscriber dropped for falling behind ends after its queued events"""
+    async def run():
+        subscriptions, connection = Subscriptions(1), _Connection()
+        events = subscriptions.listen(connection, ['catalog'])
+
+        subscribed = await events.__anext__()
+
+        for _ in range(2):
+            subscriptions.publish_catalog_changed()
+
+        async def collect():
+            return [x async for x in events]
+
+        remaining = await asyncio.wait_for(collect(), timeout=5)
+        await asyncio.sleep(0)
+
+        return subscribed, remaining, connection.code, len(subscriptions.subscribers)
+
+    subscribed, remaining, code, subscribers = asyncio.run(run())
+
+    assert subscribed['event'] == 'subscribed'
+    assert [x['event'] for x in remaining] == ['catalog_changed']
+    assert code == 1013 and subscribers == 0
+
+
+def _other_worker(config, generation, ready) -> None:
+    """Change the catalog via a dispatcher in another process sharing the catalog version"""
+    get_catalog().share(generation)
+    ready.wait(timeout=10)
+
+    async def run():
+        dispatcher = RequestDispatcher(config)
+        await dispatcher.start()
+
+        try:
+            projects = [{'project_id': 'foo', 'project_name': 'Foo'}]
+            await dispatcher.dispatch({'request': 'insert_projects', 'payload': {'projects': projects}})
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(run())
+
+
+def test_subscriptions_workers(server_config) -> None:
+    """Check that idle subscribers hear of catalog changes made by another worker sharing the catalog version"""
+    config = server_config
+    context = multiprocessing.get_context('fork')
+    generation, ready = context.Value('Q', 0), context.Event()
+
+    # Neither process may reuse the other's pooled database connections
+    dispose_engines()
+    get_catalog().share(generation)
+
+    worker = context.Process(target=_other_worker, args=(config, generation, ready))
+    worker.start()
+
+    async def run():
+        dispatcher = RequestDispatcher(config)
+        await dispatcher.start()
+
+        events = dispatcher.stream({'request': 'subscribe', 'payload': {'topics': ['catalog']}}, _Connection())
+
+        try:
+            await events.__anext__()
+            ready.set()
+
+            return await asyncio.wait_for(events.__anext__(), timeout=10)
+        finally:
+            await events.aclose()
+            await dispatcher.stop()
+
+    try:
+        event = asyncio.run(run())
+    finally:
+        get_catalog().share(None)
+        worker.join(timeout=10)
+
+    assert worker.exitcode == 0
+    assert event['event'] == 'catalog_changed'
+
+
+def test_subscribe_requires_websockets(server_config) -> None:
+    """Check that subscriptions are rejected on transports other than WebSocket"""
+    async def client():
+        session = ClientSession(server_config)
+        responses = [x async for x in session.stream({'request': 'subscribe'})]
+        await session.close()
+
+        return responses
+
+    responses = run_with_server(server_config, client)
+
+    assert responses == [{'response': {'error': 'Subscriptions are only supported via websockets'}}]
+
+
+def _supervise(config, workers: int) -> None:
+    signal.signal(signal.SIGTERM, _shutdown)
+    initialise_logging(config)
+    start_workers(config, workers)
+
+
+def test_workers_queue_logging(server_config, tmpdir) -> None:
+    """Check that forked server workers keep logging via the log queue"""
+    config = server_config
+    config.set_override(name='file', override=os.path.join(tmpdir, 'gravity.log'), group='log')
+    config.set_override(name='targets', override=['file'], group='log')
+    config.set_override(name='queue', override=True, group='log')
+
+    supervisor = multiprocessing.get_context('fork').Process(target=_supervise, args=(config, 2))
+    supervisor.start()
+
+    def read_log():
+        if not os.path.exists(config.log.file):
+            return []
+
+        with open(config.log.file, mode='r', encoding='utf-8') as infile:
+            return infile.read().splitlines()
+
+    try:
+        deadline = time.monotonic() + 10
+
+        while len([x for x in read_log() if 'Server started' in x]) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        supervisor.terminate()
+        supervisor.join(timeout=10)
+
+    lines = read_log()
+
+    assert any('Supervising 2 server workers' in x for x in lines)
+    assert len([x for x in lines if 'Server started' in x]) == 2
+
+    for name in ['file', 'targets', 'queue']:
+        config.clear_override(name=name, group='log')
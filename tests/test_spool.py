@@ -0,0 +1,196 @@
+import asyncio
+import os.path
+import sqlite3
+import threading
+
+import pytest
+
+from gravity.backend.executor import RequestExecutor
+from gravity.backend.spool import WorklogSpool
+
+
+@pytest.fixture(scope='function')
+def spool_config(prepared_config, tmpdir):
+    """Prepare a spool in a temporary directory, retrying failed writes quickly"""
+    config = prepared_config
+    overrides = [
+        ('spool', 'path', os.path.join(tmpdir, 'spool.sqlite')),
+        ('spool', 'retry_interval', 0.01),
+        ('spool', 'retry_max', 0.05)
+    ]
+
+    for group, name, value in overrides:
+        config.set_override(name=name, override=value, group=group)
+
+    yield config
+
+    for group, name, _ in overrides:
+        config.clear_override(name=name, group=group)
+
+
+class FlakyWriter(object):
+    """Collect written worklogs, failing while the backend is down, and always for project 'invalid'"""
+
+    def __init__(self, down: bool = False) -> None:
+        self.down = down
+        self.rows = []
+
+    async def __call__(self, rows) -> None:
+        if self.down:
+            raise ConnectionError('Backend is unreachable')
+
+        if any(x['project_id'] == 'invalid' for x in rows):
+            raise ValueError('Invalid project')
+
+        self.rows.extend(rows)
+
+
+async def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'Condition has not been met in time'
+        await asyncio.sleep(0.01)
+
+
+def test_spool_outage(spool_config) -> None:
+    """Check that submissions are acknowledged during an outage, and written once the backend recovers"""
+    writer = FlakyWriter(down=True)
+    spool = WorklogSpool(spool_config, writer)
+
+    async def run():
+        await spool.start()
+
+        await asyncio.gather(*[spool.submit([{'project_id': 'p1', 'action_id': 'a1'}]) for _ in range(5)])
+        await asyncio.sleep(0.1)
+
+        depth, lag = spool.depth, spool.lag
+        writer.down = False
+
+        await _wait_for(lambda: spool.depth == 0)
+        await spool.stop()
+
+        return depth, lag
+
+    depth, lag = asyncio.run(run())
+
+    assert depth == 5 and lag > 0
+    assert len(writer.rows) == 5
+    assert spool.lag == 0
+
+
+def test_spool_restart(spool_config) -> None:
+    """Check that spooled submissions survive a restart, and that invalid ones are set aside"""
+    async def run(writer, submissions):
+        spool = WorklogSpool(spool_config, writer)
+        await spool.start()
+
+        for project in submissions:
+            await spool.submit([{'project_id': project, 'action_id': 'a1'}])
+
+        if not writer.down:
+            await _wait_for(lambda: spool.depth == 0)
+
+        await spool.stop()
+
+        return spool.depth
+
+    assert asyncio.run(run(FlakyWriter(down=True), ['p1', 'invalid', 'p2'])) == 3
+
+    writer = FlakyWriter()
+
+    assert asyncio.run(run(writer, [])) == 0
+    assert [x['project_id'] for x in writer.rows] == ['p1', 'p2']
+
+    with sqlite3.connect(spool_config.spool.path) as connection:
+        assert connection.execute('SELECT error FROM rejected').fetchall() == [('Invalid project',)]
+
+
+def test_spool_partial_outage(spool_config) -> None:
+    """Check that submissions failing with a transient error are retried, even if others have been written"""
+    class DroppingWriter(FlakyWriter):
+        """Goes down after every write, as a backend dropping halfway through a batch would"""
+
+        async def __call__(self, rows) -> None:
+            self.down, down = True, self.down
+            await asyncio.sleep(0)
+
+            if down:
+                raise ConnectionError('Backend is unreachable')
+
+            self.rows.extend(rows)
+
+        def recover(self) -> None:
+            self.down = False
+
+    writer = DroppingWriter()
+    spool = WorklogSpool(spool_config, writer)
+
+    async def run():
+        await spool.start()
+
+        for project in ['p1', 'p2', 'p3']:
+            await spool.submit([{'project_id': project, 'action_id': 'a1'}])
+
+        # Let the backend come back after every failed attempt
+        while spool.depth > 0:
+            await asyncio.sleep(0.01)
+            writer.recover()
+
+        await spool.stop()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+    assert sorted(x['project_id'] for x in writer.rows) == ['p1', 'p2', 'p3']
+
+    with sqlite3.connect(spool_config.spool.path) as connection:
+        assert connection.execute('SELECT count(*) FROM rejected').fetchone() == (0,)
+
+
+def test_spool_backpressure(spool_config) -> None:
+    """Check that submissions rejected by a full request queue stay spooled, and are written once it has room"""
+    config = spool_config
+    config.set_override(name='threads', override=1, group='server')
+    config.set_override(name='queue_size', override=0, group='server')
+
+    executor = RequestExecutor(config)
+    event = threading.Event()
+    rows = []
+
+    async def writer(_rows) -> None:
+        await executor.run(lambda: rows.extend(_rows), write=True)
+
+    spool = WorklogSpool(config, writer)
+
+    async def run():
+        await spool.start()
+
+        # Keep the executor's only slot busy, so that the spool's writes are turned away
+        blocked = asyncio.ensure_future(executor.run(event.wait))
+        await asyncio.sleep(0)
+
+        for project in ['p1', 'p2', 'p3']:
+            await spool.submit([{'project_id': project, 'action_id': 'a1'}])
+
+        await asyncio.sleep(0.1)
+        depth = spool.depth
+
+        event.set()
+        await blocked
+
+        await _wait_for(lambda: spool.depth == 0)
+        await spool.stop()
+
+        return depth
+
+    depth = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    executor.shutdown()
+
+    for name in ['threads', 'queue_size']:
+        config.clear_override(name=name, group='server')
+
+    assert depth == 3
+    assert sorted(x['project_id'] for x in rows) == ['p1', 'p2', 'p3']
+
+    with sqlite3.connect(config.spool.path) as connection:
+        assert connection.execute('SELECT count(*) FROM rejected').fetchone() == (0,)
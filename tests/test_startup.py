@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+
+# Modules imported by client commands, e.g. `gravity worklog --amend`
+_client_modules = ['gravity.app', 'gravity.backend.client', 'gravity.cli']
+
+# Client subcommands, each of which imports its own dependencies on demand
+_client_commands = [
+    ['project', '--list'], ['project', '--export'], ['project', '--add', 'foo'], ['project', '--remove', 'foo'],
+    ['action', '--list'], ['action', '--add', 'foo'], ['worklog', '--amend', '5m'], ['worklog', '--remove'],
+    ['worklog', '--export'], ['annotate', 'foo', '--key', 'FOO'], ['report']
+]
+
+# Modules which client commands must not import
+_server_modules = ['sqlalchemy', 'websockets', 'daemon', 'curses', 'gravity.database', 'gravity.backend.server']
+
+# Cumulative import time budget of the client path, in milliseconds
+_budget = int(os.environ.get('GRAVITY_STARTUP_BUDGET', 250))
+
+
+def _import_times(modules, arguments=None) -> Dict[str, int]:
+    """Import modules, or run a module with arguments, in a fresh interpreter, returning the cumulative import time
+    of every module imported, in microseconds
+    """
+    _arguments = ['-c', f'import {", ".join(modules)}'] if arguments is None else ['-m', *modules, *arguments]
+    result = subprocess.run([sys.executable, '-X', 'importtime', *_arguments], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=arguments is None, timeout=60)
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            _, cumulative, name = line[len('import time:'):].split('|')
+            times[name.strip()] = int(cumulative) if cumulative.strip().isdigit() else None
+
+    return times
+
+
+def test_client_imports() -> None:
+    """Check that client commands do not import server, storage or frontend dependencies"""
+    times = _import_times(_client_modules)
+
+    for module in _server_modules:
+        assert module not in times, f'{module} is imported by client commands'
+
+
+def test_client_command_imports(tmpdir) -> None:
+    """Check that no client subcommand imports server or storage dependencies, up to sending its request"""
+    config = os.path.join(tmpdir, 'client.conf')
+
+    # Requests fail right away, as there is no server listening on the socket
+    with open(config, mode='w', encoding='utf-8') as outfile:
+        outfile.write(f'[log]\ntargets = [console]\n[frontend]\ncache = false\n'
+                      f'[socket]\ntype = unix\n[unix]\nsocket = {os.path.join(tmpdir, "gravity.sock")}\n')
+
+    for command in _client_commands:
+        times = _import_times(['gravity.app'], ['--config-file', config, *command])
+
+        assert 'gravity.backend.client' in times and 'gravity.cli' in times, f'{command} did not run'
+
+        for module in _server_modules:
+            assert module not in times, f'{module} is imported by `gravity {" ".join(command)}`'
+
+
+def test_client_import_time() -> None:
+    """Check that the modules of client commands import within the time budget"""
+    # Modules shared by several client modules are only counted once, by whichever imports them first
+    times = _import_times(_client_modules)
+    total = sum(times.get(x) or 0 for x in _client_modules) / 1000
+
+    assert total < _budget, f'Client commands take {total:.1f} ms to import, exceeding {_budget} ms'
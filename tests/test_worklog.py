@@ -0,0 +1,68 @@
+import csv
+import os.path
+from datetime import datetime
+
+import pytest
+
+import gravity.database
+from gravity.model import action, project, worklog
+from gravity.worklog import ingest_worklogs
+
+
+def _write_worklogs(filename, rows, delimiter=';') -> None:
+    with open(filename, mode='w', encoding='utf-8', newline='') as outfile:
+        writer = csv.writer(outfile, delimiter=delimiter, quoting=csv.QUOTE_ALL)
+        writer.writerow(['worklog_id', 'project_id', 'action_id', 'ticket_key', 'timestamp'])
+        writer.writerows(rows)
+
+
+@pytest.fixture(scope='function')
+def ingest_database(test_database):
+    """Prepare a test database containing projects and actions, but no worklogs"""
+    config, engine, _ = test_database
+
+    gravity.database.initialise(config)
+
+    engine.execute(project.insert(), [{'project_id': 'p1', 'project_name': 'foo'}])
+    engine.execute(action.insert(), [{'action_id': 'a1', 'action_name': 'start'}])
+
+    yield config, engine
+
+
+def test_ingest_worklogs(ingest_database, tmpdir) -> None:
+    """Check that valid worklogs are imported with their timestamps, while invalid rows are rejected"""
+    config, engine = ingest_database
+    filename = os.path.join(tmpdir, 'worklogs.csv')
+
+    _write_worklogs(filename, [
+        [1, 'p1', 'a1', 'T-1', '2020-06-01T09:00:00'],
+        [2, 'p2', 'a1', '', '2020-06-01T10:00:00'],
+        [3, 'p1', 'a2', '', '2020-06-01T11:00:00'],
+        [4, 'p1', 'a1', '', 'yesterday'],
+        [5, 'p1', 'a1', '', '2020-06-01T12:00:00'],
+    ])
+
+    result = ingest_worklogs(filename, config, chunk_size=2)
+
+    assert result['worklogs'] == 2
+    assert result['rejected'] == 3
+    assert [x for x, _ in result['rejected_lines']] == [3, 4, 5]
+
+    rows = engine.execute(worklog.select().order_by(worklog.c.timestamp)).fetchall()
+
+    assert [(x['ticket_key'], x['timestamp']) for x in rows] == [
+        ('T-1', datetime(2020, 6, 1, 9, 0)),
+        (None, datetime(2020, 6, 1, 12, 0))
+    ]
+
+
+def test_ingest_worklogs_columns(ingest_database, tmpdir) -> None:
+    """Check that files lacking required columns are rejected as a whole"""
+    config, _ = ingest_database
+    filename = os.path.join(tmpdir, 'worklogs.csv')
+
+    with open(filename, mode='w', encoding='utf-8') as outfile:
+        outfile.write('project_id,ticket_key\np1,T-1\n')
+
+    with pytest.raises(AssertionError, match='action_id, timestamp'):
+        ingest_worklogs(filename, config)
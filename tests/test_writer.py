@@ -0,0 +1,108 @@
+import csv
+import os.path
+from datetime import datetime
+
+import pytest
+
+from gravity.backend.writer import close_writers, csv_writer, journal_files, log_writer
+from gravity.worklog import read_journal_worklogs
+
+
+@pytest.fixture(scope='function')
+def csv_config(prepared_config, tmpdir):
+    """Prepare a CSV storage backend in a temporary directory"""
+    config = prepared_config
+    config.set_override(name='driver', override='csv', group='backend')
+    config.set_override(name='output', override=os.path.join(tmpdir, 'test_storage.csv'), group='csv')
+
+    yield config
+
+    close_writers()
+
+
+@pytest.fixture(scope='function')
+def journal_config(prepared_config, tmpdir):
+    """Prepare a log (journal) storage backend in a temporary directory, rotating after a few records"""
+    config = prepared_config
+    overrides = [
+        ('backend', 'driver', 'log'),
+        ('journal', 'output', os.path.join(tmpdir, 'test_journal.jsonl')),
+        ('journal', 'fsync', 'write'),
+        ('journal', 'max_size', 512)
+    ]
+
+    for group, name, value in overrides:
+        config.set_override(name=name, override=value, group=group)
+
+    yield config
+
+    close_writers()
+
+    for group, name, _ in overrides:
+        config.clear_override(name=name, group=group)
+
+
+def _read_ids(config) -> list:
+    with open(config.csv.output, mode='r', encoding='utf-8', newline='') as infile:
+        return [int(x['worklog_id']) for x in csv.DictReader(infile, delimiter=config.csv.delimiter)]
+
+
+@pytest.mark.parametrize('quoting', ['all', 'minimal', 'nonnumeric'])
+def test_csv_writer_sequence(csv_config, quoting) -> None:
+    """Check that worklog_ids remain sequential across writers, including after reopening the output file"""
+    config = csv_config
+    config.set_override(name='quoting', override=quoting, group='csv')
+
+    rows = [{'project_id': 'p1', 'action_id': 'a1', 'ticket_key': None, 'timestamp': datetime.now()}] * 3
+
+    csv_writer(rows[:2], config)
+    csv_writer(rows[2:], config)
+
+    close_writers()
+
+    csv_writer(rows, config)
+
+    assert _read_ids(config) == [1, 2, 3, 4, 5, 6]
+
+    config.clear_override(name='quoting', group='csv')
+
+
+def test_csv_writer_header(csv_config) -> None:
+    """Check that the header is only written once, and that an output file containing only a header starts at 1"""
+    config = csv_config
+
+    csv_writer([], config)
+    close_writers()
+
+    csv_writer([{'project_id': 'p1', 'action_id': 'a1', 'timestamp': datetime.now()}], config)
+    close_writers()
+
+    with open(config.csv.output, mode='r', encoding='utf-8') as infile:
+        assert sum(1 for line in infile if 'worklog_id' in line) == 1
+
+    assert _read_ids(config) == [1]
+
+
+def test_journal_writer_rotation(journal_config) -> None:
+    """Check that journals rotate by size, and that worklog_ids continue across files and partial records"""
+    config = journal_config
+    rows = [{'project_id': 'p1', 'action_id': 'a1', 'ticket_key': None, 'timestamp': datetime.now()}] * 3
+
+    for _ in range(5):
+        log_writer(rows, config)
+
+    close_writers()
+
+    assert len(journal_files(config.journal.output)) > 1
+
+    # A record cut short by a crash is skipped, both when reading and when recovering the last worklog_id
+    with open(config.journal.output, mode='a', encoding='utf-8') as outfile:
+        outfile.write('{"worklog_id": 16, "project_')
+
+    log_writer(rows, config)
+    close_writers()
+
+    records = list(read_journal_worklogs(config))
+
+    assert [x['worklog_id'] for x in records] == list(range(1, 19))
+    assert all(isinstance(x['timestamp'], datetime) for x in records)